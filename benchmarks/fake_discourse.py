@@ -0,0 +1,400 @@
+"""A local, in-memory fake of the parts of the Discourse API used by this client.
+
+The fake can be used in two ways: through FakeDiscourseTransport, which plugs straight into
+DiscourseAPIClient and simulates network latency with ndb.sleep (so concurrent tasklets overlap
+the way they would against a real server), or through wsgiApp, which serves the same endpoints
+over HTTP for use with transport.PooledHTTPTransport.
+"""
+
+import gzip
+import hashlib
+import json
+import re
+import StringIO
+import time
+import urlparse
+
+from google.appengine.ext import ndb
+
+from gae_discourse_client import transport
+
+
+class FakeDiscourse(object):
+    """The state of a fake Discourse site, and the handlers for its endpoints.
+
+    Args:
+      num_users: The number of active users to create.
+      num_groups: The number of groups to create.
+      members_per_group: The number of users to put in each group.
+      num_categories: The number of top-level categories to create.
+      subcategories_per_category: The number of subcategories to create under each category.
+      num_topics: The number of topics to create, spread over the categories.
+      latency: The number of seconds each request takes.
+    """
+
+    TOPICS_PER_PAGE = 30
+    USERS_PER_PAGE = 100
+
+    def __init__(self, num_users=1000, num_groups=20, members_per_group=100, num_categories=10,
+                 subcategories_per_category=5, num_topics=300, latency=0.05):
+        self.latency = latency
+        self.requests = []
+        self._next_id = 1
+
+        # The oldest users were seen most recently, so that listings ordered by last_seen_at (as
+        # Discourse orders active users by default) differ from those ordered by creation.
+        self.users = {}
+        for i in xrange(num_users):
+            self._addUser('user%d' % i, 'user%d@example.com' % i, 'User %d' % i,
+                          last_seen_at='2015-06-%02dT%02d:%02d:%02d.000Z' % (
+                              28 - i / 86400, 23 - i / 3600 % 24, 59 - i / 60 % 60, 59 - i % 60))
+
+        usernames = sorted(self.users)
+        self.groups = {}
+        self.members = {}
+        for i in xrange(num_groups):
+            group = self._addGroup('group%d' % i)
+            for username in usernames[:members_per_group]:
+                self.members[group['id']].add(username)
+
+        self.categories = {}
+        for i in xrange(num_categories):
+            category = self._addCategory('Category %d' % i, None)
+            for j in xrange(subcategories_per_category):
+                self._addCategory('Category %d-%d' % (i, j), category['id'])
+
+        self.topics = []
+        category_ids = sorted(self.categories)
+        for i in xrange(num_topics):
+            self.topics.append({
+                'id': self._newId(),
+                'title': 'Topic %d' % i,
+                'slug': 'topic-%d' % i,
+                'category_id': category_ids[i % len(category_ids)] if category_ids else None,
+                'bumped_at': '2015-06-01T%02d:%02d:%02d.000Z' % (i / 3600 % 24, i / 60 % 60, i % 60),
+                'pinned': False
+            })
+        self.topics.reverse()
+
+        self._routes = [
+            ('GET', r'^admin/groups\.json$', self._listGroups),
+            ('POST', r'^admin/groups$', self._createGroup),
+            ('DELETE', r'^admin/groups/(\d+)$', self._deleteGroup),
+            ('PUT', r'^admin/groups/(\d+)/members\.json$', self._addMembers),
+            ('DELETE', r'^admin/groups/(\d+)/members\.json$', self._removeMember),
+            ('GET', r'^groups/([^/]+)/members\.json$', self._listMembers),
+            ('GET', r'^admin/users/list/active\.json$', self._listActiveUsers),
+            ('GET', r'^admin/users/([^/]+)\.json$', self._getUser),
+            ('DELETE', r'^admin/users/(\d+)\.json$', self._deleteUser),
+            ('POST', r'^users/?$', self._createUser),
+            ('GET', r'^site\.json$', self._site),
+            ('GET', r'^categories\.json$', self._listCategories),
+            ('POST', r'^categories$', self._createCategory),
+            ('DELETE', r'^categories/([^/]+)$', self._deleteCategory),
+            ('GET', r'^latest\.json$', self._latestTopics),
+            ('GET', r'^c/(\d+)\.json$', self._categoryTopics),
+            ('GET', r'^c/\d+/(\d+)\.json$', self._categoryTopics),
+            ('GET', r'^t/(\d+)\.json$', self._getTopic),
+            ('GET', r'^t/(\d+)/last\.json$', self._getTopic),
+        ]
+        self._routes = [(method, re.compile(pattern), handler)
+                        for method, pattern, handler in self._routes]
+
+    def handle(self, method, path, params):
+        """Handles a request.
+
+        Args:
+          method: The HTTP method.
+          path: The request path, without the leading slash or query string.
+          params: A dictionary of the query string and form parameters.
+
+        Returns:
+          A (status_code, body) tuple, where body is JSON-serializable.
+        """
+        self.requests.append((method, path))
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                return handler(params, *match.groups())
+
+        return 404, {'errors': ['Not found']}
+
+    def respond(self, method, url, payload, headers):
+        """Handles a request given as a URL and a form-encoded payload.
+
+        Returns:
+          A transport.Response. Bodies are gzip-compressed when the request accepts it, and
+          carry an ETag that is honoured through If-None-Match.
+        """
+        parts = urlparse.urlsplit(url)
+        params = dict(urlparse.parse_qsl(parts.query))
+        params.update(urlparse.parse_qsl(payload or ''))
+
+        status_code, body = self.handle(method, parts.path.lstrip('/'), params)
+        content = json.dumps(body)
+        etag = 'W/"%s"' % hashlib.md5(content).hexdigest()
+        response_headers = {'Content-Type': 'application/json', 'ETag': etag}
+
+        if method == 'GET' and status_code == 200 and headers.get('If-None-Match') == etag:
+            return transport.Response(304, '', response_headers)
+
+        if 'gzip' in headers.get('Accept-Encoding', ''):
+            compressed = StringIO.StringIO()
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+                f.write(content)
+            content = compressed.getvalue()
+            response_headers['Content-Encoding'] = 'gzip'
+
+        return transport.Response(status_code, content, response_headers)
+
+    # GROUPS
+
+    def _listGroups(self, params):
+        return 200, [dict(group, user_count=len(self.members[group['id']]))
+                     for group in self.groups.itervalues()]
+
+    def _createGroup(self, params):
+        if any(group['name'] == params.get('name') for group in self.groups.itervalues()):
+            return 422, {'errors': ['Name has already been taken']}
+        return 200, {'basic_group': self._addGroup(params['name'])}
+
+    def _deleteGroup(self, params, group_id):
+        if self.groups.pop(int(group_id), None) is None:
+            return 404, {'errors': ['Not found']}
+        del self.members[int(group_id)]
+        return 200, {'success': 'OK'}
+
+    def _addMembers(self, params, group_id):
+        members = self.members.get(int(group_id))
+        if members is None:
+            return 404, {'errors': ['Not found']}
+
+        usernames = [username for username in params.get('usernames', '').split(',') if username]
+        missing = [username for username in usernames if username not in self.users]
+        if missing:
+            return 422, {'errors': ['Could not find %s' % ', '.join(missing)]}
+
+        members.update(usernames)
+        return 200, {'success': 'OK', 'usernames': usernames}
+
+    def _removeMember(self, params, group_id):
+        members = self.members.get(int(group_id))
+        if members is None:
+            return 404, {'errors': ['Not found']}
+
+        for username, user in self.users.iteritems():
+            if str(user['id']) == params.get('user_id'):
+                members.discard(username)
+                return 200, {'success': 'OK'}
+        return 404, {'errors': ['Not found']}
+
+    def _listMembers(self, params, group_name):
+        for group in self.groups.itervalues():
+            if group['name'] == group_name:
+                break
+        else:
+            return 404, {'errors': ['Not found']}
+
+        limit = int(params.get('limit', 50))
+        offset = int(params.get('offset', 0))
+        usernames = sorted(self.members[group['id']])
+        members = [self._publicUser(self.users[username])
+                   for username in usernames[offset:offset + limit]]
+        return 200, {
+            'members': members,
+            'meta': {'total': len(usernames), 'limit': limit, 'offset': offset}
+        }
+
+    # USERS
+
+    def _listActiveUsers(self, params):
+        if params.get('order') == 'created':
+            users = sorted(self.users.itervalues(), key=lambda user: user['id'],
+                           reverse=params.get('asc') != 'true')
+        else:
+            # Users who were never seen come last.
+            users = sorted(self.users.itervalues(), reverse=True, key=lambda user: (
+                user['last_seen_at'] is not None, user['last_seen_at'], user['id']))
+
+        term = params.get('filter', '').lower()
+        if term:
+            users = [user for user in users
+                     if term in user['email'].lower() or term in user['username'].lower()]
+
+        page = int(params.get('page', 1))
+        users = users[(page - 1) * self.USERS_PER_PAGE:page * self.USERS_PER_PAGE]
+
+        show_emails = params.get('show_emails') == 'true'
+        return 200, [self._publicUser(user, show_emails) for user in users]
+
+    def _getUser(self, params, username):
+        # Users can be looked up by id as well as by username.
+        for user in self.users.itervalues():
+            if str(user['id']) == username:
+                username = user['username']
+        user = self.users.get(username)
+        if user is None:
+            return 404, {'errors': ['Not found']}
+
+        public = self._publicUser(user, show_emails=True)
+        public['groups'] = [{'id': group_id, 'name': self.groups[group_id]['name']}
+                            for group_id, members in sorted(self.members.iteritems())
+                            if username in members]
+        return 200, public
+
+    def _createUser(self, params):
+        if params.get('username') in self.users or any(
+                user['email'].lower() == params.get('email', '').lower()
+                for user in self.users.itervalues()):
+            return 200, {'success': False, 'message': 'Username or email already taken'}
+
+        user = self._addUser(params['username'], params['email'], params.get('name'))
+        return 200, {'success': True, 'active': True, 'user_id': user['id']}
+
+    def _deleteUser(self, params, user_id):
+        for username, user in self.users.items():
+            if user['id'] == int(user_id):
+                del self.users[username]
+                for members in self.members.itervalues():
+                    members.discard(username)
+                return 200, {'deleted': True}
+        return 404, {'errors': ['Not found']}
+
+    # CATEGORIES
+
+    def _site(self, params):
+        return 200, {'categories': self.categories.values()}
+
+    def _listCategories(self, params):
+        parent_category_id = params.get('parent_category_id')
+        if parent_category_id is not None:
+            parent_category_id = int(parent_category_id)
+
+        categories = [category for category in self.categories.itervalues()
+                      if category.get('parent_category_id') == parent_category_id]
+        return 200, {'category_list': {'categories': categories}}
+
+    def _createCategory(self, params):
+        parent_category_id = params.get('parent_category_id')
+        if parent_category_id is not None:
+            parent_category_id = int(parent_category_id)
+            if parent_category_id not in self.categories:
+                return 422, {'errors': ['Parent category does not exist']}
+
+        if any(category['name'] == params.get('name') and
+               category.get('parent_category_id') == parent_category_id
+               for category in self.categories.itervalues()):
+            return 422, {'errors': ['Category Name has already been taken']}
+
+        return 200, {'category': self._addCategory(params['name'], parent_category_id)}
+
+    def _deleteCategory(self, params, slug):
+        for category_id, category in self.categories.items():
+            if category['slug'] == slug:
+                del self.categories[category_id]
+                return 200, {'success': 'OK'}
+        return 404, {'errors': ['Not found']}
+
+    # TOPICS
+
+    def _latestTopics(self, params):
+        return self._topicList(self.topics, params, 'latest')
+
+    def _categoryTopics(self, params, category_id):
+        topics = [topic for topic in self.topics if topic['category_id'] == int(category_id)]
+        return self._topicList(topics, params, 'c/%s' % category_id)
+
+    def _getTopic(self, params, topic_id):
+        for topic in self.topics:
+            if topic['id'] == int(topic_id):
+                return 200, dict(topic, post_stream={'posts': []})
+        return 404, {'errors': ['Not found']}
+
+    def _topicList(self, topics, params, path):
+        page = int(params.get('page', 0))
+        start = page * self.TOPICS_PER_PAGE
+        topic_list = {'topics': topics[start:start + self.TOPICS_PER_PAGE]}
+        if start + self.TOPICS_PER_PAGE < len(topics):
+            topic_list['more_topics_url'] = '/%s?page=%d' % (path, page + 1)
+        return 200, {'users': [], 'topic_list': topic_list}
+
+    # HELPERS
+
+    def _newId(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _addUser(self, username, email, name, last_seen_at=None):
+        user = {'id': self._newId(), 'username': username, 'email': email, 'name': name,
+                'active': True, 'last_seen_at': last_seen_at}
+        self.users[username] = user
+        return user
+
+    def _addGroup(self, name):
+        group = {'id': self._newId(), 'name': name, 'automatic': False}
+        self.groups[group['id']] = group
+        self.members[group['id']] = set()
+        return group
+
+    def _addCategory(self, name, parent_category_id):
+        category = {
+            'id': self._newId(),
+            'name': name,
+            'slug': re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-'),
+            'color': 'FFFFFF',
+            'text_color': '000000'
+        }
+        if parent_category_id is not None:
+            category['parent_category_id'] = parent_category_id
+        self.categories[category['id']] = category
+        return category
+
+    def _publicUser(self, user, show_emails=False):
+        public = {'id': user['id'], 'username': user['username'], 'name': user['name'],
+                  'last_seen_at': user['last_seen_at']}
+        if show_emails:
+            public['email'] = user['email']
+        return public
+
+
+class FakeDiscourseTransport(object):
+    """A transport that answers requests from a FakeDiscourse, after its simulated latency."""
+
+    errors = ()
+
+    def __init__(self, fake):
+        self._fake = fake
+
+    @ndb.tasklet
+    def fetch(self, url, payload, method, headers):
+        if self._fake.latency:
+            yield ndb.sleep(self._fake.latency)
+        raise ndb.Return(self._fake.respond(method, url, payload, headers))
+
+
+def wsgiApp(fake):
+    """Returns a WSGI application serving the endpoints of a FakeDiscourse over HTTP."""
+
+    def app(environ, start_response):
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        url = environ.get('PATH_INFO', '/')
+        if environ.get('QUERY_STRING'):
+            url += '?' + environ['QUERY_STRING']
+
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        payload = environ['wsgi.input'].read(length) if length else ''
+        headers = {
+            'Accept-Encoding': environ.get('HTTP_ACCEPT_ENCODING', ''),
+            'If-None-Match': environ.get('HTTP_IF_NONE_MATCH')
+        }
+
+        response = fake.respond(environ['REQUEST_METHOD'], url, payload, headers)
+        status = '%d %s' % (response.status_code, 'OK' if response.status_code == 200 else 'Error')
+        response_headers = response.headers.items()
+        response_headers.append(('Content-Length', str(len(response.content))))
+        start_response(status, response_headers)
+        return [response.content]
+
+    return app
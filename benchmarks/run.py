@@ -0,0 +1,141 @@
+"""Runs end-to-end benchmarks of the client's public operations against a FakeDiscourse.
+
+For each operation, the number of HTTP calls, the total wall time and the p50/p99 latency per
+call are reported. Run from the repository root with the App Engine SDK on the Python path:
+
+  python -m benchmarks.run --latency 0.05 --iterations 50
+"""
+
+import argparse
+import json
+import time
+
+from google.appengine.ext import testbed
+
+from benchmarks import fake_discourse
+from gae_discourse_client import categories
+from gae_discourse_client import content
+from gae_discourse_client import discourse_client
+from gae_discourse_client import emailindex
+from gae_discourse_client import groups
+from gae_discourse_client import users
+
+
+class Clients(object):
+    """The set of sub-clients built by discourse_client.initClient, for a single fake site."""
+
+    def __init__(self, fake, **kwargs):
+        self.api = discourse_client.DiscourseAPIClient(
+            'http://discourse.example.com/', 'benchmark-key', 'system',
+            transport=fake_discourse.FakeDiscourseTransport(fake), **kwargs)
+        self.users = users.UserClient(self.api, email_index=emailindex.EmailIndex())
+        self.groups = groups.GroupClient(self.api, self.users)
+        self.categories = categories.CategoryClient(self.api)
+        self.content = content.ContentClient(self.api, self.categories)
+
+
+BENCHMARKS = [
+    ('users.getByEmail',
+     lambda c, i: c.users.getByEmail('user%d@example.com' % (i % 10), identity_only=True)),
+    ('users.createMany (100 users, skipping existing)',
+     lambda c, i: c.users.createMany(
+         [{'name': 'New %d' % n, 'email': 'new%d@example.com' % n, 'password': 'password',
+           'username': 'new%d' % n} for n in xrange(100 * i, 100 * (i + 1))],
+         skip_existing=True)),
+    ('groups.getByName',
+     lambda c, i: c.groups.getByName('group%d' % (i % 10))),
+    ('groups.addUserByUsername',
+     lambda c, i: c.groups.addUserByUsername('user%d' % (500 + i), 'group0')),
+    ('groups.addUserByEmail',
+     lambda c, i: c.groups.addUserByEmail('user%d@example.com' % (500 + i), 'group1')),
+    ('groups.removeUserByEmail',
+     lambda c, i: c.groups.removeUserByEmail('user%d@example.com' % i, 'group2')),
+    ('groups.addUsersByUsername (100 users)',
+     lambda c, i: c.groups.addUsersByUsername(
+         ['user%d' % n for n in xrange(100 * i, 100 * (i + 1))], 'group3')),
+    ('groups.getAllMembers',
+     lambda c, i: c.groups.getAllMembers('group4')),
+    ('categories.getBySlug (with parent)',
+     lambda c, i: c.categories.getBySlug('category-1-%d' % (i % 5), 'category-1')),
+    ('categories.create (with parent)',
+     lambda c, i: c.categories.create('Benchmark %d' % i, 'Category 2')),
+    ('content.getTopics',
+     lambda c, i: c.content.getTopics(page=i % 5)),
+]
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def runBenchmark(name, operation, args):
+    fake = fake_discourse.FakeDiscourse(
+        num_users=args.users, members_per_group=args.members, latency=args.latency)
+    clients = Clients(fake)
+
+    latencies = []
+    started_at = time.time()
+    for i in xrange(args.iterations):
+        if args.cold:
+            clients = Clients(fake)
+
+        call_started_at = time.time()
+        operation(clients, i).get_result()
+        latencies.append(time.time() - call_started_at)
+
+    return {
+        'name': name,
+        'iterations': args.iterations,
+        'http_calls': len(fake.requests),
+        'calls_per_op': float(len(fake.requests)) / args.iterations,
+        'wall_time': time.time() - started_at,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Simulated latency of each request, in seconds.')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='Number of calls to make to each operation.')
+    parser.add_argument('--users', type=int, default=5000, help='Number of users on the site.')
+    parser.add_argument('--members', type=int, default=1000, help='Number of members per group.')
+    parser.add_argument('--cold', action='store_true',
+                        help='Build new clients (with empty caches) for every call.')
+    parser.add_argument('--only', help='Only run benchmarks whose name contains this string.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args()
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+
+    results = []
+    try:
+        for name, operation in BENCHMARKS:
+            if args.only and args.only not in name:
+                continue
+            results.append(runBenchmark(name, operation, args))
+    finally:
+        bed.deactivate()
+
+    if args.json:
+        print json.dumps(results, indent=2)
+        return
+
+    print '%-40s %8s %10s %10s %10s %10s' % ('operation', 'calls', 'calls/op', 'wall (s)',
+                                             'p50 (ms)', 'p99 (ms)')
+    for result in results:
+        print '%-40s %8d %10.2f %10.3f %10.1f %10.1f' % (
+            result['name'], result['http_calls'], result['calls_per_op'], result['wall_time'],
+            result['p50'] * 1000, result['p99'] * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""In-process caches used by the Discourse API clients"""
+
+import collections
+import time
+
+
+class LRUCache(object):
+    """A bounded mapping whose entries expire.
+
+    When the cache is full, the least recently used entry is evicted to make room for a new one.
+    Each entry expires `ttl` seconds after it was set, unless a different ttl is given for it.
+    """
+
+    def __init__(self, max_size=1000, ttl=300, clock=time.time):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the value stored for the key, or `default` if it is missing or has expired."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            return default
+
+        self._entries[key] = entry
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Stores a value for the key, evicting the least recently used entry if needed."""
+        if ttl is None:
+            ttl = self._ttl
+
+        self._entries.pop(key, None)
+        while len(self._entries) >= self._max_size:
+            self._entries.popitem(last=False)
+
+        self._entries[key] = (self._clock() + ttl, value)
+
+    def delete(self, key):
+        """Removes the entry for the key, if there is one."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def keys(self):
+        """Returns the keys of all entries, from least to most recently used."""
+        return self._entries.keys()
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self._clock()
+
+    def __len__(self):
+        return len(self._entries)
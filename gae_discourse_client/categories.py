@@ -2,36 +2,197 @@
 
 import json
 import re
+import time
 from urllib import urlencode
 
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 
+import jsonscan
+import models
+import tracing
+
 
 class Error(Exception):
     pass
 
 
+class CategoryTree(object):
+    """An in-memory index of Discourse categories and subcategories.
+
+    The tree is loaded from the category listing in site.json, and answers lookups by
+    (name, parent) and (slug, parent) without further requests. It is considered stale once
+    `ttl` seconds have passed since the last load. A lookup missing from a fresh tree may reload
+    it once before it expires (see missReloadAllowed), so that repeated lookups of categories that
+    don't exist don't each reload site.json.
+    """
+
+    # The fields the tree cannot do without.
+    KEY_FIELDS = frozenset(['id', 'name', 'slug', 'parent_category_id'])
+
+    def __init__(self, ttl=300, clock=time.time):
+        self._ttl = ttl
+        self._clock = clock
+        self._by_id = {}
+        self._by_name = {}
+        self._by_slug = {}
+        self._expires_at = 0
+        self._miss_reloaded = False
+
+    def isFresh(self):
+        """Whether the tree has been loaded and has not yet expired."""
+        return self._clock() < self._expires_at
+
+    def load(self, categories):
+        """Replaces the contents of the tree with the given list of categories."""
+        self._by_id = {}
+        self._by_name = {}
+        self._by_slug = {}
+        for category in categories:
+            self.put(category)
+
+        self._expires_at = self._clock() + self._ttl
+        self._miss_reloaded = False
+
+    def missReloadAllowed(self):
+        """Whether a lookup missing from the tree may reload it, which it may do once per load."""
+        return not self._miss_reloaded
+
+    def markMissReload(self):
+        """Records that the tree was reloaded for a missing lookup."""
+        self._miss_reloaded = True
+
+    def invalidate(self):
+        """Marks the tree as stale, so that the next lookup reloads it."""
+        self._expires_at = 0
+
+    def getById(self, category_id):
+        return self._by_id.get(category_id)
+
+    def getByName(self, category_name, parent_category_id=None):
+        return self._by_name.get((category_name, parent_category_id))
+
+    def getBySlug(self, category_slug, parent_category_id=None):
+        return self._by_slug.get((category_slug, parent_category_id))
+
+    def findByName(self, category_name, parent_category_name=None):
+        """Finds a category by its name and the name of its parent, if any."""
+        parent_category_id = None
+        if parent_category_name:
+            parent_category = self.getByName(parent_category_name)
+            if parent_category is None:
+                return None
+            parent_category_id = parent_category['id']
+
+        return self.getByName(category_name, parent_category_id)
+
+    def findBySlug(self, category_slug, parent_category_slug=None):
+        """Finds a category by its slug and the slug of its parent, if any."""
+        parent_category_id = None
+        if parent_category_slug:
+            parent_category = self.getBySlug(parent_category_slug)
+            if parent_category is None:
+                return None
+            parent_category_id = parent_category['id']
+
+        return self.getBySlug(category_slug, parent_category_id)
+
+    def getChildren(self, category_id):
+        """Returns the subcategories of the category with the given id."""
+        return [category for category in self._by_id.itervalues()
+                if category.get('parent_category_id') == category_id]
+
+    def put(self, category):
+        """Adds or replaces a single category in the tree."""
+        previous = self._by_id.get(category['id'])
+        if previous is not None:
+            self._unlink(previous)
+
+        parent_category_id = category.get('parent_category_id')
+        self._by_id[category['id']] = category
+        self._by_name[(category['name'], parent_category_id)] = category
+        self._by_slug[(category['slug'], parent_category_id)] = category
+
+    def remove(self, category):
+        """Removes a category and its subcategories from the tree, if present."""
+        for child in self.getChildren(category['id']):
+            self._unlink(child)
+        self._unlink(category)
+
+    def _unlink(self, category):
+        parent_category_id = category.get('parent_category_id')
+        self._by_id.pop(category['id'], None)
+        self._by_name.pop((category['name'], parent_category_id), None)
+        self._by_slug.pop((category['slug'], parent_category_id), None)
+
+    def __len__(self):
+        return len(self._by_id)
+
+
 class CategoryClient(object):
-    """An API client for interacting with Discourse for category-related actions"""
+    """An API client for interacting with Discourse for category-related actions
 
-    def __init__(self, api_client):
+    Category lookups are answered from a CategoryTree, kept for `index_ttl` seconds. If
+    `index_ttl` is 0, the tree is disabled, and each lookup instead scans the category listing,
+    keeping only the categories with the names or slugs it is looking for. If `index_fields` is
+    given, the tree keeps only those fields of each category (along with the ones it is keyed
+    on), and lookups return only them.
+
+    If a `mirror` (a mirror.Mirror) is given, lookups are answered from it first, and categories
+    created or deleted through this client are written through to it.
+    """
+
+    def __init__(self, api_client, index_ttl=300, index_fields=None, mirror=None):
         self._api_client = api_client
+        self._mirror = mirror
+        self._tree = CategoryTree(ttl=index_ttl)
+        self._tree_enabled = index_ttl > 0
+        self._index_fields = jsonscan.combineFields(index_fields, CategoryTree.KEY_FIELDS)
 
     @ndb.tasklet
-    def getAllCategories(self):
+    @tracing.traced
+    def getAllCategories(self, as_models=False, fields=None):
         """Gets a list of all Discourse categories and subcategories
 
+        The category tree is reloaded from the result as a side effect, unless `fields` leaves out
+        some of the fields the tree keeps.
+
+        Args:
+          as_models: Whether to return models.Category objects instead of dictionaries.
+          fields: The fields to keep of each category, or None to keep all of them (or, with
+            `as_models`, those of models.Category). Other fields are dropped as the listing is
+            decoded.
+
         Returns:
           A list of categories
         """
-        response = yield self._api_client.getRequest('site.json')
-        raise ndb.Return(response['categories'])
+        if as_models and fields is None:
+            fields = models.Category.fields
+        decode_fields = jsonscan.combineFields(fields, self._index_fields)
+        if decode_fields is None and fields is not None:
+            # The tree keeps whole categories, so it can't be reloaded from a projected listing.
+            decode_fields = frozenset(fields)
+        decoder = None
+        if decode_fields is not None:
+            decoder = jsonscan.Projection(decode_fields, ('categories',))
+
+        response = yield self._api_client.getRequest('site.json', decoder=decoder)
+        categories = response['categories']
+        if decode_fields is None or self._index_fields is not None:
+            self._tree.load(jsonscan.pickEach(categories, self._index_fields, decode_fields))
+
+        categories = jsonscan.pickEach(categories, fields, decode_fields)
+        raise ndb.Return(models.Category.fromList(categories) if as_models else categories)
 
     @ndb.tasklet
+    @tracing.traced
     def getByName(self, category_name, parent_category_name=None):
         """Finds a Discourse category by name.
 
+        Lookups are answered from the category tree while it is fresh, then from the mirror, if
+        any, and then from the category tree again, which is reloaded when it has expired or when
+        the category is missing from a tree that was not just reloaded, but no more than once for
+        missing categories before it expires.
+
         Args:
           category_name: The name of the category to find.
           parent_category_name: The name of the parent category (if any). If this is None, a
@@ -41,25 +202,23 @@ class CategoryClient(object):
           A dictionary containing information about the category if the category is successfully found,
           None otherwise
         """
-        if parent_category_name:
-            parent_category = yield self.getByName(parent_category_name)
-            if not parent_category:
-                raise ndb.Return(None)
-
-            categories = yield self._api_client.getRequest('categories.json', params={'parent_category_id': parent_category['id']})
-        else:
-            categories = yield self._api_client.getRequest('categories.json')
-
-        for category in categories['category_list']['categories']:
-            if category['name'] == category_name:
-                raise ndb.Return(category)
-
-        raise ndb.Return(None)
+        category = self._freshTreeLookup('name', category_name, parent_category_name)
+        if category is None and self._mirror is not None:
+            category = yield self._mirror.getCategoryByName(category_name, parent_category_name)
+        if category is None:
+            category = yield self._lookup('name', category_name, parent_category_name)
+        raise ndb.Return(category)
 
     @ndb.tasklet
+    @tracing.traced
     def getBySlug(self, category_slug, parent_category_slug=None):
         """Finds a Discourse category by slug.
 
+        Lookups are answered from the category tree while it is fresh, then from the mirror, if
+        any, and then from the category tree again, which is reloaded when it has expired or when
+        the category is missing from a tree that was not just reloaded, but no more than once for
+        missing categories before it expires.
+
         Args:
           category_slug: The slug of the category to find.
           parent_category_slug: The slug of the parent category (if any). If this is None, a
@@ -69,22 +228,44 @@ class CategoryClient(object):
           A dictionary containing information about the category if the category is successfully found,
           None otherwise
         """
-        if parent_category_slug:
-            parent_category = yield self.getBySlug(parent_category_slug)
-            if not parent_category:
-                raise ndb.Return(None)
+        category = self._freshTreeLookup('slug', category_slug, parent_category_slug)
+        if category is None and self._mirror is not None:
+            category = yield self._mirror.getCategoryBySlug(category_slug, parent_category_slug)
+        if category is None:
+            category = yield self._lookup('slug', category_slug, parent_category_slug)
+        raise ndb.Return(category)
 
-            categories = yield self._api_client.getRequest('categories.json', params={'parent_category_id': parent_category['id']})
-        else:
-            categories = yield self._api_client.getRequest('categories.json')
+    @ndb.tasklet
+    @tracing.traced
+    def refreshTree(self):
+        """Reloads the category tree from Discourse.
+
+        Returns:
+          The refreshed CategoryTree.
+        """
+        yield self.getAllCategories()
+        raise ndb.Return(self._tree)
 
-        for category in categories['category_list']['categories']:
-            if category['slug'] == category_slug:
-                raise ndb.Return(category)
+    def invalidateTree(self):
+        """Marks the category tree as stale, so that the next lookup reloads it."""
+        self._tree.invalidate()
+
+    @ndb.tasklet
+    def updateCached(self, category):
+        """Adds or replaces a category in the tree and the mirror, after it changed on Discourse."""
+        self._tree.put(jsonscan.pickEach([category], self._index_fields)[0])
+        if self._mirror is not None:
+            yield self._mirror.putCategory(category)
 
-        raise ndb.Return(None)
+    @ndb.tasklet
+    def removeCached(self, category):
+        """Removes a category from the tree and the mirror, after it was deleted on Discourse."""
+        self._tree.remove(category)
+        if self._mirror is not None:
+            yield self._mirror.removeCategory(category)
 
     @ndb.tasklet
+    @tracing.traced
     def create(self, category_name, parent_category_name=None, strict=False, **kwargs):
         """Creates a category on Discourse.
 
@@ -104,7 +285,15 @@ class CategoryClient(object):
           Error: if `strict` is True and the category already exists, or if the parent category
             given does not exist.
         """
-        category = yield self.getByName(category_name, parent_category_name)
+        parent_category = None
+        if parent_category_name:
+            parent_category = yield self.getByName(parent_category_name)
+            if not parent_category:
+                raise Error("Could not find category named %s" % parent_category_name)
+
+        # A missing category is the expected outcome here, so don't reload the tree for it.
+        category = yield self._lookup(
+            'name', category_name, parent_category_name, reload_on_miss=False)
         if category:
             if not strict:
                 raise ndb.Return(None)
@@ -121,16 +310,22 @@ class CategoryClient(object):
         for k, v in kwargs.iteritems():
             payload[k] = v
 
-        if parent_category_name:
-            parent_category = yield self.getByName(parent_category_name)
-            if not parent_category:
-                raise Error("Could not find category named %s" % parent_category_name)
+        if parent_category:
             payload['parent_category_id'] = parent_category['id']
 
         response = yield self._api_client.postRequest('categories', payload=payload)
+
+        if response and response.get('category'):
+            self._tree.put(jsonscan.pickEach([response['category']], self._index_fields)[0])
+            if self._mirror is not None:
+                yield self._mirror.putCategory(response['category'])
+        else:
+            self._tree.invalidate()
+
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.traced
     def delete(self, category_name, parent_category_name=None, strict=False):
         """Delete a category.
 
@@ -156,4 +351,67 @@ class CategoryClient(object):
                 raise Error("Could not find category named %s" % category_name)
 
         response = yield self._api_client.deleteRequest('categories/%s' % category['slug'])
+        self._tree.remove(category)
+        if self._mirror is not None:
+            yield self._mirror.removeCategory(category)
         raise ndb.Return(response)
+
+    def _freshTreeLookup(self, field, value, parent_value):
+        # Answers a lookup from memory if the tree is fresh, without reloading it.
+        if not self._tree_enabled or not self._tree.isFresh():
+            return None
+        return _find(self._tree, field, value, parent_value)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _lookup(self, field, value, parent_value=None, reload_on_miss=True):
+        if not self._tree_enabled:
+            category = yield self._api_client.getRequest(
+                'site.json', decoder=_CategoryScan(field, value, parent_value))
+            raise ndb.Return(category)
+
+        refreshed = False
+        if not self._tree.isFresh():
+            yield self.refreshTree()
+            refreshed = True
+
+        category = _find(self._tree, field, value, parent_value)
+        if (category is None and reload_on_miss and not refreshed and
+                self._tree.missReloadAllowed()):
+            yield self.refreshTree()
+            self._tree.markMissReload()
+            category = _find(self._tree, field, value, parent_value)
+
+        raise ndb.Return(category)
+
+
+def _find(tree, field, value, parent_value):
+    if field == 'name':
+        return tree.findByName(value, parent_value)
+    return tree.findBySlug(value, parent_value)
+
+
+class _CategoryScan(object):
+    # A site.json decoder finding a category by name or slug. It builds a tree of only the
+    # categories whose `field` is the category's or its parent's, which is enough to resolve the
+    # category. Scans for the same category compare equal, so identical lookups can share a
+    # response.
+
+    def __init__(self, field, value, parent_value):
+        self.key = (field, value, parent_value)
+
+    def __call__(self, content):
+        field, value, parent_value = self.key
+        tree = CategoryTree()
+        tree.load(category for category in jsonscan.iterArray(content, ('categories',))
+                  if category[field] in (value, parent_value))
+        return _find(tree, field, value, parent_value)
+
+    def __eq__(self, other):
+        return isinstance(other, _CategoryScan) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
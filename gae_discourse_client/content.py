@@ -2,6 +2,10 @@
 
 from google.appengine.ext import ndb
 
+import jsonscan
+import models
+import tracing
+
 
 class Error(Exception):
     pass
@@ -15,30 +19,52 @@ class ContentClient(object):
         self._category_client = category_client
 
     @ndb.tasklet
-    def getTopics(self, category_id=None, parent_category_id=None, page=0):
+    @tracing.traced
+    def getTopics(self, category_id=None, parent_category_id=None, page=0, as_models=False,
+                  fields=None):
         """Gets all topics for the given category.
 
         Args:
           category_id: ID for the category from which to retrieve posts, if any.
           page: Page from which to retrieve results. Each page will return 30 posts.
+          as_models: Whether to list the topics as models.Topic objects, and the users as
+            models.User objects, instead of dictionaries.
+          fields: The fields to keep of each topic, or None to keep all of them (or, with
+            `as_models`, those of models.Topic). Other fields are dropped as the response is
+            decoded.
 
         Returns:
           Python object representation of the topics in the category. This includes a list of
           users and a list of topics.
         """
 
+        if as_models and fields is None:
+            fields = models.Topic.fields
+        decoder = None
+        if fields is not None:
+            decoder = jsonscan.Projection(fields, ('topic_list', 'topics'))
+
         if category_id and parent_category_id:
             response = yield self._api_client.getRequest(
-                'c/%s/%s.json' % (parent_category_id, category_id), params={'page': page})
+                'c/%s/%s.json' % (parent_category_id, category_id), params={'page': page},
+                decoder=decoder)
         elif category_id:
             response = yield self._api_client.getRequest(
-                'c/%s.json' % category_id, params={'page': page})
+                'c/%s.json' % category_id, params={'page': page}, decoder=decoder)
         else:
-            response = yield self._api_client.getRequest('latest.json', params={'page': page})
-
+            response = yield self._api_client.getRequest(
+                'latest.json', params={'page': page}, decoder=decoder)
+
+        if as_models:
+            topic_list = response['topic_list']
+            response = dict(
+                response,
+                users=models.User.fromList(response.get('users', [])),
+                topic_list=dict(topic_list, topics=models.Topic.fromList(topic_list['topics'])))
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.traced
     def getTopic(self, topic_id):
         """Get the topic with the given ID
 
@@ -53,6 +79,7 @@ class ContentClient(object):
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.traced
     def getTopicLast(self, topic_id):
         """Get the last post in the topic with the given ID
 
@@ -65,3 +92,79 @@ class ContentClient(object):
 
         response = yield self._api_client.getRequest('t/%s/last.json' % topic_id)
         raise ndb.Return(response)
+
+
+def _topicKey(topic):
+    return (topic['bumped_at'], topic['id'])
+
+
+class TopicPoller(object):
+    """Polls a topic listing for topics that are new or have been bumped since the last poll.
+
+    The poller keeps a cursor, the (bumped_at, id) of the most recently bumped topic it has seen.
+    Topic listings are ordered by bump time, so paging stops as soon as a topic at or before the
+    cursor is reached, and a poll with nothing new costs a single request. The cursor is a plain
+    tuple that can be stored between requests and passed back in to resume polling.
+
+    A poll reads at most `max_pages` pages. If it stops there without reaching the cursor, the
+    cursor is left where it was, so the topics on the pages it didn't read aren't skipped, and
+    `truncated` is set.
+    """
+
+    def __init__(self, content_client, category_id=None, parent_category_id=None, cursor=None,
+                 max_pages=10):
+        self._content_client = content_client
+        self._category_id = category_id
+        self._parent_category_id = parent_category_id
+        self._max_pages = max_pages
+        self.cursor = tuple(cursor) if cursor else None
+        self.truncated = False
+
+    @ndb.tasklet
+    @tracing.traced
+    def poll(self):
+        """Fetches the topics that are new or were bumped since the last poll.
+
+        On the first poll (with no cursor) only the first page of the listing is read. The cursor
+        is then advanced past the topics returned, unless the poll was truncated.
+
+        Returns:
+          A list of the new or bumped topics, newest first.
+        """
+        newest = self.cursor
+        seen_ids = set()
+        topics = []
+        caught_up = self.cursor is None
+
+        for page in xrange(self._max_pages):
+            response = yield self._content_client.getTopics(
+                category_id=self._category_id,
+                parent_category_id=self._parent_category_id,
+                page=page
+            )
+            topic_list = response['topic_list']
+
+            for topic in topic_list['topics']:
+                if topic['id'] in seen_ids:
+                    continue
+                seen_ids.add(topic['id'])
+
+                key = _topicKey(topic)
+                if self.cursor is None or key > self.cursor:
+                    if newest is None or key > newest:
+                        newest = key
+                    topics.append(topic)
+                elif not topic.get('pinned'):
+                    # Pinned topics are listed first regardless of when they were bumped.
+                    caught_up = True
+                    break
+
+            if not topic_list.get('more_topics_url'):
+                caught_up = True
+            if caught_up:
+                break
+
+        self.truncated = not caught_up
+        if caught_up:
+            self.cursor = newest
+        raise ndb.Return(topics)
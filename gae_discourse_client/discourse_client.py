@@ -2,14 +2,22 @@
 
 import json
 import re
+import threading
+import time
 import urllib
+import zlib
 
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 
 import categories as categories_module
 import content as content_module
+import endpoints
 import groups as groups_module
+import metrics as metrics_module
+import ratelimit
+import retry
+import tracing
+import transport as transport_module
 import users as users_module
 
 
@@ -18,39 +26,135 @@ class Error(Exception):
 
 
 class DiscourseAPIClient(object):
-    """An API client for interacting with Discourse"""
+    """An API client for interacting with Discourse
 
-    def __init__(self, discourse_url, api_key, api_username='system'):
+    Identical GET requests made while one is already in flight (in the same thread, and so the
+    same ndb context) share that request's result instead of sending another one. Callers
+    receive the same decoded object, so it should be treated as read-only.
+
+    Requests pass through a RateLimiter before being sent. When Discourse answers with a 429, the
+    limiter is paused for the time given in the Retry-After header and the request is sent again,
+    up to `max_throttle_retries` times.
+
+    Other failures are retried according to a RetryPolicy. By default, GET, PUT and DELETE
+    requests are retried up to three times on 5xx responses and transport errors.
+
+    If a `validator_cache` (a cache.LRUCache) is given, GET responses carrying an ETag or
+    Last-Modified header are stored in it along with their decoded body, and later GETs of the
+    same URL are made conditional. When Discourse answers 304 Not Modified, the stored body is
+    returned without being downloaded or decoded again.
+
+    Responses are requested gzip-compressed, and decompressed here if the transport has not
+    already done so. The number of bytes received and decoded is tallied per endpoint, and is
+    available from getTransferStats.
+
+    Requests are sent through `transport`, which defaults to a transport.UrlfetchTransport. Pass a
+    transport.PooledHTTPTransport to run outside of App Engine.
+
+    Every HTTP exchange, including retries, is recorded in a metrics.Metrics instance by method
+    and endpoint template. Its statistics are available from getMetrics().snapshot(), and sinks
+    can be added to it to export each request as it happens.
+
+    Response bodies are decoded with `json_decoder`, a callable taking a JSON string, which
+    defaults to json.loads and can be replaced with a faster decoder. A GET request can also be
+    given its own `decoder`, to scan the body for only the parts it needs (see jsonscan); such
+    requests only share results with requests using an equal decoder, and do not use the
+    validator cache.
+    """
+
+    def __init__(self, discourse_url, api_key, api_username='system', coalesce_gets=True,
+                 rate_limiter=None, max_throttle_retries=5, retry_policy=None,
+                 validator_cache=None, transport=None, metrics=None, json_decoder=None):
         self._discourse_url = discourse_url
         self._api_key = api_key
         self._api_username = api_username
+        self._coalesce_gets = coalesce_gets
+        self._rate_limiter = rate_limiter or ratelimit.RateLimiter()
+        self._max_throttle_retries = max_throttle_retries
+        self._transport = transport or transport_module.UrlfetchTransport()
+        self._retry_policy = retry_policy or retry.RetryPolicy(
+            retry_exceptions=self._transport.errors)
+        self._validator_cache = validator_cache
+        self._metrics = metrics or metrics_module.Metrics()
+        self._json_decoder = json_decoder or json.loads
+        self._local = threading.local()
+        self._coalescing_stats = {'sent': 0, 'coalesced': 0}
+
+    def invalidateCached(self, req_string=None):
+        """Drops validator cache entries for URLs starting with the given path, or all of them."""
+        if self._validator_cache is None:
+            return
+
+        if req_string is None:
+            self._validator_cache.clear()
+            return
+
+        prefix = self._discourse_url + req_string
+        for url in self._validator_cache.keys():
+            if url.startswith(prefix):
+                self._validator_cache.delete(url)
+
+    def getMetrics(self):
+        """Returns the metrics.Metrics instance recording this client's requests."""
+        return self._metrics
+
+    def getTransferStats(self):
+        """Returns, per endpoint template, the number of responses and bytes received.
+
+        Each endpoint maps to a dictionary with the keys 'responses', 'wire_bytes' (the size of
+        the bodies as received) and 'decoded_bytes' (their size after decompression). Only the
+        responses that were decoded are counted, so error responses and responses answered
+        from the validator cache are left out.
+        """
+        transfer_stats = {}
+        for method_stats in self._metrics.snapshot().itervalues():
+            for endpoint, stats in method_stats.iteritems():
+                if not stats['decoded_responses']:
+                    continue
+
+                totals = transfer_stats.setdefault(
+                    endpoint, {'responses': 0, 'wire_bytes': 0, 'decoded_bytes': 0})
+                totals['responses'] += stats['decoded_responses']
+                totals['wire_bytes'] += stats['decoded_wire_bytes']
+                totals['decoded_bytes'] += stats['decoded_bytes']
+
+        return transfer_stats
+
+    def getCoalescingStats(self):
+        """Returns how many GET requests were sent, and how many were saved by coalescing."""
+        return dict(self._coalescing_stats)
 
     @ndb.tasklet
-    def getRequest(self, req_string, params=None, payload=None):
+    @tracing.propagated
+    def getRequest(self, req_string, params=None, payload=None, decoder=None):
         response = yield self._sendDiscourseRequest(
-            req_string, params, payload, 'GET')
+            req_string, params, payload, 'GET', decoder)
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.propagated
     def putRequest(self, req_string, params=None, payload=None):
         response = yield self._sendDiscourseRequest(
             req_string, params, payload, 'PUT')
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.propagated
     def postRequest(self, req_string, params=None, payload=None):
         response = yield self._sendDiscourseRequest(
             req_string, params, payload, 'POST')
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.propagated
     def deleteRequest(self, req_string, params=None, payload=None):
         response = yield self._sendDiscourseRequest(
             req_string, params, payload, 'DELETE')
         raise ndb.Return(response)
 
     @ndb.tasklet
-    def _sendDiscourseRequest(self, req_string, params, payload, method):
+    @tracing.propagated
+    def _sendDiscourseRequest(self, req_string, params, payload, method, decoder=None):
         if payload is None:
             payload = {}
         if params is None:
@@ -72,10 +176,106 @@ class DiscourseAPIClient(object):
         if params:
             url += '?' + urllib.urlencode(params)
 
-        response = yield ndb.get_context().urlfetch(
-            url=url, payload=urllib.urlencode(payload), method=method,
-            headers={'Content-Type': 'application/x-www-form-urlencoded'}
-        )
+        span = tracing.startSpan(
+            '%s %s' % (method, endpoints.endpointTemplate(req_string)), path=req_string)
+
+        coalesced = False
+        if method != 'GET' or not self._coalesce_gets:
+            future = self._fetch(req_string, url, payload, method, decoder)
+        else:
+            # Requests with their own decoder only share results with the same decoder.
+            key = url if decoder is None else (url, decoder)
+            inflight = self._inflightRequests()
+            future = inflight.get(key)
+            if future is not None:
+                coalesced = True
+                self._coalescing_stats['coalesced'] += 1
+            else:
+                self._coalescing_stats['sent'] += 1
+                future = self._fetch(req_string, url, payload, method, decoder)
+                inflight[key] = future
+                future.add_immediate_callback(inflight.pop, key, None)
+
+        try:
+            response = yield future
+        except Exception as e:
+            tracing.finishSpan(span, coalesced=coalesced, error=str(e))
+            raise
+
+        tracing.finishSpan(span, coalesced=coalesced)
+        raise ndb.Return(response)
+
+    @ndb.tasklet
+    def _fetch(self, req_string, url, payload, method, decoder=None):
+        endpoint = endpoints.endpointTemplate(req_string)
+        started_at = time.time()
+        attempt = 1
+        throttled = 0
+
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept-Encoding': 'gzip'
+        }
+        validated = None
+        use_validators = (
+            method == 'GET' and decoder is None and self._validator_cache is not None)
+        if use_validators:
+            validated = self._validator_cache.get(url)
+            if validated is not None:
+                etag, last_modified, _ = validated
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+
+        body = urllib.urlencode(payload)
+        request_bytes = len(url) + len(body)
+
+        while True:
+            delay = self._rate_limiter.reserve(method, endpoint)
+            while delay > 0:
+                yield ndb.sleep(delay)
+                delay = self._rate_limiter.pausedFor()
+
+            sent_at = time.time()
+            try:
+                response = yield self._transport.fetch(
+                    url=url, payload=body, method=method, headers=headers
+                )
+            except Exception as e:
+                self._metrics.record(method, endpoint, time.time() - sent_at, error=True,
+                                     request_bytes=request_bytes)
+                if not isinstance(e, self._retry_policy.retry_exceptions):
+                    raise
+                delay = self._retryDelay(method, endpoint, attempt, started_at, exception=e)
+                if delay is None:
+                    raise
+            else:
+                self._metrics.record(
+                    method, endpoint, time.time() - sent_at,
+                    status_code=response.status_code,
+                    error=response.status_code not in (200, 304),
+                    request_bytes=request_bytes,
+                    response_bytes=len(response.content))
+
+                if response.status_code == 429 and throttled < self._max_throttle_retries:
+                    throttled += 1
+                    self._rate_limiter.pause(ratelimit.parseRetryAfter(
+                        response.headers.get('Retry-After'), default=2 ** throttled))
+                    continue
+
+                if response.status_code == 304 and validated is not None:
+                    raise ndb.Return(validated[2])
+
+                delay = None
+                if response.status_code != 200:
+                    delay = self._retryDelay(
+                        method, endpoint, attempt, started_at, status_code=response.status_code)
+                if delay is None:
+                    break
+
+            attempt += 1
+            yield ndb.sleep(delay)
 
         if response.status_code != 200:
             raise Error(
@@ -83,7 +283,48 @@ class DiscourseAPIClient(object):
                 (method, req_string, response.status_code)
             )
 
-        raise ndb.Return(json.loads(response.content))
+        content = self._decodeContent(method, endpoint, response)
+        result = (decoder or self._json_decoder)(content)
+
+        if use_validators:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self._validator_cache.set(url, (etag, last_modified, result))
+
+        raise ndb.Return(result)
+
+    def _decodeContent(self, method, endpoint, response):
+        content = response.content
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+
+        self._metrics.recordDecoded(method, endpoint, len(content), len(response.content))
+        return content
+
+    def _retryDelay(self, method, endpoint, attempt, started_at, status_code=None, exception=None):
+        elapsed = time.time() - started_at
+        delay = self._retry_policy.retryDelay(
+            method, attempt, elapsed, status_code=status_code, exception=exception)
+
+        if delay is not None and self._retry_policy.on_retry:
+            self._retry_policy.on_retry({
+                'method': method,
+                'endpoint': endpoint,
+                'attempt': attempt,
+                'delay': delay,
+                'elapsed': elapsed,
+                'status_code': status_code,
+                'exception': exception
+            })
+
+        return delay
+
+    def _inflightRequests(self):
+        inflight = getattr(self._local, 'inflight', None)
+        if inflight is None:
+            inflight = self._local.inflight = {}
+        return inflight
 
 
 users = None
@@ -92,12 +333,12 @@ categories = None
 content = None
 
 
-def initClient(discourse_url, api_key, api_username):
-    _api_client = DiscourseAPIClient(discourse_url, api_key, api_username)
+def initClient(discourse_url, api_key, api_username, email_index=None, mirror=None, **kwargs):
+    _api_client = DiscourseAPIClient(discourse_url, api_key, api_username, **kwargs)
 
     global categories, content, groups, users
 
-    users = users_module.UserClient(_api_client)
-    groups = groups_module.GroupClient(_api_client, users)
-    categories = categories_module.CategoryClient(_api_client)
+    users = users_module.UserClient(_api_client, email_index=email_index)
+    groups = groups_module.GroupClient(_api_client, users, mirror=mirror)
+    categories = categories_module.CategoryClient(_api_client, mirror=mirror)
     content = content_module.ContentClient(_api_client, categories)
@@ -0,0 +1,309 @@
+"""A persistent index of the email addresses of active Discourse users.
+
+Discourse can't look users up by email, so UserClient.getByEmail has to run a filtered search of
+the active users. An EmailIndex instead maps the email address of every active user to their id
+and username, so that most emails can be resolved without a request to Discourse.
+
+The map is split into shards by a hash of the email address. Each shard is stored as a single
+compressed JSON value, in the datastore (DatastoreStorage) or in memcache (MemcacheStorage), and
+shards read by an instance are kept in memory for a short time. Shards are changed atomically (in
+a transaction, or with compare-and-set), so that instances updating the same shard at once don't
+overwrite each other's changes. A second set of shards maps each user id back to its email
+address, so that a user whose email changed can be found under their old address and moved.
+Alongside the shards, the index stores the highest user id it has seen, so that it can be
+refreshed incrementally by reading the listing of active users ordered by creation, newest
+first, only until that id is reached (see UserClient.refreshEmailIndex).
+
+An incremental refresh only picks up new users. Users who are deleted through UserClient are
+removed from the index, and users created, changed or deleted on Discourse itself are applied
+as they happen by a webhooks.WebhookHandler. Without one, such changes (deactivated accounts
+and changed emails) are only picked up by a full refresh, which should be run from time to time.
+"""
+
+import json
+import time
+import zlib
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import cache
+
+
+class Error(Exception):
+    pass
+
+
+class EmailIndexValue(ndb.Model):
+    """A shard of an email index, or its state, stored by DatastoreStorage."""
+    value = ndb.BlobProperty(compressed=True)
+
+
+class DatastoreStorage(object):
+    """Stores an email index in the datastore, as EmailIndexValue entities."""
+
+    def __init__(self, namespace=None):
+        self._namespace = namespace
+
+    @ndb.tasklet
+    def get(self, key):
+        entity = yield EmailIndexValue.get_by_id_async(key, namespace=self._namespace)
+        raise ndb.Return(entity.value if entity is not None else None)
+
+    @ndb.tasklet
+    def put(self, key, value):
+        yield EmailIndexValue(id=key, namespace=self._namespace, value=value).put_async()
+
+    @ndb.tasklet
+    def modify(self, key, func):
+        """Replaces a value with func(value), in a transaction. See MemcacheStorage.modify."""
+        @ndb.tasklet
+        def transaction():
+            entity = yield EmailIndexValue.get_by_id_async(key, namespace=self._namespace)
+            value = func(entity.value if entity is not None else None)
+            if value is not None:
+                yield EmailIndexValue(id=key, namespace=self._namespace, value=value).put_async()
+            raise ndb.Return(value)
+
+        value = yield ndb.transaction_async(transaction)
+        raise ndb.Return(value)
+
+
+class MemcacheStorage(object):
+    """Stores an email index in memcache.
+
+    Memcache can evict any part of the index at any time. Lookups in an evicted shard fall back
+    to searching Discourse, and the shard is rebuilt by the next full refresh.
+    """
+
+    def __init__(self, namespace='discourse-email-index', max_cas_attempts=10):
+        self._namespace = namespace
+        self._max_cas_attempts = max_cas_attempts
+
+    @ndb.tasklet
+    def get(self, key):
+        value = yield ndb.get_context().memcache_get(key, namespace=self._namespace)
+        raise ndb.Return(zlib.decompress(value) if value is not None else None)
+
+    @ndb.tasklet
+    def put(self, key, value):
+        stored = yield ndb.get_context().memcache_set(
+            key, zlib.compress(value), namespace=self._namespace)
+        if not stored:
+            raise Error("Could not store %s in memcache" % key)
+
+    @ndb.tasklet
+    def modify(self, key, func):
+        """Replaces a value with func(value), unless it changed in the meantime.
+
+        `func` is given the current value, or None if there is none, and returns the new value, or
+        None to leave it as it is. It is called again if the value changed before the new one
+        could be stored.
+
+        Returns:
+          The new value, or None if it was left as it was.
+        """
+        # The context's memcache batching merges writes of the same key into one, reporting each
+        # of them as stored, so a client of our own is used (which also keeps the cas ids apart).
+        client = memcache.Client()
+        for _ in xrange(self._max_cas_attempts):
+            stored = yield client.get_multi_async([key], namespace=self._namespace, for_cas=True)
+            stored = stored.get(key)
+            value = func(zlib.decompress(stored) if stored is not None else None)
+            if value is None:
+                raise ndb.Return(None)
+
+            mapping = {key: zlib.compress(value)}
+            if stored is None:
+                statuses = yield client.add_multi_async(mapping, namespace=self._namespace)
+            else:
+                statuses = yield client.cas_multi_async(mapping, namespace=self._namespace)
+            if (statuses or {}).get(key) == memcache.STORED:
+                raise ndb.Return(value)
+
+        raise Error("Could not update %s in memcache, as it kept changing" % key)
+
+
+class EmailIndex(object):
+    """A sharded map of email addresses to user ids and usernames.
+
+    Args:
+      storage: Where the index is kept. Defaults to a DatastoreStorage.
+      name: The name of the index, which prefixes the keys it is stored under.
+      num_shards: The number of shards to split the map into. This can't be changed without
+        rebuilding the index.
+      shard_cache_size: The number of shards to keep in memory.
+      shard_cache_ttl: The number of seconds to keep a shard in memory for.
+    """
+
+    def __init__(self, storage=None, name='default', num_shards=64, shard_cache_size=16,
+                 shard_cache_ttl=60, clock=time.time):
+        self._storage = storage or DatastoreStorage()
+        self._name = name
+        self._num_shards = num_shards
+        self._shards = cache.LRUCache(max_size=shard_cache_size, ttl=shard_cache_ttl, clock=clock)
+
+    @ndb.tasklet
+    def getMaxUserId(self):
+        """Returns the highest user id in the index, or None if the index has not been built."""
+        state = yield self._storage.get(self._stateKey())
+        raise ndb.Return(json.loads(state)['max_user_id'] if state is not None else None)
+
+    @ndb.tasklet
+    def lookup(self, user_email):
+        """Finds a user in the index.
+
+        Returns:
+          A dictionary containing the 'id', 'username' and 'email' of the user if the email is in
+          the index, None otherwise. Since the index may be missing recent users, None does not
+          mean that there is no such user.
+        """
+        key = user_email.lower()
+        shard = yield self._getShard(self._shardNumber(key))
+        if not shard or key not in shard:
+            raise ndb.Return(None)
+
+        user_id, username = shard[key]
+        raise ndb.Return({'id': user_id, 'username': username, 'email': user_email})
+
+    @ndb.tasklet
+    def update(self, users, max_user_id=None, replace=False):
+        """Adds users to the index, and records the highest user id it now covers.
+
+        Users already in the index under another email address are moved to the given one.
+
+        Args:
+          users: Dictionaries with the 'id', 'username' and 'email' of each user to add.
+          max_user_id: The highest user id the index covers once the users are added. If this is
+            None, the recorded id is left as it is.
+          replace: Whether to replace the whole index with the given users, rather than adding
+            them to it.
+        """
+        by_shard = {}
+        by_id_shard = {}
+        for user in users:
+            key = user['email'].lower()
+            by_shard.setdefault(self._shardNumber(key), {})[key] = (user['id'], user['username'])
+            by_id_shard.setdefault(self._idShardNumber(user['id']), {})[str(user['id'])] = key
+
+        # The previous addresses of users whose email changed, with their ids, by shard.
+        stale = {}
+
+        @ndb.tasklet
+        def updateIdShard(number):
+            moved = {}
+
+            def update(shard):
+                moved.clear()
+                if replace:
+                    shard = {}
+                for user_id, key in by_id_shard.get(number, {}).iteritems():
+                    previous = shard.get(user_id)
+                    if previous is not None and previous != key:
+                        moved[previous] = int(user_id)
+                shard.update(by_id_shard.get(number, {}))
+                return shard
+
+            yield self._updateShard(number, update, kind='ids')
+            for previous, user_id in moved.iteritems():
+                stale.setdefault(self._shardNumber(previous), {})[previous] = user_id
+
+        def updateShard(number):
+            def update(shard):
+                if replace:
+                    shard = {}
+                for key, user_id in stale.get(number, {}).iteritems():
+                    if key in shard and shard[key][0] == user_id:
+                        del shard[key]
+                shard.update(by_shard.get(number, {}))
+                return shard
+
+            return self._updateShard(number, update)
+
+        id_numbers = xrange(self._num_shards) if replace else sorted(by_id_shard)
+        yield [updateIdShard(number) for number in id_numbers]
+
+        numbers = xrange(self._num_shards) if replace else sorted(set(by_shard) | set(stale))
+        yield [updateShard(number) for number in numbers]
+        if max_user_id is not None:
+            def updateState(value):
+                # Another refresh may have recorded a higher id in the meantime.
+                if not replace and value is not None:
+                    if json.loads(value)['max_user_id'] >= max_user_id:
+                        return None
+                return json.dumps({'max_user_id': max_user_id})
+
+            yield self._storage.modify(self._stateKey(), updateState)
+
+    @ndb.tasklet
+    def remove(self, user_email):
+        """Removes an email address from the index, if present."""
+        key = user_email.lower()
+        removed = []
+
+        def update(shard):
+            del removed[:]
+            if key not in shard:
+                return None
+            removed.append(shard.pop(key)[0])
+            return shard
+
+        yield self._updateShard(self._shardNumber(key), update)
+        if removed:
+            yield self._removeId(removed[0], key)
+
+    @ndb.tasklet
+    def removeById(self, user_id):
+        """Removes a user from the index, whatever their email address, if present."""
+        id_shard = yield self._getShard(self._idShardNumber(user_id), kind='ids', use_cache=False)
+        key = (id_shard or {}).get(str(user_id))
+        if key is not None:
+            yield self.remove(key)
+
+    def _removeId(self, user_id, key):
+        def update(shard):
+            if shard.get(str(user_id)) != key:
+                return None
+            del shard[str(user_id)]
+            return shard
+
+        return self._updateShard(self._idShardNumber(user_id), update, kind='ids')
+
+    @ndb.tasklet
+    def _getShard(self, number, kind='shard', use_cache=True):
+        if use_cache:
+            shard = self._shards.get((kind, number))
+            if shard is not None:
+                raise ndb.Return(shard)
+
+        value = yield self._storage.get(self._shardKey(number, kind))
+        shard = json.loads(value) if value is not None else None
+        if shard is not None:
+            self._shards.set((kind, number), shard)
+        raise ndb.Return(shard)
+
+    @ndb.tasklet
+    def _updateShard(self, number, update, kind='shard'):
+        # Applies update(shard) to the stored shard atomically. `update` is given a copy of the
+        # shard (empty if there is none), and returns the new shard, or None to leave it as it is.
+        def apply(value):
+            shard = update(json.loads(value) if value is not None else {})
+            return json.dumps(shard, separators=(',', ':')) if shard is not None else None
+
+        value = yield self._storage.modify(self._shardKey(number, kind), apply)
+        if value is not None:
+            self._shards.set((kind, number), json.loads(value))
+
+    def _shardNumber(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return (zlib.crc32(key) & 0xffffffff) % self._num_shards
+
+    def _idShardNumber(self, user_id):
+        return int(user_id) % self._num_shards
+
+    def _shardKey(self, number, kind='shard'):
+        return '%s:%s:%d' % (self._name, kind, number)
+
+    def _stateKey(self):
+        return '%s:state' % self._name
@@ -0,0 +1,38 @@
+"""Naming of Discourse endpoints, for grouping requests by the endpoint they target"""
+
+import re
+
+_TEMPLATES = [
+    (re.compile(r'^admin/groups/\d+/members\.json$'), 'admin/groups/{id}/members.json'),
+    (re.compile(r'^admin/groups/\d+$'), 'admin/groups/{id}'),
+    (re.compile(r'^admin/users/list/[^/]+\.json$'), None),
+    (re.compile(r'^admin/users/[^/]+\.json$'), 'admin/users/{user}.json'),
+    (re.compile(r'^groups/[^/]+/members\.json$'), 'groups/{name}/members.json'),
+    (re.compile(r'^categories/[^/]+$'), 'categories/{slug}'),
+    (re.compile(r'^c/[^/]+/[^/]+\.json$'), 'c/{parent_id}/{id}.json'),
+    (re.compile(r'^c/[^/]+\.json$'), 'c/{id}.json'),
+    (re.compile(r'^t/\d+/last\.json$'), 't/{id}/last.json'),
+    (re.compile(r'^t/\d+\.json$'), 't/{id}.json'),
+]
+
+_NUMERIC_SEGMENT = re.compile(r'(?<=/)\d+(?=/|\.json$|$)|^\d+(?=/|\.json$|$)')
+
+
+def endpointTemplate(req_string):
+    """Returns the endpoint template for a request path.
+
+    Ids, names and slugs in the path are replaced with placeholders, so that requests to the same
+    endpoint share a template. For example, 'admin/groups/32/members.json' becomes
+    'admin/groups/{id}/members.json'.
+
+    Args:
+      req_string: The request path, relative to the Discourse URL and without a query string.
+
+    Returns:
+      The endpoint template as a string.
+    """
+    for pattern, template in _TEMPLATES:
+        if pattern.match(req_string):
+            return template or req_string
+
+    return _NUMERIC_SEGMENT.sub('{id}', req_string)
@@ -1,24 +1,319 @@
 """Gateway for accessing the Discourse API (for forums)"""
 
+import collections
 import json
 import re
+import threading
+import time
 
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 
+import jsonscan
+import models
+import tasklets
+import tracing
+
 
 class Error(Exception):
     pass
 
 
+class GroupIndex(object):
+    """An in-memory index of Discourse groups, keyed by both name and id.
+
+    The index is loaded from a full listing of admin/groups.json and is considered stale once
+    `ttl` seconds have passed since the last load. A lookup missing from a fresh index may reload
+    it once before it expires (see missReloadAllowed), so that repeated lookups of groups that
+    don't exist don't each reload the listing.
+    """
+
+    # The fields the index cannot do without.
+    KEY_FIELDS = frozenset(['id', 'name'])
+
+    def __init__(self, ttl=300, clock=time.time):
+        self._ttl = ttl
+        self._clock = clock
+        self._by_name = {}
+        self._by_id = {}
+        self._expires_at = 0
+        self._miss_reloaded = False
+
+    def isFresh(self):
+        """Whether the index has been loaded and has not yet expired."""
+        return self._clock() < self._expires_at
+
+    def load(self, groups):
+        """Replaces the contents of the index with the given list of groups."""
+        by_name = {}
+        by_id = {}
+        for group in groups:
+            by_name[group['name']] = group
+            by_id[group['id']] = group
+
+        self._by_name = by_name
+        self._by_id = by_id
+        self._expires_at = self._clock() + self._ttl
+        self._miss_reloaded = False
+
+    def missReloadAllowed(self):
+        """Whether a lookup missing from the index may reload it, which it may do once per load."""
+        return not self._miss_reloaded
+
+    def markMissReload(self):
+        """Records that the index was reloaded for a missing lookup."""
+        self._miss_reloaded = True
+
+    def invalidate(self):
+        """Marks the index as stale, so that the next lookup reloads it."""
+        self._expires_at = 0
+
+    def getByName(self, group_name):
+        return self._by_name.get(group_name)
+
+    def getById(self, group_id):
+        return self._by_id.get(group_id)
+
+    def put(self, group):
+        """Adds or replaces a single group in the index."""
+        previous = self._by_id.get(group['id'])
+        if previous is not None and previous['name'] != group['name']:
+            self._by_name.pop(previous['name'], None)
+
+        self._by_name[group['name']] = group
+        self._by_id[group['id']] = group
+
+    def remove(self, group):
+        """Removes a single group from the index, if present."""
+        self._by_name.pop(group['name'], None)
+        self._by_id.pop(group['id'], None)
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+class MembershipBatch(object):
+    """Buffers the membership changes made through a GroupClient, and applies them together.
+
+    A batch is started with GroupClient.batch, usually as a context manager:
+
+      with discourse_client.groups.batch():
+          futures = [discourse_client.groups.addUserByUsername(username, 'quarterbacks')
+                     for username in usernames]
+      results = [future.get_result() for future in futures]
+
+    While it is active in a thread, the single-user add and remove methods of the client buffer
+    their change instead of sending it, and return a future that resolves once the change has
+    been applied. Changes are applied when the batch is stopped, or in the background whenever
+    `max_size` changes are buffered. For each group and user, only the last change is applied
+    (the futures of the earlier ones share its result), all the users added to a group are sent
+    in as few members requests as possible, and removals are sent concurrently.
+
+    Users given by email, and users removed by id alongside other changes to the same group, are
+    looked up when the batch is applied, so that each user is recognized whichever way they were
+    given. Don't wait on the futures before the batch is stopped, since nothing is sent until
+    then; from a tasklet, stop it with stopAsync instead of leaving the `with` block.
+
+    Args:
+      group_client: The GroupClient whose changes are buffered.
+      max_size: The number of changes to buffer before applying them.
+      chunk_size: The maximum number of usernames to send in a single members request.
+      concurrency: The maximum number of requests to have in flight at once.
+    """
+
+    def __init__(self, group_client, max_size=200, chunk_size=200, concurrency=5):
+        self._client = group_client
+        self._max_size = max_size
+        self._chunk_size = chunk_size
+        self._concurrency = concurrency
+        self._pending = collections.OrderedDict()
+        self._size = 0
+        self._sequence = 0
+        self._flushes = []
+
+    def start(self):
+        self._client._local.batch = self
+
+    def stop(self):
+        """Stops buffering changes, and applies those that were buffered."""
+        self.stopAsync().get_result()
+
+    @ndb.tasklet
+    @tracing.propagated
+    def stopAsync(self):
+        """Stops buffering changes, and returns a future for applying those that were buffered."""
+        if getattr(self._client._local, 'batch', None) is self:
+            self._client._local.batch = None
+        yield self.flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add(self, group_name, username=None, user_email=None):
+        """Buffers the addition of a user, given by username or email, to a group.
+
+        Returns:
+          A future resolving to the response of the members request that added the user.
+        """
+        if username is not None:
+            return self._buffer(group_name, 'add', 'username', username)
+        return self._buffer(group_name, 'add', 'email', user_email)
+
+    def remove(self, group_name, username=None, user_email=None, user_id=None):
+        """Buffers the removal of a user, given by username, email or id, from a group.
+
+        Returns:
+          A future resolving to the response of the request that removed the user.
+        """
+        if username is not None:
+            return self._buffer(group_name, 'remove', 'username', username)
+        if user_email is not None:
+            return self._buffer(group_name, 'remove', 'email', user_email)
+        return self._buffer(group_name, 'remove', 'id', user_id)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def flush(self):
+        """Applies the buffered changes, and waits for any flush already under way."""
+        pending = self._takePending()
+        flushes, self._flushes = self._flushes, []
+        yield [self._flushPending(pending)] + flushes
+
+    def _takePending(self):
+        pending, self._pending = self._pending, collections.OrderedDict()
+        self._size = 0
+        return pending
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _flushPending(self, pending):
+        yield [self._flushGroup(group_name, changes.values())
+               for group_name, changes in pending.items()]
+
+    def _buffer(self, group_name, op, kind, value):
+        key = (kind, value.lower() if isinstance(value, basestring) else value)
+        changes = self._pending.setdefault(group_name, collections.OrderedDict())
+        change = changes.get(key)
+        if change is None:
+            change = changes[key] = {'kind': kind, 'value': value, 'futures': []}
+            self._size += 1
+
+        future = ndb.Future()
+        self._sequence += 1
+        change.update(op=op, sequence=self._sequence)
+        change['futures'].append(future)
+
+        if self._size >= self._max_size:
+            # Only the changes buffered so far are applied, so that the flush doesn't wait on
+            # itself along with the flushes already under way.
+            self._flushes.append(self._flushPending(self._takePending()))
+        return future
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _flushGroup(self, group_name, changes):
+        # Users given by email are resolved to a username and id, and removals by username to an
+        # id, since that is what Discourse takes. Removals by id are resolved to a username if
+        # the same user may also have been given by username or email.
+        users = self._client._user_client
+        by_name = any(change['kind'] != 'id' for change in changes)
+        unresolved = [change for change in changes
+                      if change['kind'] == 'email' or
+                      (change['kind'] == 'username' and change['op'] == 'remove') or
+                      (change['kind'] == 'id' and by_name)]
+
+        def resolve(change):
+            if change['kind'] == 'email':
+                return tasklets.collectResult(users.getByEmail(change['value'], identity_only=True))
+            if change['kind'] == 'id':
+                return tasklets.collectResult(users.getById(change['value']))
+            return tasklets.collectResult(users.getByUsername(change['value']))
+
+        lookups = yield tasklets.boundedMap(resolve, unresolved, self._concurrency)
+        unresolved_ids = set(id(change) for change in unresolved)
+        resolved = {}
+        for change, lookup in zip(unresolved, lookups):
+            if not lookup['success']:
+                _fail(change['futures'], Error(lookup['error']))
+            elif not lookup['result']:
+                _fail(change['futures'], Error(
+                    "Unable to find user with %s %s" % (change['kind'], change['value'])))
+            else:
+                resolved[id(change)] = lookup['result']
+
+        # Only the last change of each user is applied.
+        latest = collections.OrderedDict()
+        for change in sorted(changes, key=lambda change: change['sequence']):
+            if id(change) in resolved:
+                key = resolved[id(change)]['username'].lower()
+            elif id(change) in unresolved_ids:
+                continue
+            elif change['kind'] == 'username':
+                key = change['value'].lower()
+            else:
+                key = change['value']
+
+            previous = latest.pop(key, None)
+            if previous is not None:
+                change['futures'][:0] = previous['futures']
+            latest[key] = change
+
+        adds = [change for change in latest.values() if change['op'] == 'add']
+        removes = [change for change in latest.values() if change['op'] == 'remove']
+        if adds:
+            usernames = [resolved[id(change)]['username'] if id(change) in resolved
+                         else change['value'] for change in adds]
+            outcomes = yield tasklets.collectResult(self._client.addUsersByUsername(
+                usernames, group_name, chunk_size=self._chunk_size,
+                concurrency=self._concurrency))
+            _settle(adds, usernames, outcomes)
+
+        if removes:
+            user_ids = [resolved[id(change)]['id'] if id(change) in resolved
+                        else change['value'] for change in removes]
+            outcomes = yield tasklets.collectResult(self._client.removeUsersById(
+                user_ids, group_name, concurrency=self._concurrency))
+            _settle(removes, user_ids, outcomes)
+
+
 class GroupClient(object):
-    """An API client for interacting with Discourse for group-related actions"""
+    """An API client for interacting with Discourse for group-related actions
+
+    Group lookups are answered from a GroupIndex, kept for `index_ttl` seconds. If `index_ttl` is
+    0, the index is disabled, and each lookup instead scans the group listing for the first
+    matching group without decoding the rest of it. If `index_fields` is given, the index keeps
+    only those fields of each group (along with its id and name), and lookups return only them.
+
+    If a `mirror` (a mirror.Mirror) is given, lookups and membership checks are answered from it
+    first, and groups created or deleted, and members added or removed, through this client are
+    written through to it.
 
-    def __init__(self, api_client, user_client):
+    Membership changes can be buffered and applied together with `batch`.
+    """
+
+    def __init__(self, api_client, user_client, index_ttl=300, index_fields=None, mirror=None):
         self._api_client = api_client
         self._user_client = user_client
+        self._mirror = mirror
+        self._index = GroupIndex(ttl=index_ttl)
+        self._index_enabled = index_ttl > 0
+        self._index_fields = jsonscan.combineFields(index_fields, GroupIndex.KEY_FIELDS)
+        self._local = threading.local()
+
+    def batch(self, max_size=200, chunk_size=200, concurrency=5):
+        """Returns a MembershipBatch buffering the membership changes made in this thread.
+
+        Use it as a context manager; the buffered changes are applied when it exits. See
+        MembershipBatch for the arguments.
+        """
+        return MembershipBatch(self, max_size=max_size, chunk_size=chunk_size,
+                               concurrency=concurrency)
 
     @ndb.tasklet
+    @tracing.traced
     def addUserByEmail(self, user_email, group_name):
         """Adds the given account to the Discourse group with the given name.
 
@@ -37,7 +332,12 @@ class GroupClient(object):
           Error: If the user or group was not found.
         """
 
-        user = yield self._user_client.getByEmail(user_email)
+        batch = self._activeBatch()
+        if batch is not None:
+            result = yield batch.add(group_name, user_email=user_email)
+            raise ndb.Return(result)
+
+        user = yield self._user_client.getByEmail(user_email, identity_only=True)
         if not user:
             raise Error("Unable to find user with email %s" % user_email)
 
@@ -45,6 +345,7 @@ class GroupClient(object):
         raise ndb.Return(result)
 
     @ndb.tasklet
+    @tracing.traced
     def addUserByUsername(self, username, group_name):
         """Adds the given account to the Discourse group with the given name
 
@@ -60,6 +361,11 @@ class GroupClient(object):
           Error: If the user or group was not found.
         """
 
+        batch = self._activeBatch()
+        if batch is not None:
+            result = yield batch.add(group_name, username=username)
+            raise ndb.Return(result)
+
         group = yield self.getByName(group_name)
         if not group:
             raise Error("Group named %s not found" % group_name)
@@ -71,9 +377,57 @@ class GroupClient(object):
         result = yield self._api_client.putRequest(
             'admin/groups/%s/members.json' % group['id'], payload=payload
         )
+        if self._mirror is not None:
+            yield self._mirror.addMembers(group, [username])
         raise ndb.Return(result)
 
     @ndb.tasklet
+    @tracing.traced
+    def addUsersByUsername(self, usernames, group_name, chunk_size=200, concurrency=5):
+        """Adds many accounts to the Discourse group with the given name.
+
+        The group is looked up once, and the usernames are sent in chunks of up to `chunk_size`
+        per members request.
+
+        Args:
+          usernames: Usernames of the users to add.
+          group_name: Name of the group to which we want to add the users.
+          chunk_size: The maximum number of usernames to send in a single request.
+          concurrency: The maximum number of requests to have in flight at once.
+
+        Returns:
+          A dictionary mapping each username to a dictionary with the key 'success' set to True if
+          the request adding it succeeded, or set to False and 'error' describing the failure.
+
+        Raises:
+          Error: If the group was not found.
+        """
+        group = yield self.getByName(group_name)
+        if not group:
+            raise Error("Group named %s not found" % group_name)
+
+        usernames = list(collections.OrderedDict.fromkeys(usernames))
+        chunks = [usernames[i:i + chunk_size] for i in xrange(0, len(usernames), chunk_size)]
+
+        def addChunk(chunk):
+            return tasklets.collectResult(self._api_client.putRequest(
+                'admin/groups/%s/members.json' % group['id'],
+                payload={'usernames': ','.join(chunk)}
+            ))
+
+        outcomes = yield tasklets.boundedMap(addChunk, chunks, concurrency)
+
+        results = {}
+        for chunk, outcome in zip(chunks, outcomes):
+            for username in chunk:
+                results[username] = outcome
+        if self._mirror is not None:
+            yield self._mirror.addMembers(
+                group, [username for username in usernames if results[username]['success']])
+        raise ndb.Return(results)
+
+    @ndb.tasklet
+    @tracing.traced
     def removeUserByEmail(self, user_email, group_name):
         """Removes an account from a group
 
@@ -92,7 +446,12 @@ class GroupClient(object):
           Error: If the user or group was not found.
         """
 
-        user = yield self._user_client.getByEmail(user_email)
+        batch = self._activeBatch()
+        if batch is not None:
+            result = yield batch.remove(group_name, user_email=user_email)
+            raise ndb.Return(result)
+
+        user = yield self._user_client.getByEmail(user_email, identity_only=True)
         if not user:
             raise Error("Unable to find user with email %s" % user_email)
 
@@ -100,6 +459,7 @@ class GroupClient(object):
         raise ndb.Return(result)
 
     @ndb.tasklet
+    @tracing.traced
     def removeUserByUsername(self, username, group_name):
         """Removes the given account from the Discourse group with the given name
 
@@ -115,6 +475,11 @@ class GroupClient(object):
           Error: If the user or group was not found.
         """
 
+        batch = self._activeBatch()
+        if batch is not None:
+            result = yield batch.remove(group_name, username=username)
+            raise ndb.Return(result)
+
         user = yield self._user_client.getByUsername(username)
         if not user:
             raise Error("Unable to find user with username %s" % username)
@@ -123,6 +488,7 @@ class GroupClient(object):
         raise ndb.Return(result)
 
     @ndb.tasklet
+    @tracing.traced
     def removeUserById(self, user_id, group_name):
         """Removes the given account from the Discourse group with the given name
 
@@ -138,6 +504,11 @@ class GroupClient(object):
           Error: If the user or group was not found.
         """
 
+        batch = self._activeBatch()
+        if batch is not None:
+            result = yield batch.remove(group_name, user_id=user_id)
+            raise ndb.Return(result)
+
         group = yield self.getByName(group_name)
         if not group:
             raise Error("Group named %s not found" % group_name)
@@ -146,9 +517,50 @@ class GroupClient(object):
             'admin/groups/%s/members.json' % group['id'],
             params={'user_id': user_id}
         )
+        if self._mirror is not None:
+            yield self._mirror.removeMembers(group, [user_id])
         raise ndb.Return(result)
 
     @ndb.tasklet
+    @tracing.traced
+    def removeUsersById(self, user_ids, group_name, concurrency=10):
+        """Removes many accounts from the Discourse group with the given name.
+
+        The group is looked up once. Discourse removes members one at a time, so the removals
+        are sent concurrently, with at most `concurrency` requests in flight.
+
+        Args:
+          user_ids: Ids of the users to remove.
+          group_name: Name of the group from which we want to remove the users.
+          concurrency: The maximum number of requests to have in flight at once.
+
+        Returns:
+          A dictionary mapping each user id to a dictionary with the key 'success' set to True if
+          the user was removed, or set to False and 'error' describing the failure.
+
+        Raises:
+          Error: If the group was not found.
+        """
+        group = yield self.getByName(group_name)
+        if not group:
+            raise Error("Group named %s not found" % group_name)
+
+        user_ids = list(collections.OrderedDict.fromkeys(user_ids))
+
+        def removeUser(user_id):
+            return tasklets.collectResult(self._api_client.deleteRequest(
+                'admin/groups/%s/members.json' % group['id'],
+                params={'user_id': user_id}
+            ))
+
+        outcomes = yield tasklets.boundedMap(removeUser, user_ids, concurrency)
+        if self._mirror is not None:
+            yield self._mirror.removeMembers(group, [
+                user_id for user_id, outcome in zip(user_ids, outcomes) if outcome['success']])
+        raise ndb.Return(dict(zip(user_ids, outcomes)))
+
+    @ndb.tasklet
+    @tracing.traced
     def create(self, group_name, strict=False, **kwargs):
         """Creates a group with the given name on Discourse.
 
@@ -181,9 +593,18 @@ class GroupClient(object):
             payload[k] = v
 
         response = yield self._api_client.postRequest('admin/groups', payload=payload)
+
+        if response and response.get('basic_group'):
+            self._index.put(jsonscan.pickEach([response['basic_group']], self._index_fields)[0])
+            if self._mirror is not None:
+                yield self._mirror.putGroup(response['basic_group'])
+        else:
+            self._index.invalidate()
+
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.traced
     def delete(self, group_name, strict=False):
         """Delete a group.
 
@@ -207,12 +628,22 @@ class GroupClient(object):
                 raise Error("Could not find group with name %s" % group_name)
 
         response = yield self._api_client.deleteRequest('admin/groups/%s' % group['id'])
+        self._index.remove(group)
+        if self._mirror is not None:
+            yield self._mirror.removeGroup(group)
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.traced
     def getByName(self, group_name):
         """Finds the Discourse group with the given name.
 
+        Lookups are answered from the group index while it is fresh, then from the mirror, if
+        any, and then from the group index again, which is reloaded when it has expired. A group
+        missing from an index that was not just reloaded triggers one reload, so that groups
+        created outside of this client are still found, but no more than one such reload happens
+        before the index expires.
+
         Args:
           group_name: The name of the group to find.
 
@@ -220,27 +651,361 @@ class GroupClient(object):
           A dictionary containing information about the group if the group is successfully found,
           None otherwise
         """
-        groups = yield self._api_client.getRequest('admin/groups.json')
+        group = self._freshIndexLookup('name', group_name)
+        if group is None and self._mirror is not None:
+            group = yield self._mirror.getGroupByName(group_name)
+        if group is None:
+            group = yield self._lookup('name', group_name)
+        raise ndb.Return(group)
 
-        for group in groups:
-            if group['name'] == group_name:
-                raise ndb.Return(group)
+    @ndb.tasklet
+    @tracing.traced
+    def getById(self, group_id):
+        """Finds the Discourse group with the given id.
 
-        raise ndb.Return(None)
+        Args:
+          group_id: The id of the group to find.
+
+        Returns:
+          A dictionary containing information about the group if the group is successfully found,
+          None otherwise
+        """
+        group = self._freshIndexLookup('id', group_id)
+        if group is None and self._mirror is not None:
+            group = yield self._mirror.getGroupById(group_id)
+        if group is None:
+            group = yield self._lookup('id', group_id)
+        raise ndb.Return(group)
 
     @ndb.tasklet
-    def getMembers(self, group_name, limit=50, offset=0):
+    @tracing.traced
+    def isMember(self, username, group_name):
+        """Checks whether a user is a member of the Discourse group with the given name.
+
+        The check is answered from the mirror if it has the members of the group, and otherwise
+        from the groups listed in the user's record.
+
+        Args:
+          username: The username of the user.
+          group_name: The name of the group.
+
+        Returns:
+          True if the user is a member of the group, False otherwise.
+        """
+        if self._mirror is not None:
+            is_member = yield self._mirror.isMember(username, group_name)
+            if is_member is not None:
+                raise ndb.Return(is_member)
+
+        user = yield self._user_client.getByUsername(username)
+        raise ndb.Return(bool(user) and any(
+            group['name'] == group_name for group in user.get('groups', [])))
+
+    @ndb.tasklet
+    @tracing.traced
+    def getAllGroups(self, as_models=False, fields=None):
+        """Gets a list of all Discourse groups
+
+        The group index is reloaded from the result as a side effect, unless `fields` leaves out
+        some of the fields the index keeps.
+
+        Args:
+          as_models: Whether to return models.Group objects instead of dictionaries.
+          fields: The fields to keep of each group, or None to keep all of them (or, with
+            `as_models`, those of models.Group). Other fields are dropped as the listing is
+            decoded.
+
+        Returns:
+          A list of groups
+        """
+        if as_models and fields is None:
+            fields = models.Group.fields
+        decode_fields = jsonscan.combineFields(fields, self._index_fields)
+        if decode_fields is None and fields is not None:
+            # The index keeps whole groups, so it can't be reloaded from a projected listing.
+            decode_fields = frozenset(fields)
+        decoder = None
+        if decode_fields is not None:
+            decoder = jsonscan.Projection(decode_fields)
+
+        groups = yield self._api_client.getRequest('admin/groups.json', decoder=decoder)
+        if decode_fields is None or self._index_fields is not None:
+            self._index.load(jsonscan.pickEach(groups, self._index_fields, decode_fields))
+
+        groups = jsonscan.pickEach(groups, fields, decode_fields)
+        raise ndb.Return(models.Group.fromList(groups) if as_models else groups)
+
+    @ndb.tasklet
+    @tracing.traced
+    def refreshIndex(self):
+        """Reloads the group index from Discourse.
+
+        Returns:
+          The refreshed GroupIndex.
+        """
+        yield self.getAllGroups()
+        raise ndb.Return(self._index)
+
+    def invalidateIndex(self):
+        """Marks the group index as stale, so that the next lookup reloads it."""
+        self._index.invalidate()
+
+    @ndb.tasklet
+    def updateCached(self, group):
+        """Adds or replaces a group in the index and the mirror, after it changed on Discourse."""
+        self._index.put(jsonscan.pickEach([group], self._index_fields)[0])
+        if self._mirror is not None:
+            yield self._mirror.putGroup(group)
+
+    @ndb.tasklet
+    def removeCached(self, group):
+        """Removes a group from the index and the mirror, after it was deleted on Discourse."""
+        self._index.remove(group)
+        if self._mirror is not None:
+            yield self._mirror.removeGroup(group)
+
+    def _activeBatch(self):
+        return getattr(self._local, 'batch', None)
+
+    def _freshIndexLookup(self, field, key):
+        # Answers a lookup from memory if the index is fresh, without reloading it.
+        if not self._index_enabled or not self._index.isFresh():
+            return None
+        if field == 'name':
+            return self._index.getByName(key)
+        return self._index.getById(key)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _lookup(self, field, key):
+        if not self._index_enabled:
+            group = yield self._api_client.getRequest(
+                'admin/groups.json', decoder=jsonscan.Match(field, key))
+            raise ndb.Return(group)
+
+        find = self._index.getByName if field == 'name' else self._index.getById
+        refreshed = False
+        if not self._index.isFresh():
+            yield self.refreshIndex()
+            refreshed = True
+
+        group = find(key)
+        if group is None and not refreshed and self._index.missReloadAllowed():
+            yield self.refreshIndex()
+            self._index.markMissReload()
+            group = find(key)
+
+        raise ndb.Return(group)
+
+    @ndb.tasklet
+    @tracing.traced
+    def getMembers(self, group_name, limit=50, offset=0, as_models=False, fields=None):
         """Finds and returns the members of the given Discourse group.
 
         Args:
           group_name: The name of the group from which to retrieve members.
+          as_models: Whether to list the members as models.Member objects instead of
+            dictionaries.
+          fields: The fields to keep of each member, or None to keep all of them (or, with
+            `as_models`, those of models.Member). Other fields are dropped as the response is
+            decoded.
 
         Returns:
           An object containing a list of members in the group, and a "meta" object with the total
           number of members in the group, the limit, and the offset.
         """
+        if as_models and fields is None:
+            fields = models.Member.fields
+        decoder = None
+        if fields is not None:
+            decoder = jsonscan.Projection(fields, ('members',))
+
         response = yield self._api_client.getRequest(
             'groups/%s/members.json' % group_name,
-            params={'limit': limit, 'offset': offset}
+            params={'limit': limit, 'offset': offset},
+            decoder=decoder
         )
+        if as_models:
+            response = dict(response, members=models.Member.fromList(response['members']))
         raise ndb.Return(response)
+
+    @ndb.tasklet
+    @tracing.traced
+    def getAllMembers(self, group_name, page_size=50, concurrency=10, as_models=False,
+                      fields=None):
+        """Finds and returns every member of the given Discourse group.
+
+        The first page is read to learn the total number of members, and the remaining pages are
+        then fetched concurrently.
+
+        Args:
+          group_name: The name of the group from which to retrieve members.
+          page_size: The number of members to read per request.
+          concurrency: The maximum number of requests to have in flight at once.
+          as_models: Whether to return models.Member objects instead of dictionaries.
+          fields: The fields to keep of each member, or None to keep all of them.
+
+        Returns:
+          A list of the members in the group, in the order Discourse lists them.
+        """
+        if as_models and fields is None:
+            fields = models.Member.fields
+        pages = {}
+
+        def onPage(offset, members):
+            pages[offset] = models.Member.fromList(members) if as_models else members
+
+        yield self._fetchMemberPages(group_name, page_size, concurrency, fields, onPage)
+
+        members = []
+        for offset in sorted(pages):
+            members.extend(pages[offset])
+        raise ndb.Return(members)
+
+    def iterMembers(self, group_name, page_size=50, concurrency=10, as_models=False,
+                    fields=None):
+        """Streams the members of the given Discourse group, one page at a time.
+
+        Pages are fetched the same way as in getAllMembers, and handed out in the order they
+        arrive. For example:
+
+          pages = groups.iterMembers('quarterbacks')
+          while True:
+              try:
+                  members = yield pages.getq()
+              except EOFError:
+                  break
+
+        Args:
+          group_name: The name of the group from which to retrieve members.
+          page_size: The number of members to read per request.
+          concurrency: The maximum number of requests to have in flight at once.
+          as_models: Whether to produce models.Member objects instead of dictionaries.
+          fields: The fields to keep of each member, or None to keep all of them.
+
+        Returns:
+          An ndb.QueueFuture producing a list of members for each page.
+        """
+        if as_models and fields is None:
+            fields = models.Member.fields
+        queue = ndb.QueueFuture()
+
+        def onPage(offset, members):
+            queue.putq(models.Member.fromList(members) if as_models else members)
+
+        pages = self._fetchMemberPages(group_name, page_size, concurrency, fields, onPage)
+
+        def finish():
+            if pages.get_exception() is not None:
+                queue.set_exception(pages.get_exception(), pages.get_traceback())
+            else:
+                queue.complete()
+
+        pages.add_immediate_callback(finish)
+        return queue
+
+    @ndb.tasklet
+    @tracing.traced
+    def syncMembers(self, group_name, desired_usernames, remove=True, page_size=50, chunk_size=200,
+                    concurrency=10):
+        """Makes the membership of a Discourse group match the given usernames.
+
+        The current members are read page by page and compared to the desired usernames
+        (ignoring case), and only the differences are sent to Discourse.
+
+        Args:
+          group_name: Name of the group to synchronize.
+          desired_usernames: Usernames of all the users who should be in the group.
+          remove: Whether to remove members who are not in `desired_usernames`. If this is False,
+            missing users are only added.
+          page_size: The number of members to read per request.
+          chunk_size: The maximum number of usernames to add in a single request.
+          concurrency: The maximum number of requests to have in flight at once.
+
+        Returns:
+          A dictionary with the keys 'added' and 'removed' set to lists of the usernames that were
+          added and removed, 'failed' set to a dictionary mapping usernames to the error that
+          prevented their change, and 'unchanged' set to the number of members left as they were.
+
+        Raises:
+          Error: If the group was not found.
+        """
+        members = yield self.getAllMembers(
+            group_name, page_size=page_size, concurrency=concurrency, fields=('id', 'username'))
+
+        current = dict((member['username'].lower(), member) for member in members)
+        desired = collections.OrderedDict(
+            (username.lower(), username) for username in desired_usernames)
+
+        to_add = [username for key, username in desired.iteritems() if key not in current]
+        to_remove = []
+        if remove:
+            to_remove = [member for key, member in current.iteritems() if key not in desired]
+
+        add_future = tasklets.completed({})
+        if to_add:
+            add_future = self.addUsersByUsername(
+                to_add, group_name, chunk_size=chunk_size, concurrency=concurrency)
+
+        remove_future = tasklets.completed({})
+        if to_remove:
+            remove_future = self.removeUsersById(
+                [member['id'] for member in to_remove], group_name, concurrency=concurrency)
+
+        add_results, remove_results = yield add_future, remove_future
+
+        report = {
+            'added': [],
+            'removed': [],
+            'failed': {},
+            'unchanged': len(current) - len(to_remove)
+        }
+
+        for username in to_add:
+            outcome = add_results[username]
+            if outcome['success']:
+                report['added'].append(username)
+            else:
+                report['failed'][username] = outcome['error']
+
+        for member in to_remove:
+            outcome = remove_results[member['id']]
+            if outcome['success']:
+                report['removed'].append(member['username'])
+            else:
+                report['failed'][member['username']] = outcome['error']
+
+        raise ndb.Return(report)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _fetchMemberPages(self, group_name, page_size, concurrency, fields, on_page):
+        first_page = yield self.getMembers(group_name, limit=page_size, offset=0, fields=fields)
+        on_page(0, first_page['members'])
+
+        @ndb.tasklet
+        @tracing.propagated
+        def fetchPage(offset):
+            page = yield self.getMembers(
+                group_name, limit=page_size, offset=offset, fields=fields)
+            on_page(offset, page['members'])
+
+        offsets = range(page_size, first_page['meta']['total'], page_size)
+        yield tasklets.boundedMap(fetchPage, offsets, concurrency)
+
+
+def _settle(changes, keys, outcomes):
+    # Resolves the futures of each change from the outcome of the bulk request that applied it.
+    for change, key in zip(changes, keys):
+        if not outcomes['success']:
+            _fail(change['futures'], Error(outcomes['error']))
+        elif not outcomes['result'][key]['success']:
+            _fail(change['futures'], Error(outcomes['result'][key]['error']))
+        else:
+            for future in change['futures']:
+                future.set_result(outcomes['result'][key]['result'])
+
+
+def _fail(futures, error):
+    for future in futures:
+        future.set_exception(error)
@@ -0,0 +1,245 @@
+"""Incremental decoding of JSON arrays, one element at a time.
+
+Lookups such as finding a group by name only need a single element of a listing. Decoding the
+whole listing with json.loads builds every element before the first one can be looked at; the
+functions here instead decode one element at a time, hand it to the caller, and move on, so that
+elements that are not kept can be freed right away and the scan can stop at the first match.
+
+Similarly, projectArray reduces each element of a listing to a few fields as it is decoded, so
+that only the projected listing is ever kept.
+"""
+
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+class Error(ValueError):
+    """Raised for malformed JSON, like json.loads does, or for a missing array."""
+
+
+def iterArray(content, path=()):
+    """Yields the elements of a JSON array, decoding them one at a time.
+
+    Args:
+      content: A JSON document.
+      path: The keys leading from the top-level object of the document to the array. If this is
+        empty, the document itself must be an array.
+
+    Raises:
+      Error: If the document does not have an array at the given path.
+    """
+    idx = _seek(content, _skipWhitespace(content, 0), path)
+    idx = _expect(content, idx, '[')
+    if _peek(content, idx) == ']':
+        return
+
+    while True:
+        element, idx = _decode(content, idx)
+        yield element
+
+        idx = _skipWhitespace(content, idx)
+        char = _peek(content, idx)
+        if char == ']':
+            return
+        if char != ',':
+            raise Error("Expected ',' or ']' at position %d" % idx)
+        idx = _skipWhitespace(content, idx + 1)
+
+
+def findFirst(content, predicate, path=()):
+    """Returns the first element of a JSON array for which `predicate` is true, or None.
+
+    Elements after the match are not decoded at all. See iterArray for the arguments.
+    """
+    for element in iterArray(content, path):
+        if predicate(element):
+            return element
+    return None
+
+
+def projectArray(content, fields, path=()):
+    """Decodes a JSON document, keeping only some fields of each element of one of its arrays.
+
+    Each element of the array is reduced to the given fields as soon as it is decoded, so the
+    full elements are never all held at once. The rest of the document is decoded as usual.
+
+    Args:
+      content: A JSON document.
+      fields: The keys to keep in each element of the array.
+      path: The keys leading from the top-level object of the document to the array.
+
+    Raises:
+      Error: If the document does not have an array at the given path.
+    """
+    value, idx = _project(content, _skipWhitespace(content, 0), fields, tuple(path))
+    if idx != len(content):
+        raise Error("Extra data at position %d" % idx)
+    return value
+
+
+def pick(item, fields):
+    """Returns a dictionary with only the given keys of `item`, where present."""
+    return dict((field, item[field]) for field in fields if field in item)
+
+
+def pickEach(items, fields, projected=None):
+    """Returns the items reduced to the given fields, or as they are if `fields` is None.
+
+    If the items were already projected onto exactly these fields (`projected`), they are returned
+    as they are.
+    """
+    if fields is None or frozenset(fields) == projected:
+        return items
+    return [pick(item, fields) for item in items]
+
+
+def combineFields(*field_lists):
+    """Returns the union of the given lists of fields, or None (all fields) if any of them is."""
+    if any(fields is None for fields in field_lists):
+        return None
+    return frozenset().union(*field_lists)
+
+
+class Projection(object):
+    """A response decoder (see DiscourseAPIClient.getRequest) calling projectArray.
+
+    Projections of the same fields and path compare equal, so that identical requests made at
+    the same time can still share a single response.
+    """
+
+    def __init__(self, fields, path=()):
+        self.fields = frozenset(fields)
+        self.path = tuple(path)
+
+    def __call__(self, content):
+        return projectArray(content, self.fields, self.path)
+
+    def __eq__(self, other):
+        return (isinstance(other, Projection) and
+                (self.fields, self.path) == (other.fields, other.path))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.fields, self.path))
+
+
+class Match(object):
+    """A response decoder calling findFirst, for the first element whose `field` is `value`.
+
+    Like projections, matches of the same field, value and path compare equal.
+    """
+
+    def __init__(self, field, value, path=()):
+        self.field = field
+        self.value = value
+        self.path = tuple(path)
+
+    def __call__(self, content):
+        return findFirst(content, lambda element: element[self.field] == self.value, self.path)
+
+    def __eq__(self, other):
+        return (isinstance(other, Match) and
+                (self.field, self.value, self.path) == (other.field, other.value, other.path))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.field, self.value, self.path))
+
+
+def _project(content, idx, fields, path):
+    if not path:
+        elements = []
+        idx = _expect(content, idx, '[')
+        if _peek(content, idx) == ']':
+            return elements, _skipWhitespace(content, idx + 1)
+
+        while True:
+            element, idx = _decode(content, idx)
+            elements.append(pick(element, fields))
+
+            idx = _skipWhitespace(content, idx)
+            char = _peek(content, idx)
+            if char == ']':
+                return elements, _skipWhitespace(content, idx + 1)
+            if char != ',':
+                raise Error("Expected ',' or ']' at position %d" % idx)
+            idx = _skipWhitespace(content, idx + 1)
+
+    result = {}
+    idx = _expect(content, idx, '{')
+    while _peek(content, idx) != '}':
+        if _peek(content, idx) != '"':
+            raise Error("Expected a key at position %d" % idx)
+        key, idx = _decode(content, idx)
+        idx = _expect(content, _skipWhitespace(content, idx), ':')
+        if key == path[0]:
+            result[key], idx = _project(content, idx, fields, path[1:])
+        else:
+            result[key], idx = _decode(content, idx)
+        idx = _skipMemberSeparator(content, idx)
+
+    idx = _expect(content, idx, '}')
+    if path[0] not in result:
+        raise Error("Key %r not found" % path[0])
+    return result, idx
+
+
+def _seek(content, idx, path):
+    for key in path:
+        idx = _expect(content, idx, '{')
+        while True:
+            if _peek(content, idx) != '"':
+                raise Error("Key %r not found" % key)
+
+            name, idx = _decode(content, idx)
+            idx = _expect(content, _skipWhitespace(content, idx), ':')
+            if name == key:
+                break
+
+            # Skip over the value of any other key.
+            _, idx = _decode(content, idx)
+            idx = _skipMemberSeparator(content, idx)
+
+    return idx
+
+
+def _skipMemberSeparator(content, idx):
+    # Skips the comma after an object member, if another member follows it.
+    idx = _skipWhitespace(content, idx)
+    char = _peek(content, idx)
+    if char == '}':
+        return idx
+    if char != ',':
+        raise Error("Expected ',' or '}' at position %d" % idx)
+    idx = _skipWhitespace(content, idx + 1)
+    if _peek(content, idx) != '"':
+        raise Error("Expected a key at position %d" % idx)
+    return idx
+
+
+def _decode(content, idx):
+    try:
+        return _DECODER.raw_decode(content, idx)
+    except ValueError as e:
+        raise Error(str(e))
+
+
+def _expect(content, idx, char):
+    if _peek(content, idx) != char:
+        raise Error("Expected %r at position %d" % (char, idx))
+    return _skipWhitespace(content, idx + 1)
+
+
+def _peek(content, idx):
+    return content[idx:idx + 1]
+
+
+def _skipWhitespace(content, idx):
+    return _WHITESPACE.match(content, idx).end()
@@ -0,0 +1,128 @@
+"""Per-endpoint request metrics for the Discourse API client"""
+
+import copy
+import logging
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets. Latencies above the last bound are
+# counted in an extra overflow bucket.
+LATENCY_BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics(object):
+    """Records request counts, errors, latencies and sizes per method and endpoint template.
+
+    Endpoints are named by their template (see endpoints.endpointTemplate), so requests for
+    different ids share their statistics. Every recorded request is also passed to each sink, as
+    a dictionary with the keys 'method', 'endpoint', 'status_code' (None if no response was
+    received), 'error', 'latency', 'request_bytes' and 'response_bytes'. A sink raising an
+    exception is logged, and doesn't fail the request.
+    """
+
+    def __init__(self, latency_bounds=LATENCY_BOUNDS, sinks=None):
+        self._latency_bounds = tuple(latency_bounds)
+        self._sinks = list(sinks or [])
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def addSink(self, sink):
+        """Adds a callable to be given a dictionary describing each recorded request."""
+        self._sinks.append(sink)
+
+    def record(self, method, endpoint, latency, status_code=None, error=False, request_bytes=0,
+               response_bytes=0):
+        """Records a single HTTP exchange.
+
+        Args:
+          method: The HTTP method of the request.
+          endpoint: The endpoint template of the request.
+          latency: The number of seconds from sending the request to receiving the response.
+          status_code: The status code of the response, or None if the request failed outright.
+          error: Whether the exchange counts as an error.
+          request_bytes: The size of the request URL and body.
+          response_bytes: The size of the response body, as received.
+        """
+        with self._lock:
+            stats = self._endpointStats(method, endpoint)
+            stats['requests'] += 1
+            if error:
+                stats['errors'] += 1
+            stats['latency_sum'] += latency
+            stats['latency_histogram'][self._bucketIndex(latency)] += 1
+            stats['request_bytes'] += request_bytes
+            stats['response_bytes'] += response_bytes
+
+        record = {
+            'method': method,
+            'endpoint': endpoint,
+            'status_code': status_code,
+            'error': error,
+            'latency': latency,
+            'request_bytes': request_bytes,
+            'response_bytes': response_bytes
+        }
+        for sink in self._sinks:
+            try:
+                sink(record)
+            except Exception:
+                logging.exception('Metrics sink %r failed', sink)
+
+    def recordDecoded(self, method, endpoint, decoded_bytes, wire_bytes=0):
+        """Records the size of a response body, as received and after decompression."""
+        with self._lock:
+            stats = self._endpointStats(method, endpoint)
+            stats['decoded_responses'] += 1
+            stats['decoded_wire_bytes'] += wire_bytes
+            stats['decoded_bytes'] += decoded_bytes
+
+    def snapshot(self):
+        """Returns a copy of the statistics recorded so far.
+
+        Returns:
+          A dictionary mapping each HTTP method to a dictionary mapping endpoint templates to
+          their statistics: 'requests', 'errors', 'latency_sum', 'latency_histogram' (a list of
+          counts, one per bound in 'latency_bounds' plus one for slower requests),
+          'request_bytes', 'response_bytes', 'decoded_responses', 'decoded_wire_bytes' (the
+          size of the decoded responses as received) and 'decoded_bytes'.
+        """
+        with self._lock:
+            snapshot = copy.deepcopy(self._stats)
+
+        for endpoints in snapshot.itervalues():
+            for stats in endpoints.itervalues():
+                stats['latency_bounds'] = list(self._latency_bounds)
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def _endpointStats(self, method, endpoint):
+        endpoints = self._stats.setdefault(method, {})
+        stats = endpoints.get(endpoint)
+        if stats is None:
+            stats = endpoints[endpoint] = {
+                'requests': 0,
+                'errors': 0,
+                'latency_sum': 0.0,
+                'latency_histogram': [0] * (len(self._latency_bounds) + 1),
+                'request_bytes': 0,
+                'response_bytes': 0,
+                'decoded_responses': 0,
+                'decoded_wire_bytes': 0,
+                'decoded_bytes': 0
+            }
+        return stats
+
+    def _bucketIndex(self, latency):
+        for i, bound in enumerate(self._latency_bounds):
+            if latency <= bound:
+                return i
+        return len(self._latency_bounds)
+
+
+def loggingSink(record):
+    """A sink logging every request at debug level."""
+    logging.debug(
+        'Discourse %(method)s %(endpoint)s: status %(status_code)s in %(latency).3fs, '
+        '%(request_bytes)d bytes sent, %(response_bytes)d bytes received', record)
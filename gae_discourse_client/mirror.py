@@ -0,0 +1,356 @@
+"""A datastore mirror of the groups, categories and group memberships of a Discourse site.
+
+Reading forum metadata from Discourse costs a request across the internet, and the in-memory
+indexes of GroupClient and CategoryClient are lost whenever an instance starts. A Mirror keeps
+the same data in the datastore, where every instance can read it at datastore latency. It is
+brought up to date by its sync tasklet, typically from a cron job:
+
+  mirror = mirror.Mirror()
+  mirror.sync(discourse_client.groups, discourse_client.categories,
+              member_groups=['quarterbacks']).get_result()
+
+and is read from by the clients given it (see discourse_client.initClient), or directly.
+
+The groups and categories of a mirror share an ancestor, so that reads are strongly consistent.
+The memberships of each group have an ancestor of their own, so that membership changes to
+different groups don't contend for the same entity group. Groups and categories created or
+deleted through the clients, and users added to or removed from groups through them, are written
+through to the mirror; anything else shows up in the mirror after the next sync. A membership
+change that can't be written through is logged, and the members of its group are marked as not
+mirrored until the next sync, instead of failing the change that was already made on Discourse.
+"""
+
+import datetime
+import logging
+
+from google.appengine.ext import ndb
+
+import tracing
+
+
+class Error(Exception):
+    pass
+
+
+class MirrorState(ndb.Model):
+    """The root entity of a mirror, recording when it was last synced."""
+    synced_at = ndb.DateTimeProperty()
+
+
+class MirroredGroup(ndb.Model):
+    """A Discourse group, keyed by its id."""
+    name = ndb.StringProperty(required=True)
+    members_synced_at = ndb.DateTimeProperty()
+    data = ndb.JsonProperty()
+
+
+class MirroredCategory(ndb.Model):
+    """A Discourse category, keyed by its id."""
+    name = ndb.StringProperty(required=True)
+    slug = ndb.StringProperty(required=True)
+    parent_category_id = ndb.IntegerProperty()
+    data = ndb.JsonProperty()
+
+
+class MirroredMembership(ndb.Model):
+    """The membership of a user in a group, keyed by the group id and lowercased username.
+
+    Memberships are kept under a MirroredGroupMembers key of their group, which is never stored.
+    """
+    group_id = ndb.IntegerProperty(required=True)
+    user_id = ndb.IntegerProperty()
+    username = ndb.StringProperty(required=True)
+
+
+class Mirror(object):
+    """Reads and syncs the datastore mirror of a Discourse site.
+
+    Args:
+      name: The name of the mirror, which keys its root entity. Use different names to mirror
+        several sites in the same application.
+      namespace: The datastore namespace to keep the mirror in.
+    """
+
+    def __init__(self, name='default', namespace=None):
+        self._root = ndb.Key(MirrorState, name, namespace=namespace)
+
+    # SYNC
+
+    @ndb.tasklet
+    @tracing.propagated
+    def sync(self, group_client, category_client, member_groups=(), concurrency=10):
+        """Brings the mirror up to date with Discourse.
+
+        All groups and categories are mirrored, replacing those previously stored. Group
+        memberships are only mirrored for the groups named in `member_groups`.
+
+        Args:
+          group_client: The GroupClient to read groups and members with.
+          category_client: The CategoryClient to read categories with.
+          member_groups: The names of the groups whose members should be mirrored.
+          concurrency: The maximum number of member pages to read at once.
+
+        Returns:
+          A dictionary with the keys 'groups', 'categories' and 'memberships' set to the number
+          of each that were mirrored.
+
+        Raises:
+          Error: If one of `member_groups` does not exist.
+        """
+        groups, categories = yield (group_client.getAllGroups(),
+                                    category_client.getAllCategories())
+
+        members_synced_at = yield self._membersSyncedAt()
+        removed = set(members_synced_at) - set(group['id'] for group in groups)
+        yield [self.removeGroup({'id': group_id}) for group_id in removed]
+        yield (
+            self._replace(MirroredGroup, [
+                self._groupEntity(group, members_synced_at.get(group['id'])) for group in groups
+            ]),
+            self._replace(MirroredCategory, [
+                self._categoryEntity(category) for category in categories
+            ])
+        )
+
+        memberships = 0
+        for group_name in member_groups:
+            count = yield self.syncMembers(group_client, group_name, concurrency=concurrency)
+            memberships += count
+
+        state = yield self._root.get_async()
+        state = state or MirrorState(key=self._root)
+        state.synced_at = datetime.datetime.utcnow()
+        yield state.put_async()
+
+        raise ndb.Return({
+            'groups': len(groups),
+            'categories': len(categories),
+            'memberships': memberships
+        })
+
+    @ndb.tasklet
+    @tracing.propagated
+    def syncMembers(self, group_client, group_name, concurrency=10):
+        """Brings the mirrored members of a single group up to date with Discourse.
+
+        Returns:
+          The number of members in the group.
+
+        Raises:
+          Error: If the group does not exist.
+        """
+        group = yield self._getGroupEntity(name=group_name)
+        if group is None:
+            fetched = yield group_client.getByName(group_name)
+            if fetched is None:
+                raise Error("Group named %s not found" % group_name)
+            group = self._groupEntity(fetched)
+
+        members = yield group_client.getAllMembers(
+            group_name, concurrency=concurrency, fields=('id', 'username'))
+        group_id = group.key.id()
+        yield self._replace(
+            MirroredMembership,
+            [MirroredMembership(
+                id=_membershipId(group_id, member['username']),
+                parent=self._membersRoot(group_id), group_id=group_id, user_id=member['id'],
+                username=member['username'].lower())
+             for member in members],
+            ancestor=self._membersRoot(group_id))
+
+        group.members_synced_at = datetime.datetime.utcnow()
+        yield group.put_async()
+        raise ndb.Return(len(members))
+
+    @ndb.tasklet
+    def getSyncedAt(self):
+        """Returns when the mirror was last synced, or None if it never was."""
+        state = yield self._root.get_async()
+        raise ndb.Return(state.synced_at if state is not None else None)
+
+    # READS
+
+    @ndb.tasklet
+    def getGroupByName(self, group_name):
+        """Returns the mirrored group with the given name, or None."""
+        group = yield self._getGroupEntity(name=group_name)
+        raise ndb.Return(group.data if group is not None else None)
+
+    @ndb.tasklet
+    def getGroupById(self, group_id):
+        """Returns the mirrored group with the given id, or None."""
+        group = yield ndb.Key(MirroredGroup, group_id, parent=self._root).get_async()
+        raise ndb.Return(group.data if group is not None else None)
+
+    @ndb.tasklet
+    def getCategoryByName(self, category_name, parent_category_name=None):
+        """Returns the mirrored category with the given name and parent name, or None."""
+        category = yield self._findCategory(
+            MirroredCategory.name, category_name, parent_category_name)
+        raise ndb.Return(category)
+
+    @ndb.tasklet
+    def getCategoryBySlug(self, category_slug, parent_category_slug=None):
+        """Returns the mirrored category with the given slug and parent slug, or None."""
+        category = yield self._findCategory(
+            MirroredCategory.slug, category_slug, parent_category_slug)
+        raise ndb.Return(category)
+
+    @ndb.tasklet
+    def isMember(self, username, group_name):
+        """Checks whether a user is in a group, according to the mirror.
+
+        Returns:
+          True or False, or None if the group or its members have not been mirrored.
+        """
+        group = yield self._getGroupEntity(name=group_name)
+        if group is None or group.members_synced_at is None:
+            raise ndb.Return(None)
+
+        membership = yield ndb.Key(
+            MirroredMembership, _membershipId(group.key.id(), username),
+            parent=self._membersRoot(group.key.id())).get_async()
+        raise ndb.Return(membership is not None)
+
+    # WRITE-THROUGH
+
+    @ndb.tasklet
+    def putGroup(self, group):
+        """Adds or replaces a single group in the mirror."""
+        existing = yield ndb.Key(MirroredGroup, group['id'], parent=self._root).get_async()
+        yield self._groupEntity(
+            group, existing.members_synced_at if existing is not None else None).put_async()
+
+    @ndb.tasklet
+    def removeGroup(self, group):
+        """Removes a single group, and its members, from the mirror."""
+        keys = yield MirroredMembership.query(
+            ancestor=self._membersRoot(group['id'])).fetch_async(keys_only=True)
+        yield ndb.delete_multi_async(
+            keys + [ndb.Key(MirroredGroup, group['id'], parent=self._root)])
+
+    @ndb.tasklet
+    def addMembers(self, group, usernames):
+        """Records users as members of a group, if the members of the group are mirrored."""
+        entity = yield ndb.Key(MirroredGroup, group['id'], parent=self._root).get_async()
+        if entity is None or entity.members_synced_at is None:
+            return
+
+        try:
+            yield ndb.put_multi_async([
+                MirroredMembership(
+                    id=_membershipId(group['id'], username),
+                    parent=self._membersRoot(group['id']), group_id=group['id'],
+                    username=username.lower())
+                for username in usernames])
+        except Exception:
+            logging.exception('Could not add members of group %s to the mirror', group['id'])
+            yield self._markMembersUnsynced(entity)
+
+    @ndb.tasklet
+    def removeMembers(self, group, user_ids):
+        """Removes users, given by id, from the mirrored members of a group.
+
+        Members added through addMembers aren't recorded with their id. If any of the users
+        isn't found among the mirrored members, the members of the group are marked as not
+        mirrored, so that membership checks go to Discourse until the next sync.
+        """
+        entity = yield ndb.Key(MirroredGroup, group['id'], parent=self._root).get_async()
+        if entity is None or entity.members_synced_at is None:
+            return
+
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+
+        try:
+            keys = yield MirroredMembership.query(
+                MirroredMembership.user_id.IN(list(user_ids)),
+                ancestor=self._membersRoot(group['id'])).fetch_async(keys_only=True)
+            yield ndb.delete_multi_async(keys)
+        except Exception:
+            logging.exception('Could not remove members of group %s from the mirror',
+                              group['id'])
+            keys = []
+        if len(keys) < len(user_ids):
+            yield self._markMembersUnsynced(entity)
+
+    @ndb.tasklet
+    def putCategory(self, category):
+        """Adds or replaces a single category in the mirror."""
+        yield self._categoryEntity(category).put_async()
+
+    @ndb.tasklet
+    def removeCategory(self, category):
+        """Removes a single category, and its subcategories, from the mirror."""
+        keys = yield MirroredCategory.query(
+            MirroredCategory.parent_category_id == category['id'], ancestor=self._root
+        ).fetch_async(keys_only=True)
+        yield ndb.delete_multi_async(
+            keys + [ndb.Key(MirroredCategory, category['id'], parent=self._root)])
+
+    # HELPERS
+
+    def _membersRoot(self, group_id):
+        return ndb.Key('MirroredGroupMembers', '%s:%d' % (self._root.id(), group_id),
+                       namespace=self._root.namespace())
+
+    @ndb.tasklet
+    def _markMembersUnsynced(self, entity):
+        # Membership checks go to Discourse until the members of the group are synced again.
+        entity.members_synced_at = None
+        try:
+            yield entity.put_async()
+        except Exception:
+            logging.exception('Could not mark members of group %s as not mirrored',
+                              entity.key.id())
+
+    def _groupEntity(self, group, members_synced_at=None):
+        return MirroredGroup(id=group['id'], parent=self._root, name=group['name'],
+                             members_synced_at=members_synced_at, data=group)
+
+    def _categoryEntity(self, category):
+        return MirroredCategory(id=category['id'], parent=self._root, name=category['name'],
+                                slug=category['slug'],
+                                parent_category_id=category.get('parent_category_id'),
+                                data=category)
+
+    @ndb.tasklet
+    def _getGroupEntity(self, name):
+        group = yield MirroredGroup.query(
+            MirroredGroup.name == name, ancestor=self._root).get_async()
+        raise ndb.Return(group)
+
+    @ndb.tasklet
+    def _findCategory(self, prop, value, parent_value):
+        parent_category_id = None
+        if parent_value:
+            parent = yield MirroredCategory.query(
+                prop == parent_value, MirroredCategory.parent_category_id == None,
+                ancestor=self._root).get_async()
+            if parent is None:
+                raise ndb.Return(None)
+            parent_category_id = parent.key.id()
+
+        category = yield MirroredCategory.query(
+            prop == value, MirroredCategory.parent_category_id == parent_category_id,
+            ancestor=self._root).get_async()
+        raise ndb.Return(category.data if category is not None else None)
+
+    @ndb.tasklet
+    def _membersSyncedAt(self):
+        groups = yield MirroredGroup.query(ancestor=self._root).fetch_async()
+        raise ndb.Return(dict((group.key.id(), group.members_synced_at) for group in groups))
+
+    @ndb.tasklet
+    def _replace(self, model, entities, ancestor=None):
+        # Replaces every entity of a model (under the ancestor, by default the root) with the
+        # given ones.
+        existing = yield model.query(ancestor=ancestor or self._root).fetch_async(keys_only=True)
+        kept = set(entity.key for entity in entities)
+        yield (ndb.put_multi_async(entities) +
+               ndb.delete_multi_async([key for key in existing if key not in kept]))
+
+
+def _membershipId(group_id, username):
+    return '%d:%s' % (group_id, username.lower())
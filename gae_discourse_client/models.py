@@ -0,0 +1,107 @@
+"""Compact model objects for Discourse users, groups, categories, topics and group members.
+
+Discourse sends many fields for every object in a listing, and keeping those listings in memory
+as dictionaries is costly. A model keeps only the fields most callers need, in __slots__. Listings
+requested as models are decoded with a projection onto those fields (see jsonscan.Projection),
+so the other fields are never decoded at all. Any other fields a caller asks for are kept along
+with the model, serialized to a compact JSON string that is only decoded if one of them is read.
+For example:
+
+  members = groups.getAllMembers(
+      'quarterbacks', as_models=True,
+      fields=models.Member.fields + ('avatar_template',)).get_result()
+  print members[0].username, members[0]['avatar_template']
+"""
+
+import json
+
+
+class Model(object):
+    """Base class of the models. Subclasses list the fields they keep in `fields`."""
+
+    __slots__ = ('_extra',)
+    fields = ()
+
+    def __init__(self, **kwargs):
+        for field in self.fields:
+            setattr(self, field, kwargs.get(field))
+        self._extra = None
+
+    @classmethod
+    def fromDict(cls, data):
+        """Builds a model from a dictionary sent by Discourse."""
+        model = cls.__new__(cls)
+        for field in cls.fields:
+            setattr(model, field, data.get(field))
+        extra = dict((key, value) for key, value in data.iteritems() if key not in cls.fields)
+        model._extra = json.dumps(extra, separators=(',', ':')) if extra else None
+        return model
+
+    @classmethod
+    def fromList(cls, items):
+        """Builds a list of models from a list of dictionaries sent by Discourse."""
+        return [cls.fromDict(item) for item in items]
+
+    @property
+    def raw(self):
+        """The model's fields and any other fields kept with it, as a dictionary.
+
+        When the model was decoded with a projection, this only holds the projected fields, not
+        everything Discourse sent. Model fields Discourse did not send are present, set to None.
+        The extra fields are decoded again on every access.
+        """
+        data = self.toDict()
+        if self._extra is not None:
+            data.update(json.loads(self._extra))
+        return data
+
+    def toDict(self):
+        """Returns the fields kept by the model as a dictionary."""
+        return dict((field, getattr(self, field)) for field in self.fields)
+
+    def get(self, key, default=None):
+        if key in self.fields:
+            return getattr(self, key)
+        if self._extra is None:
+            return default
+        return self.raw.get(key, default)
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        return self.raw[key]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.toDict() == other.toDict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (field, getattr(self, field)) for field in self.fields))
+
+
+class User(Model):
+    fields = ('id', 'username', 'name', 'email', 'trust_level')
+    __slots__ = fields
+
+
+class Member(Model):
+    fields = ('id', 'username', 'name', 'last_seen_at')
+    __slots__ = fields
+
+
+class Group(Model):
+    fields = ('id', 'name', 'user_count', 'automatic')
+    __slots__ = fields
+
+
+class Category(Model):
+    fields = ('id', 'name', 'slug', 'parent_category_id', 'topic_count')
+    __slots__ = fields
+
+
+class Topic(Model):
+    fields = ('id', 'title', 'slug', 'category_id', 'posts_count', 'bumped_at', 'pinned')
+    __slots__ = fields
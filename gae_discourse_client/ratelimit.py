@@ -0,0 +1,105 @@
+"""Client-side rate limiting of requests to Discourse"""
+
+import email.utils
+import time
+
+
+class TokenBucket(object):
+    """A token bucket refilling at `rate` tokens per second, holding at most `burst` tokens.
+
+    Tokens are reserved rather than taken: a reservation made while the bucket is empty puts it
+    into debt, and reports how long the caller has to wait for its token. Callers are therefore
+    served in the order they reserved.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        self._rate = float(rate)
+        self._capacity = float(burst if burst is not None else max(1, rate))
+        self._clock = clock
+        self._tokens = self._capacity
+        self._updated_at = clock()
+
+    def reserve(self):
+        """Reserves a token, and returns the number of seconds to wait before it is available."""
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens / self._rate
+
+
+class RateLimiter(object):
+    """Limits the rate of requests, overall, per HTTP method and per endpoint.
+
+    Rates are given in requests per second, either as a number or as a (rate, burst) tuple.
+    Endpoints are named by their template (see endpoints.endpointTemplate). The limiter can also
+    be paused, for example when Discourse answers with a 429 and a Retry-After header, in which
+    case every request waits until the pause is over.
+    """
+
+    def __init__(self, rate=None, method_rates=None, endpoint_rates=None, clock=time.time):
+        self._clock = clock
+        self._bucket = self._makeBucket(rate) if rate else None
+        self._method_buckets = dict(
+            (method.upper(), self._makeBucket(r)) for method, r in (method_rates or {}).iteritems())
+        self._endpoint_buckets = dict(
+            (endpoint, self._makeBucket(r)) for endpoint, r in (endpoint_rates or {}).iteritems())
+        self._paused_until = 0
+
+    def reserve(self, method, endpoint):
+        """Reserves a request slot.
+
+        Args:
+          method: The HTTP method of the request.
+          endpoint: The endpoint template of the request.
+
+        Returns:
+          The number of seconds to wait before sending the request.
+        """
+        buckets = [
+            self._bucket,
+            self._method_buckets.get(method),
+            self._endpoint_buckets.get(endpoint)
+        ]
+        delays = [bucket.reserve() for bucket in buckets if bucket is not None]
+        return max([self.pausedFor()] + delays)
+
+    def pause(self, seconds):
+        """Holds back every request for the given number of seconds."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def pausedFor(self):
+        """Returns the number of seconds left in the current pause, if any."""
+        return max(0, self._paused_until - self._clock())
+
+    def _makeBucket(self, rate):
+        if isinstance(rate, tuple):
+            return TokenBucket(rate[0], rate[1], clock=self._clock)
+        return TokenBucket(rate, clock=self._clock)
+
+
+def parseRetryAfter(value, default, clock=time.time):
+    """Parses the value of a Retry-After header.
+
+    Args:
+      value: The header value, either a number of seconds or an HTTP date. May be None.
+      default: The number of seconds to return if the value is missing or cannot be parsed.
+
+    Returns:
+      The number of seconds to wait, never less than zero.
+    """
+    if not value:
+        return default
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return default
+    return max(0, email.utils.mktime_tz(parsed) - clock())
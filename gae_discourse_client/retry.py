@@ -0,0 +1,54 @@
+"""Retrying of failed requests to Discourse"""
+
+import random
+
+
+class RetryPolicy(object):
+    """Decides whether a failed request should be retried, and how long to wait first.
+
+    Only requests using one of `methods` are retried, and only when they fail with one of
+    `retry_statuses` or raise one of `retry_exceptions`. The wait before the n-th retry is drawn
+    uniformly from [0, min(max_delay, base_delay * 2 ** (n - 1))] ("full jitter"), so that clients
+    failing together do not retry together. A request is given up on after `max_attempts`
+    attempts, or when waiting would take it past `budget` seconds in total.
+
+    If `on_retry` is given, it is called with a dictionary describing each retry (the 'method',
+    'endpoint', 'attempt' that failed, 'delay', 'elapsed' time, 'status_code' and 'exception').
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=5.0, budget=10.0,
+                 retry_statuses=(500, 502, 503, 504), methods=('GET', 'PUT', 'DELETE'),
+                 retry_exceptions=(), on_retry=None, random=random.random):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retry_statuses = frozenset(retry_statuses)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.retry_exceptions = tuple(retry_exceptions)
+        self.on_retry = on_retry
+        self._random = random
+
+    def retryDelay(self, method, attempt, elapsed, status_code=None, exception=None):
+        """Returns how long to wait before retrying a failed attempt, or None to give up.
+
+        Args:
+          method: The HTTP method of the request.
+          attempt: The number of the attempt that failed, starting at 1.
+          elapsed: The number of seconds since the first attempt started.
+          status_code: The status code of the failed response, if there was one.
+          exception: The exception raised by the attempt, if any.
+        """
+        if method not in self.methods or attempt >= self.max_attempts:
+            return None
+
+        if exception is not None:
+            if not isinstance(exception, self.retry_exceptions):
+                return None
+        elif status_code not in self.retry_statuses:
+            return None
+
+        delay = self._random() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if elapsed + delay > self.budget:
+            return None
+        return delay
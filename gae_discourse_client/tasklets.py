@@ -0,0 +1,58 @@
+"""Helpers for running many Discourse requests concurrently"""
+
+from google.appengine.ext import ndb
+
+import tracing
+
+
+def completed(result):
+    """Returns a future that has already resolved to the given result."""
+    future = ndb.Future()
+    future.set_result(result)
+    return future
+
+
+@ndb.tasklet
+@tracing.propagated
+def boundedMap(func, items, concurrency=10):
+    """Calls a tasklet on each item, with at most `concurrency` calls in flight at once.
+
+    Args:
+      func: A tasklet (or any function returning a future) taking a single item.
+      items: The items to call `func` on.
+      concurrency: The maximum number of calls to have outstanding at any time.
+
+    Returns:
+      A list with the result of `func` for each item, in the order of `items`.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    pending = iter(xrange(len(items)))
+
+    @ndb.tasklet
+    @tracing.propagated
+    def worker():
+        for i in pending:
+            results[i] = yield func(items[i])
+
+    if items:
+        yield [worker() for _ in xrange(min(concurrency, len(items)))]
+
+    raise ndb.Return(results)
+
+
+@ndb.tasklet
+def collectResult(future):
+    """Waits on a future and describes its outcome instead of raising.
+
+    Returns:
+      A dictionary with the key 'success' set to True and 'result' set to the result of the
+      future, or with 'success' set to False and 'error' set to the message of the exception it
+      raised.
+    """
+    try:
+        result = yield future
+    except Exception as e:
+        raise ndb.Return({'success': False, 'error': str(e)})
+
+    raise ndb.Return({'success': True, 'result': result})
@@ -0,0 +1,349 @@
+"""Offloading of group and user mutations to the App Engine task queue.
+
+Adding a user to a group by email takes a search and an update on Discourse, which a user-facing
+request shouldn't have to wait for. A TaskWriter instead records each mutation as a task in a
+pull queue and returns straight away. It also schedules a push task that runs a DrainHandler,
+which leases the recorded mutations in batches and applies each batch with as few requests as it
+can: users are created concurrently, emails are resolved concurrently, and all the users added
+to the same group are sent in a single members request.
+
+Each mutation records when it was made, and the mutations of a batch are applied in that order,
+whatever order they were leased in. The last mutation applied to each user in each group is
+stored (as an AppliedMembership), so that a mutation retried after a newer one was applied in
+another drain is skipped instead of undoing it.
+
+A mutation can be given a `request_id`, which names its task: recording it again with the same
+id (say, when the request that made it is retried) is a no-op. Drain tasks are named too, so that
+at most one drain is scheduled every `drain_interval` seconds.
+
+The pull queue has to be declared in queue.yaml:
+
+  queue:
+  - name: discourse-writes
+    mode: pull
+
+and the DrainHandler served at the drain URL, which should only be reachable by the task queue:
+
+  handler = tasks.DrainHandler(discourse_client.groups, discourse_client.users)
+  app = webapp2.WSGIApplication([('/_discourse/drain', handler)])
+
+Mutations that fail are retried when their lease expires, up to `max_attempts` times; the drain
+that leased them schedules another drain for then. Note that the password of a user to create is
+stored in the task until it is applied.
+"""
+
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+import tasklets
+import tracing
+
+PULL_QUEUE = 'discourse-writes'
+DRAIN_URL = '/_discourse/drain'
+
+
+class Error(Exception):
+    pass
+
+
+class AppliedMembership(ndb.Model):
+    """The sequence of the last add or remove applied to a user in a group, keyed by both."""
+    sequence = ndb.JsonProperty(indexed=False)
+
+    @classmethod
+    def keyFor(cls, group_name, username):
+        return ndb.Key(cls, '%s:%s' % (group_name, username.lower()))
+
+
+class TaskWriter(object):
+    """Records group and user mutations in the task queue, to be applied by a DrainHandler.
+
+    Args:
+      pull_queue: The name of the pull queue to record mutations in.
+      drain_queue: The name of the push queue to schedule drains in.
+      drain_url: The URL the DrainHandler is served at.
+      drain_interval: The number of seconds to wait before draining, which is also the shortest
+        time between two drains.
+    """
+
+    def __init__(self, pull_queue=PULL_QUEUE, drain_queue='default', drain_url=DRAIN_URL,
+                 drain_interval=5, clock=time.time):
+        self._pull_queue = pull_queue
+        self._drain_queue = drain_queue
+        self._drain_url = drain_url
+        self._drain_interval = drain_interval
+        self._clock = clock
+        self._counter = itertools.count()
+
+    def addUserByEmail(self, user_email, group_name, request_id=None):
+        """Records that the user with the given email should be added to a group.
+
+        Args:
+          request_id: Identifies the mutation, so that recording it again is a no-op. Mutations
+            without one are always recorded.
+
+        Returns:
+          True if the mutation was recorded, False if one with the same `request_id` already had
+          been.
+        """
+        return self._record('add', {'email': user_email, 'group_name': group_name}, request_id)
+
+    def addUserByUsername(self, username, group_name, request_id=None):
+        """Records that the user with the given username should be added to a group."""
+        return self._record('add', {'username': username, 'group_name': group_name}, request_id)
+
+    def removeUserByEmail(self, user_email, group_name, request_id=None):
+        """Records that the user with the given email should be removed from a group."""
+        return self._record('remove', {'email': user_email, 'group_name': group_name},
+                            request_id)
+
+    def removeUserByUsername(self, username, group_name, request_id=None):
+        """Records that the user with the given username should be removed from a group."""
+        return self._record('remove', {'username': username, 'group_name': group_name},
+                            request_id)
+
+    def createUser(self, name, email, password, username, external_id=None, request_id=None):
+        """Records that a Discourse account should be created. See UserClient.create."""
+        record = {'name': name, 'email': email, 'password': password, 'username': username}
+        if external_id:
+            record['external_id'] = external_id
+        return self._record('create', record, request_id)
+
+    def _record(self, op, params, request_id):
+        # Timestamps order mutations made on different instances; the counter orders those made
+        # by this writer within the same tick of the clock.
+        payload = json.dumps({
+            'op': op,
+            'params': params,
+            'sequence': [self._clock(), next(self._counter)]
+        })
+        name = None
+        if request_id is not None:
+            name = '%s-%s' % (op, hashlib.sha1(unicode(request_id).encode('utf-8')).hexdigest())
+
+        recorded = _addTask(self._pull_queue, taskqueue.Task(name=name, method='PULL',
+                                                             payload=payload))
+        self.scheduleDrain()
+        return recorded
+
+    def scheduleDrain(self, countdown=None):
+        """Schedules a drain in `countdown` seconds (by default, `drain_interval`).
+
+        Drains are named after the interval they run in, so no drain is scheduled if another
+        one is already due in the same interval.
+        """
+        if countdown is None:
+            countdown = self._drain_interval
+        window = int((self._clock() + countdown) // self._drain_interval)
+        _addTask(self._drain_queue, taskqueue.Task(
+            name='%s-drain-%d' % (self._pull_queue, window), url=self._drain_url,
+            countdown=countdown))
+
+
+class DrainHandler(object):
+    """A WSGI application applying the mutations recorded by a TaskWriter, in batches.
+
+    Args:
+      groups: The GroupClient to apply group mutations with.
+      users: The UserClient to create users and resolve emails with.
+      pull_queue: The name of the pull queue the mutations are recorded in.
+      batch_size: The number of mutations to lease and apply at once.
+      max_batches: The number of batches to apply per request. If mutations remain after that,
+        another drain is scheduled.
+      lease_seconds: How long a batch is leased for. Mutations that fail are retried once their
+        lease has expired.
+      max_attempts: The number of times to try a mutation before giving up on it.
+      concurrency: The maximum number of requests to have in flight at once.
+      writer: The TaskWriter used to schedule further drains. Defaults to one using the same
+        pull queue.
+    """
+
+    def __init__(self, groups, users, pull_queue=PULL_QUEUE, batch_size=500, max_batches=10,
+                 lease_seconds=300, max_attempts=5, concurrency=10, writer=None):
+        self._groups = groups
+        self._users = users
+        self._queue = taskqueue.Queue(pull_queue)
+        self._batch_size = batch_size
+        self._max_batches = max_batches
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+        self._concurrency = concurrency
+        self._writer = writer or TaskWriter(pull_queue=pull_queue)
+
+    def __call__(self, environ, start_response):
+        self.drain()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['OK']
+
+    def drain(self):
+        """Leases and applies batches of mutations until the queue is empty.
+
+        Returns:
+          The number of mutations that were applied successfully.
+        """
+        applied = 0
+        left_leased = False
+        for _ in xrange(self._max_batches):
+            leased = self._queue.lease_tasks(self._lease_seconds, self._batch_size)
+            if not leased:
+                break
+
+            mutations = [json.loads(task.payload) for task in leased]
+            outcomes = self.applyBatch(mutations).get_result()
+
+            done = []
+            for task, outcome in zip(leased, outcomes):
+                if outcome['success']:
+                    applied += 1
+                    done.append(task)
+                elif task.retry_count + 1 >= self._max_attempts:
+                    logging.error('Giving up on Discourse mutation %s: %s',
+                                  task.payload, outcome['error'])
+                    done.append(task)
+            if done:
+                self._queue.delete_tasks(done)
+            left_leased = left_leased or len(done) < len(leased)
+        else:
+            # Mutations may remain beyond the batches this drain was allowed.
+            self._writer.scheduleDrain()
+
+        if left_leased:
+            # The failed mutations can only be leased again once their lease has expired.
+            self._writer.scheduleDrain(countdown=self._lease_seconds)
+        return applied
+
+    @ndb.tasklet
+    @tracing.propagated
+    def applyBatch(self, mutations):
+        """Applies a batch of mutations.
+
+        Accounts are created first. Then, for each group and user, only the last of the adds and
+        removes is applied, by the order in which they were recorded, with the adds to each group
+        sent together. It is skipped if a newer one was already applied by an earlier batch.
+
+        Args:
+          mutations: Dictionaries with the 'op' ('create', 'add' or 'remove'), the 'params' and
+            the 'sequence' of each mutation, as recorded by a TaskWriter.
+
+        Returns:
+          A list with a dictionary for each mutation, with the key 'success' set to True if it
+          was applied (and 'superseded' set to True if it was skipped for a newer one), or set to
+          False and 'error' describing the failure.
+        """
+        outcomes = [None] * len(mutations)
+
+        creates = [i for i, mutation in enumerate(mutations) if mutation['op'] == 'create']
+        if creates:
+            created = yield self._users.createMany(
+                [mutations[i]['params'] for i in creates], concurrency=self._concurrency)
+            # createMany drops records repeating an email, which share the outcome of the first.
+            created = dict((email.lower(), outcome) for email, outcome in created.iteritems())
+            for i in creates:
+                outcomes[i] = created[mutations[i]['params']['email'].lower()]
+
+        memberships = sorted(
+            (i for i, mutation in enumerate(mutations) if mutation['op'] != 'create'),
+            key=lambda i: (mutations[i].get('sequence', []), i))
+        emails = list(collections.OrderedDict.fromkeys(
+            mutations[i]['params']['email'] for i in memberships
+            if 'email' in mutations[i]['params']))
+        lookups = yield tasklets.boundedMap(
+            lambda email: tasklets.collectResult(
+                self._users.getByEmail(email, identity_only=True)),
+            emails, self._concurrency)
+        lookups = dict(zip(emails, lookups))
+
+        # Only the last add or remove of each user in each group is applied. Users are given as
+        # (username, id) pairs, where the id is only known for users looked up by email.
+        latest = collections.OrderedDict()
+        for i in memberships:
+            params = mutations[i]['params']
+            if 'username' in params:
+                user = (params['username'], None)
+            else:
+                lookup = lookups[params['email']]
+                if not lookup['success'] or lookup['result'] is None:
+                    outcomes[i] = {
+                        'success': False,
+                        'error': lookup.get('error') or
+                        "Unable to find user with email %s" % params['email']
+                    }
+                    continue
+                user = (lookup['result']['username'], lookup['result']['id'])
+
+            entry = latest.setdefault((params['group_name'], user[0].lower()), [user, []])
+            entry[1].append(i)
+
+        keys = [AppliedMembership.keyFor(group_name, username) for group_name, username in latest]
+        applied = yield ndb.get_multi_async(keys)
+        sequences = {}
+
+        adds = collections.OrderedDict()
+        removes = collections.OrderedDict()
+        for key, entity, ((group_name, _), (user, indices)) in zip(
+                keys, applied, latest.iteritems()):
+            sequence = mutations[indices[-1]].get('sequence', [])
+            if entity is not None and entity.sequence >= sequence:
+                for i in indices:
+                    outcomes[i] = {'success': True, 'superseded': True}
+                continue
+            sequences[key] = (sequence, indices[-1])
+            target = adds if mutations[indices[-1]]['op'] == 'add' else removes
+            target.setdefault(group_name, []).append((user, indices))
+
+        futures = [self._applyAdds(group_name, entries) for group_name, entries in adds.items()]
+        futures += [self._applyRemoves(group_name, entries)
+                    for group_name, entries in removes.items()]
+        results = yield futures
+        for result in results:
+            for i, outcome in result:
+                outcomes[i] = outcome
+
+        yield ndb.put_multi_async([AppliedMembership(key=key, sequence=sequence)
+                                   for key, (sequence, i) in sequences.iteritems()
+                                   if outcomes[i]['success']])
+        raise ndb.Return(outcomes)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _applyAdds(self, group_name, entries):
+        usernames = [username for (username, _), _ in entries]
+        try:
+            results = yield self._groups.addUsersByUsername(
+                usernames, group_name, concurrency=self._concurrency)
+        except Exception as e:
+            results = dict((username, {'success': False, 'error': str(e)})
+                           for username in usernames)
+
+        raise ndb.Return([(i, results[username])
+                          for (username, _), indices in entries for i in indices])
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _applyRemoves(self, group_name, entries):
+        def remove(user):
+            username, user_id = user
+            if user_id is not None:
+                return tasklets.collectResult(self._groups.removeUserById(user_id, group_name))
+            return tasklets.collectResult(self._groups.removeUserByUsername(username, group_name))
+
+        results = yield tasklets.boundedMap(
+            remove, [user for user, _ in entries], self._concurrency)
+        raise ndb.Return([(i, result) for (_, indices), result in zip(entries, results)
+                          for i in indices])
+
+
+def _addTask(queue_name, task):
+    # Adds a named task, returning False if a task with the same name was already added.
+    try:
+        taskqueue.Queue(queue_name).add(task)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        return False
+    return True
@@ -0,0 +1,204 @@
+"""Opt-in tracing of the calls and HTTP requests made by composite client operations.
+
+While a Tracer is active in a thread, every call to a tasklet decorated with `traced` is
+recorded as a span, nested under the span of the tasklet that made the call, and every HTTP
+request is recorded as a child span of the tasklet that sent it. For example:
+
+  with tracing.Tracer() as tracer:
+      discourse_client.groups.removeUserByEmail('peyton18@example.com', 'quarterbacks').get_result()
+  print tracer.toJson(indent=2)
+
+When exported, each span is marked as 'concurrent' if it overlapped in time with one of its
+siblings, or 'serial' otherwise, which shows where sequential waits could be parallelized.
+
+Helper tasklets that are not traced themselves, down to the request methods of the API client,
+are marked `propagated`, so that the spans they start are still nested under the span of their
+caller.
+"""
+
+import functools
+import json
+import sys
+import threading
+import time
+import types
+
+_local = threading.local()
+
+
+class Span(object):
+    """A timed call or HTTP request, and the spans started while it was running."""
+
+    def __init__(self, name, kind, parent, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def finish(self, **attributes):
+        self.attributes.update(attributes)
+        self.finished_at = time.time()
+
+    def toDict(self, origin):
+        end = self.finished_at if self.finished_at is not None else time.time()
+        children = [child.toDict(origin) for child in self.children]
+        _markConcurrency(self.children, children)
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'start_ms': (self.started_at - origin) * 1000,
+            'duration_ms': (end - self.started_at) * 1000,
+            'attributes': self.attributes,
+            'children': children
+        }
+
+
+class Tracer(object):
+    """Records spans while active. Use as a context manager, or call start and stop."""
+
+    def __init__(self):
+        self.roots = []
+        self.current = None
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        _local.tracer = self
+
+    def stop(self):
+        if getattr(_local, 'tracer', None) is self:
+            _local.tracer = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def startSpan(self, name, kind, attributes=None):
+        span = Span(name, kind, self.current, attributes)
+        if span.parent is None:
+            self.roots.append(span)
+        else:
+            span.parent.children.append(span)
+        return span
+
+    def export(self):
+        """Returns the recorded spans as a list of nested dictionaries."""
+        roots = [root.toDict(self.started_at) for root in self.roots]
+        _markConcurrency(self.roots, roots)
+        return roots
+
+    def toJson(self, **kwargs):
+        return json.dumps(self.export(), **kwargs)
+
+
+def activeTracer():
+    """Returns the Tracer active in this thread, if any."""
+    return getattr(_local, 'tracer', None)
+
+
+def startSpan(name, kind='http', **attributes):
+    """Starts a span under the currently running traced tasklet, if tracing is active.
+
+    Returns:
+      The new Span, or None if no Tracer is active.
+    """
+    tracer = activeTracer()
+    if tracer is None:
+        return None
+    return tracer.startSpan(name, kind, attributes)
+
+
+def finishSpan(span, **attributes):
+    """Finishes a span returned by startSpan. Does nothing if it is None."""
+    if span is not None:
+        span.finish(**attributes)
+
+
+def traced(func):
+    """Decorates a tasklet generator function so that its calls are recorded as spans.
+
+    This must be applied beneath @ndb.tasklet, so that it wraps the generator function itself.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        gen = func(*args, **kwargs)
+        tracer = activeTracer()
+        if tracer is None or not isinstance(gen, types.GeneratorType):
+            return gen
+
+        name = func.__name__
+        if args and not isinstance(args[0], (basestring, int, long, float)):
+            name = '%s.%s' % (type(args[0]).__name__, name)
+        return _runUnder(tracer, tracer.startSpan(name, 'call'), gen, finish=True)
+
+    return wrapper
+
+
+def propagated(func):
+    """Decorates a tasklet generator function so that it runs under the span it was called in.
+
+    Calling a tasklet only creates its generator; ndb queues even its first step on the event
+    loop, which runs it outside of the caller's span. Untraced tasklets that make requests or call
+    traced tasklets need this, applied beneath @ndb.tasklet, or those show up at the root of the
+    trace.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        gen = func(*args, **kwargs)
+        tracer = activeTracer()
+        if tracer is None or tracer.current is None or not isinstance(gen, types.GeneratorType):
+            return gen
+        return _runUnder(tracer, tracer.current, gen, finish=False)
+
+    return wrapper
+
+
+def _runUnder(tracer, span, gen, finish):
+    # Runs each step of the generator with the span as the tracer's current span, so that any
+    # span started during the step (by a tasklet or request it starts) becomes its child. If
+    # `finish` is set, the span is finished along with the generator.
+    value = None
+    exc_info = None
+    try:
+        while True:
+            previous = tracer.current
+            tracer.current = span
+            try:
+                if exc_info is not None:
+                    thrown, exc_info = exc_info, None
+                    yielded = gen.throw(*thrown)
+                else:
+                    yielded = gen.send(value)
+            finally:
+                tracer.current = previous
+
+            try:
+                value = yield yielded
+            except Exception:
+                exc_info = sys.exc_info()
+    except StopIteration:
+        if finish:
+            span.finish()
+        raise
+    except Exception as e:
+        if finish:
+            span.finish(error=str(e))
+        raise
+
+
+def _markConcurrency(spans, exported):
+    for i, span in enumerate(spans):
+        end = span.finished_at or time.time()
+        overlaps = any(
+            other is not span and
+            other.started_at < end and span.started_at < (other.finished_at or time.time())
+            for other in spans)
+        exported[i]['mode'] = 'concurrent' if overlaps else 'serial'
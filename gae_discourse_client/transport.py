@@ -0,0 +1,159 @@
+"""HTTP transports used by the Discourse API client to send requests"""
+
+import httplib
+import socket
+import Queue
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from google.appengine.ext import ndb
+
+# Methods that can safely be sent again after a failure, even if the server may have acted on
+# the first attempt.
+_IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class UrlfetchTransport(object):
+    """Sends requests through the App Engine urlfetch service, using the current ndb context.
+
+    This is the default transport.
+    """
+
+    @property
+    def errors(self):
+        """Exceptions raised by fetch for failures that may succeed on another attempt."""
+        # Imported here, so that the other transports can be used where urlfetch is unavailable.
+        from google.appengine.api import urlfetch
+        return (urlfetch.Error,)
+
+    def fetch(self, url, payload, method, headers):
+        """Sends a request.
+
+        Returns:
+          A future resolving to a response with `status_code`, `content` and `headers`
+          attributes.
+        """
+        return ndb.get_context().urlfetch(url=url, payload=payload, method=method, headers=headers)
+
+
+class Response(object):
+    """A response received by the PooledHTTPTransport."""
+
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+
+class _CaselessHeaders(dict):
+    """A dictionary of response headers, with case-insensitive keys."""
+
+    def __init__(self, items):
+        super(_CaselessHeaders, self).__init__((name.lower(), value) for name, value in items)
+
+    def __getitem__(self, name):
+        return super(_CaselessHeaders, self).__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super(_CaselessHeaders, self).__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super(_CaselessHeaders, self).get(name.lower(), default)
+
+
+class PooledHTTPTransport(object):
+    """Sends requests over a pool of persistent HTTP connections.
+
+    This transport does not depend on urlfetch, so the client can be used from outside of App
+    Engine (for example, from a worker running bulk jobs). Requests are sent from a pool of
+    `pool_size` threads, and the ndb event loop polls for their completion every
+    `poll_interval` seconds, so tasklets keep running concurrently. Connections are kept alive
+    and reused between requests to the same host, unless `keep_alive` is False.
+    """
+
+    errors = (httplib.HTTPException, socket.error)
+
+    def __init__(self, pool_size=10, timeout=30, keep_alive=True, poll_interval=0.005):
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._keep_alive = keep_alive
+        self._poll_interval = poll_interval
+        self._threads = ThreadPool(pool_size)
+        self._connections = {}
+
+    @ndb.tasklet
+    def fetch(self, url, payload, method, headers):
+        """Sends a request.
+
+        Returns:
+          A future resolving to a Response.
+        """
+        result = self._threads.apply_async(self._send, (url, payload, method, headers))
+        while not result.ready():
+            yield ndb.sleep(self._poll_interval)
+
+        raise ndb.Return(result.get())
+
+    def close(self):
+        """Stops the worker threads and closes every idle connection."""
+        self._threads.terminate()
+        for idle in self._connections.values():
+            while not idle.empty():
+                idle.get_nowait().close()
+
+    def _send(self, url, payload, method, headers):
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        headers = dict(headers)
+        if not self._keep_alive:
+            headers['Connection'] = 'close'
+
+        while True:
+            connection, reused = self._checkout(parts.scheme, parts.netloc)
+            sent = False
+            try:
+                connection.request(method, path, payload or None, headers)
+                sent = True
+                response = connection.getresponse()
+                content = response.read()
+            except self.errors:
+                connection.close()
+                # The server may have closed an idle connection; try again on a new one, unless
+                # the server may already have acted on a request that can't be repeated.
+                if reused and (not sent or method in _IDEMPOTENT_METHODS):
+                    continue
+                raise
+
+            if self._keep_alive and not response.will_close:
+                self._checkin(parts.scheme, parts.netloc, connection)
+            else:
+                connection.close()
+
+            return Response(response.status, content, _CaselessHeaders(response.getheaders()))
+
+    def _checkout(self, scheme, netloc):
+        idle = self._idleConnections(scheme, netloc)
+        try:
+            return idle.get_nowait(), True
+        except Queue.Empty:
+            pass
+
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=self._timeout), False
+        return httplib.HTTPConnection(netloc, timeout=self._timeout), False
+
+    def _checkin(self, scheme, netloc, connection):
+        try:
+            self._idleConnections(scheme, netloc).put_nowait(connection)
+        except Queue.Full:
+            connection.close()
+
+    def _idleConnections(self, scheme, netloc):
+        key = (scheme, netloc)
+        idle = self._connections.get(key)
+        if idle is None:
+            idle = self._connections.setdefault(key, Queue.LifoQueue(maxsize=self._pool_size))
+        return idle
@@ -1,26 +1,46 @@
 """Gateway for accessing the Discourse API (for forums)"""
 
+import collections
 import json
 import re
 from urllib import urlencode
 
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 
+import cache
+import jsonscan
+import tasklets
+import tracing
+
 
 class Error(Exception):
     pass
 
 
+_MISSING = object()
+
+# Keeps only what identifies each user in a listing of active users.
+_IDENTITY_PROJECTION = jsonscan.Projection(['id', 'username', 'email'])
+
+
 class UserClient(object):
-    """An API client for interacting with Discourse for user-related actions"""
+    """An API client for interacting with Discourse for user-related actions
+
+    If an `email_index` (an emailindex.EmailIndex) is given, getByEmail answers from it before
+    searching Discourse. The index is built and kept up to date with refreshEmailIndex.
+    """
 
-    def __init__(self, api_client):
+    def __init__(self, api_client, email_cache_size=10000, email_cache_ttl=600,
+                 email_miss_ttl=60, email_index=None):
         self._api_client = api_client
+        self._email_cache = cache.LRUCache(max_size=email_cache_size, ttl=email_cache_ttl)
+        self._email_miss_ttl = email_miss_ttl
+        self._email_index = email_index
 
     # USER ACTIONS
 
     @ndb.tasklet
+    @tracing.traced
     def getByUsername(self, username):
         """Finds the Discourse user with the given username.
 
@@ -41,31 +61,169 @@ class UserClient(object):
             raise ndb.Return(None)
 
     @ndb.tasklet
-    def getByEmail(self, user_email):
+    @tracing.traced
+    def getById(self, user_id):
+        """Finds the Discourse user with the given id.
+
+        Returns:
+          A dictionary containing information about the user if the user is successfully found,
+          None otherwise.
+        """
+        user = yield self._api_client.getRequest('admin/users/%s.json' % user_id)
+        raise ndb.Return(user or None)
+
+    @ndb.tasklet
+    @tracing.traced
+    def getByEmail(self, user_email, use_cache=True, identity_only=False):
         """Finds the Discourse user with the given email.
 
         Note that this is significantly slower than getByUsername, since Discourse users are
-        indexed on username but not on email.
+        indexed on username but not on email. To make up for that, resolved emails are kept in a
+        bounded cache, and emails with no matching user are remembered for a short time. If
+        the client has an email index, emails found in it are resolved without a search.
+
+        Cached and indexed emails only give the user's id and username, so unless
+        `identity_only` is set, the full record of a user found that way is then fetched by id,
+        costing a request. Callers that only need to know who the user is should set
+        `identity_only`, which answers cached and indexed emails without any request.
 
         Args:
           user_email: The email address of the user to find.
+          use_cache: Whether to answer from the email cache. If this is False, Discourse is
+            always searched.
+          identity_only: Whether only the 'id', 'username' and 'email' of the user are needed.
 
         Returns:
-          A dictionary containing information about the user if the user is successfully found,
-          None otherwise
+          If `identity_only` is True, a dictionary containing only the 'id', 'username' and
+          'email' of the user, whichever way they were found. Otherwise, a dictionary containing
+          all information about the user, whose shape depends on how they were found: the record
+          of admin/users/{id}.json (see getById) for cached and indexed emails, or the entry of
+          the active users listing, which has fewer fields (no 'groups', for example), for
+          emails that had to be searched for. None if the user was not found.
         """
+        key = user_email.lower()
+        if use_cache:
+            identity = self._email_cache.get(key, _MISSING)
+            if identity is _MISSING and self._email_index is not None:
+                identity = yield self._email_index.lookup(user_email)
+                if identity is not None:
+                    self._email_cache.set(key, identity)
+                else:
+                    identity = _MISSING
+
+            if identity is None or (identity is not _MISSING and identity_only):
+                raise ndb.Return(identity)
+            if identity is not _MISSING:
+                user = yield self.getById(identity['id'])
+                if user is not None:
+                    raise ndb.Return(user)
+                # The user is gone, so search again to find out what the email belongs to now.
+                self.invalidateEmail(user_email)
+
         users = yield self._api_client.getRequest(
             'admin/users/list/active.json',
             params={'filter': user_email, 'show_emails': 'true'}
         )
 
         for user in users:
-            if user['email'].lower() == user_email.lower():
-                raise ndb.Return(user)
+            if user['email'].lower() == key:
+                identity = {'id': user['id'], 'username': user['username'], 'email': user['email']}
+                self._email_cache.set(key, identity)
+                raise ndb.Return(identity if identity_only else user)
 
+        self._email_cache.set(key, None, ttl=self._email_miss_ttl)
         raise ndb.Return(None)
 
+    def invalidateEmail(self, user_email):
+        """Drops any cached result for the given email address."""
+        self._email_cache.delete(user_email.lower())
+
     @ndb.tasklet
+    def updateCached(self, user):
+        """Applies a user created or changed on Discourse to the email cache and index.
+
+        Cached results for the user are dropped. A user with an email address is then added to
+        the email index, replacing any entry for their previous address, unless they are no
+        longer active, in which case they are removed from it.
+
+        Args:
+          user: A dictionary with the 'id', 'username' and, if known, 'email' of the user.
+        """
+        self._dropCached(user)
+        if self._email_index is None:
+            return
+
+        if user.get('active') is False:
+            yield self._email_index.removeById(user['id'])
+        elif user.get('email'):
+            yield self._email_index.update([user])
+
+    @ndb.tasklet
+    def removeCached(self, user, deleted=False):
+        """Drops cached results for a user, after it changed or was deleted on Discourse.
+
+        Args:
+          user: A dictionary with the 'id' of the user and, if known, their 'email'.
+          deleted: Whether the user was deleted, in which case they are also removed from the
+            email index.
+        """
+        self._dropCached(user)
+        if deleted and self._email_index is not None:
+            yield self._email_index.removeById(user['id'])
+
+    def _dropCached(self, user):
+        if user.get('email'):
+            self.invalidateEmail(user['email'])
+
+        # The user's previous email address isn't known, so look for it among the cached ones.
+        for key in self._email_cache.keys():
+            identity = self._email_cache.get(key)
+            if identity is not None and identity['id'] == user['id']:
+                self._email_cache.delete(key)
+
+    @ndb.tasklet
+    @tracing.traced
+    def refreshEmailIndex(self, full=False, concurrency=10):
+        """Adds the users created since the last refresh to the email index.
+
+        The listing of active users is read newest first, up to the highest user id already in
+        the index. If the index has not been built yet, or `full` is True, every active user is
+        read and the index is rebuilt from scratch, which also drops users who are no longer
+        active.
+
+        Args:
+          full: Whether to rebuild the whole index.
+          concurrency: The maximum number of requests to have in flight at once.
+
+        Returns:
+          The number of users added to the index.
+
+        Raises:
+          Error: If the client has no email index.
+        """
+        if self._email_index is None:
+            raise Error("No email index was given to this client")
+
+        max_user_id = None
+        if not full:
+            max_user_id = yield self._email_index.getMaxUserId()
+
+        users = []
+
+        def onPage(page, page_users):
+            for user in page_users:
+                if max_user_id is not None and user['id'] <= max_user_id:
+                    return True
+                users.append(user)
+
+        yield self._fetchActivePages(concurrency, onPage)
+
+        new_max_user_id = max([user['id'] for user in users] + [max_user_id or 0])
+        yield self._email_index.update(users, new_max_user_id, replace=max_user_id is None)
+        raise ndb.Return(len(users))
+
+    @ndb.tasklet
+    @tracing.traced
     def create(self, name, email, password, username, external_id=None):
         """Create a Discourse account.
 
@@ -96,9 +254,115 @@ class UserClient(object):
             payload['external_id'] = external_id
 
         response = yield self._api_client.postRequest('users/', payload=payload)
+        self.invalidateEmail(email)
         raise ndb.Return(response)
 
     @ndb.tasklet
+    @tracing.traced
+    def createMany(self, records, concurrency=10, skip_existing=False, existing=None):
+        """Creates many Discourse accounts, with at most `concurrency` requests in flight at once.
+
+        Args:
+          records: A list of dictionaries, each holding the arguments to create (name, email,
+            password, username and, optionally, external_id) for one account. Records repeating
+            an email address already given (ignoring case) are dropped. Records repeating a
+            username already given for another email address (ignoring case) are not created, and
+            fail.
+          concurrency: The maximum number of requests to have in flight at once.
+          skip_existing: Whether to skip records of users who already exist. Emails are looked up
+            in the client's email index, which may be missing the most recent users: records of
+            those are sent to Discourse, and fail.
+          existing: A set of the lowercased emails and usernames of existing users, such as one
+            kept by the caller across calls. Records whose email or username is in it are
+            skipped, as with skip_existing, which can be left False if the client has no email
+            index.
+
+        Returns:
+          A dictionary mapping the email address of each record to a dictionary with the key
+          'success' set to True and 'result' set to the response of Discourse if the account was
+          created, 'success' and 'skipped' set to True if the account already existed, or
+          'success' set to False and 'error' describing the failure.
+
+        Raises:
+          Error: If skip_existing is True and the client has no email index.
+        """
+        if skip_existing and self._email_index is None:
+            raise Error("No email index was given to this client, so existing users can't be "
+                        "skipped")
+
+        pending = collections.OrderedDict()
+        results = {}
+        usernames_given = set()
+        for record in records:
+            key = record['email'].lower()
+            if key in pending:
+                continue
+            if record['username'].lower() in usernames_given:
+                results[record['email']] = {
+                    'success': False,
+                    'error': 'Username %s is given for more than one email address' %
+                             record['username']
+                }
+                continue
+            usernames_given.add(record['username'].lower())
+            pending[key] = record
+
+        indexed = [None] * len(pending)
+        if skip_existing and pending:
+            indexed = yield [self._email_index.lookup(key) for key in pending]
+
+        for (key, record), user in zip(pending.items(), indexed):
+            if user is not None or (existing is not None and (
+                    key in existing or record['username'].lower() in existing)):
+                results[record['email']] = {'success': True, 'skipped': True}
+                del pending[key]
+
+        outcomes = yield tasklets.boundedMap(self._createOutcome, pending.values(), concurrency)
+        for record, outcome in zip(pending.values(), outcomes):
+            results[record['email']] = outcome
+        raise ndb.Return(results)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _createOutcome(self, record):
+        outcome = yield tasklets.collectResult(self.create(**record))
+        # Discourse reports accounts it refused to create (for example, because the username is
+        # taken) with a 200 response.
+        if outcome['success'] and outcome['result'].get('success') is False:
+            outcome = {
+                'success': False,
+                'error': outcome['result'].get('message', 'User was not created')
+            }
+        raise ndb.Return(outcome)
+
+    @ndb.tasklet
+    @tracing.propagated
+    def _fetchActivePages(self, concurrency, on_page):
+        # Discourse doesn't say how many active users there are, so pages are read `concurrency`
+        # at a time until one comes back empty or on_page returns True. The first page is read on
+        # its own, as it is often the only one needed (an incremental refresh, or a small site).
+        # Pages are handed to on_page in order, newest users first, keeping only the id, username
+        # and email of each. The listing is ordered by last_seen_at unless asked otherwise.
+        page = 1
+        numbers = [1]
+        while True:
+            pages = yield [
+                self._api_client.getRequest(
+                    'admin/users/list/active.json',
+                    params={'show_emails': 'true', 'order': 'created', 'page': number},
+                    decoder=_IDENTITY_PROJECTION)
+                for number in numbers
+            ]
+
+            for number, users in zip(numbers, pages):
+                if not users or on_page(number, users):
+                    raise ndb.Return()
+
+            page += len(numbers)
+            numbers = range(page, page + concurrency)
+
+    @ndb.tasklet
+    @tracing.traced
     def delete(self, email, strict=False):
         """Delete a Discourse account.
 
@@ -114,7 +378,7 @@ class UserClient(object):
         Raises:
           Error: If `strict` is True and the user does not exist.
         """
-        user = yield self.getByEmail(email)
+        user = yield self.getByEmail(email, identity_only=True)
         if user is None:
             if not strict:
                 raise ndb.Return(None)
@@ -122,4 +386,7 @@ class UserClient(object):
                 raise Error("Could not find user with email %s" % email)
 
         response = yield self._api_client.deleteRequest('admin/users/%s.json' % user['id'])
+        self.invalidateEmail(email)
+        if self._email_index is not None:
+            yield self._email_index.remove(email)
         raise ndb.Return(response)
@@ -0,0 +1,166 @@
+"""A WSGI handler for Discourse webhooks, keeping the client's caches up to date.
+
+The caches kept by the clients (the group index, the category tree, the email cache, the email
+index, the mirror and the validator cache) can go stale when things are changed in the Discourse
+admin UI. Pointing a Discourse webhook at a WebhookHandler lets each change be applied to them as
+it happens. For example, with webapp2:
+
+  handler = webhooks.WebhookHandler(
+      'webhook-secret', api_client=api_client, users=discourse_client.users,
+      groups=discourse_client.groups, categories=discourse_client.categories)
+  app = webapp2.WSGIApplication([('/discourse/webhook', handler)])
+
+Only the email index and the mirror are shared by every instance, so only they are kept current
+everywhere, and can be kept for much longer. The group index, the category tree, the email cache
+and the validator cache live in the memory of each instance, and are only updated on the
+instance that receives the webhook; the other instances still depend on their TTLs.
+
+The webhook must be given the same secret, and send user, group, category and topic events.
+Requests are rejected unless their X-Discourse-Event-Signature header is the HMAC-SHA256 of their
+body under that secret.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+
+from google.appengine.ext import ndb
+
+
+class Error(Exception):
+    pass
+
+
+def computeSignature(secret, body):
+    """Returns the X-Discourse-Event-Signature header Discourse sends with the given body."""
+    return 'sha256=' + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verifySignature(secret, body, signature):
+    """Whether a X-Discourse-Event-Signature header is valid for the given body."""
+    if not signature:
+        return False
+    return hmac.compare_digest(computeSignature(secret, body), str(signature))
+
+
+class WebhookHandler(object):
+    """Applies Discourse webhook events to the caches of the given clients.
+
+    Any of the clients can be left out, in which case its caches are not updated.
+
+    Args:
+      secret: The secret the webhook was configured with.
+      api_client: The DiscourseAPIClient whose validator cache should be invalidated.
+      users: The UserClient whose email cache and index should be updated.
+      groups: The GroupClient whose index and mirror should be updated.
+      categories: The CategoryClient whose tree and mirror should be updated.
+    """
+
+    def __init__(self, secret, api_client=None, users=None, groups=None, categories=None):
+        self._secret = secret
+        self._api_client = api_client
+        self._users = users
+        self._groups = groups
+        self._categories = categories
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return self._respond(start_response, '405 Method Not Allowed')
+
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else ''
+        signature = environ.get('HTTP_X_DISCOURSE_EVENT_SIGNATURE')
+        if not verifySignature(self._secret, body, signature):
+            return self._respond(start_response, '403 Forbidden')
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._respond(start_response, '400 Bad Request')
+
+        event_type = environ.get('HTTP_X_DISCOURSE_EVENT_TYPE', '')
+        event = environ.get('HTTP_X_DISCOURSE_EVENT', '')
+        self.handleEvent(event_type, event, payload).get_result()
+        return self._respond(start_response, '200 OK')
+
+    @ndb.tasklet
+    def handleEvent(self, event_type, event, payload):
+        """Applies a single webhook event.
+
+        Args:
+          event_type: The type of the event (the X-Discourse-Event-Type header), such as 'user'.
+          event: The event (the X-Discourse-Event header), such as 'user_destroyed'.
+          payload: The decoded body of the webhook request.
+
+        Returns:
+          True if the event was applied, False if it is not one this handler knows about.
+        """
+        handler = {
+            'user': self._handleUser,
+            'group': self._handleGroup,
+            'category': self._handleCategory,
+            'topic': self._handleTopic
+        }.get(event_type)
+
+        if handler is None or event_type not in payload:
+            logging.debug('Ignoring Discourse webhook event %s', event)
+            raise ndb.Return(False)
+
+        yield handler(event, payload[event_type])
+        raise ndb.Return(True)
+
+    @ndb.tasklet
+    def _handleUser(self, event, user):
+        if self._users is not None:
+            if event == 'user_destroyed':
+                yield self._users.removeCached(user, deleted=True)
+            else:
+                yield self._users.updateCached(user)
+
+        self._invalidate('admin/users/list/')
+        if user.get('username'):
+            self._invalidate('admin/users/%s.json' % user['username'])
+        self._invalidate('admin/users/%s.json' % user['id'])
+
+    @ndb.tasklet
+    def _handleGroup(self, event, group):
+        if self._groups is not None:
+            if event == 'group_destroyed':
+                yield self._groups.removeCached(group)
+            else:
+                yield self._groups.updateCached(group)
+
+        self._invalidate('admin/groups.json')
+        self._invalidate('groups/%s/' % group['name'])
+
+    @ndb.tasklet
+    def _handleCategory(self, event, category):
+        if self._categories is not None:
+            if event == 'category_destroyed':
+                yield self._categories.removeCached(category)
+            else:
+                yield self._categories.updateCached(category)
+
+        self._invalidate('site.json')
+        self._invalidate('categories.json')
+        self._invalidate('c/%s.json' % category['id'])
+        if category.get('parent_category_id'):
+            self._invalidate('c/%s/%s.json' % (category['parent_category_id'], category['id']))
+
+    @ndb.tasklet
+    def _handleTopic(self, event, topic):
+        self._invalidate('t/%s.json' % topic['id'])
+        self._invalidate('t/%s/' % topic['id'])
+        self._invalidate('latest.json')
+        if topic.get('category_id'):
+            # The topic may also be listed under the parent of its category, which isn't given.
+            self._invalidate('c/')
+
+    def _invalidate(self, req_string):
+        if self._api_client is not None:
+            self._api_client.invalidateCached(req_string)
+
+    def _respond(self, start_response, status):
+        start_response(status, [('Content-Type', 'text/plain')])
+        return [status]
@@ -1,11 +1,16 @@
 import chai
+import os
 from urllib import urlencode
 
 from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from benchmarks import fake_discourse
+from gae_discourse_client import discourse_client
 
 
 class TestCase(chai.Chai):
-    def _expectUrlfetch(self, url, method, payload, response):
+    def _expectUrlfetch(self, url, method, payload, response, headers=None):
         if '?' in url:
             url, params = url.split('?')
         else:
@@ -23,7 +28,53 @@ class TestCase(chai.Chai):
         payload_matchers = [self.contains(s) for s in payload.split('&')]
         url_matchers = [self.contains(s) for s in params.split('&')] + [self.contains(url)]
 
+        expected_headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept-Encoding': 'gzip'
+        }
+        if headers:
+            expected_headers.update(headers)
+
+        if not isinstance(response.__dict__.get('headers'), dict):
+            response.headers = {}
+
         result = ndb.Future()
         result.set_result(response)
 
-        self.expect(ndb.get_context(), 'urlfetch').args(url=self.all_of(*url_matchers), headers={'Content-Type': 'application/x-www-form-urlencoded'}, method=method, payload=self.all_of(*payload_matchers)).any_order().returns(result)
+        return self.expect(ndb.get_context(), 'urlfetch').args(url=self.all_of(*url_matchers), headers=expected_headers, method=method, payload=self.all_of(*payload_matchers)).any_order().returns(result)
+
+
+class FakeDiscourseTestCase(TestCase):
+    """A test case run against a FakeDiscourse, with App Engine services stubbed out.
+
+    Subclasses set `fake_options` to the arguments of the FakeDiscourse, which is available as
+    `self.fake`, along with an API client talking to it as `self.api_client`.
+    """
+
+    fake_options = {}
+
+    def setUp(self):
+        super(FakeDiscourseTestCase, self).setUp()
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=os.path.dirname(__file__))
+        ndb.get_context().clear_cache()
+
+        self.fake = fake_discourse.FakeDiscourse(latency=0, **self.fake_options)
+        self.api_client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', 'super-secret-key', 'system',
+            transport=fake_discourse.FakeDiscourseTransport(self.fake))
+
+    def tearDown(self):
+        self.testbed.deactivate()
+        super(FakeDiscourseTestCase, self).tearDown()
+
+    def groupId(self, group_name):
+        for group_id, group in self.fake.groups.iteritems():
+            if group['name'] == group_name:
+                return group_id
+
+    def members(self, group_name):
+        return self.fake.members[self.groupId(group_name)]
@@ -0,0 +1,54 @@
+import unittest
+
+from gae_discourse_client import cache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = cache.LRUCache(max_size=2, ttl=10, clock=self.clock)
+
+    def testGetReturnsStoredValue(self):
+        self.cache.set('peyton18', {'id': 18})
+        self.assertEqual({'id': 18}, self.cache.get('peyton18'))
+        self.assertTrue('peyton18' in self.cache)
+
+    def testGetDistinguishesStoredNone(self):
+        missing = object()
+        self.cache.set('peyton18', None)
+        self.assertIsNone(self.cache.get('peyton18', missing))
+        self.assertIs(missing, self.cache.get('eli10', missing))
+
+    def testEntriesExpire(self):
+        self.cache.set('peyton18', 18)
+        self.cache.set('eli10', 10, ttl=30)
+        self.clock.now += 10
+
+        self.assertIsNone(self.cache.get('peyton18'))
+        self.assertFalse('peyton18' in self.cache)
+        self.assertEqual(10, self.cache.get('eli10'))
+
+    def testLeastRecentlyUsedEntryIsEvicted(self):
+        self.cache.set('peyton18', 18)
+        self.cache.set('eli10', 10)
+        self.cache.get('peyton18')
+        self.cache.set('tom12', 12)
+
+        self.assertEqual(18, self.cache.get('peyton18'))
+        self.assertIsNone(self.cache.get('eli10'))
+        self.assertEqual(12, self.cache.get('tom12'))
+        self.assertEqual(2, len(self.cache))
+
+    def testDelete(self):
+        self.cache.set('peyton18', 18)
+        self.cache.delete('peyton18')
+        self.cache.delete('eli10')
+        self.assertIsNone(self.cache.get('peyton18'))
@@ -27,8 +27,8 @@ class DiscourseUserUnitTestCase(base.TestCase):
     def testCreateCategory(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': []}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        response.content = json.dumps({'categories': []})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
 
         response = self.mock()
         response.status_code = 200
@@ -42,22 +42,41 @@ class DiscourseUserUnitTestCase(base.TestCase):
     def testCreateSubcategory(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': [{'name': 'Football Players', 'id': 55}]}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        response.content = json.dumps({'categories': [{'name': 'Football Players', 'id': 55, 'slug': 'football-players'}]})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
 
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': []}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json?parent_category_id=55', method='GET', payload='', response=response)
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/categories', method='POST', payload='parent_category_id=55', response=response)
+
+        discourse_client.categories.create(
+            category_name='Denver Broncos',
+            parent_category_name='Football Players'
+        ).get_result()
+
+    def testCreateSubcategoryFailsWhenParentNotFound(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'categories': []})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        with self.assertRaises(categories.Error):
+            discourse_client.categories.create(
+                category_name='Denver Broncos',
+                parent_category_name='Football Players'
+            ).get_result()
 
+    def testCreateCategoryUpdatesTree(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': [{'name': 'Football Players', 'id': 55}]}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        response.content = json.dumps({'categories': [{'name': 'Football Players', 'id': 55, 'slug': 'football-players'}]})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
 
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'success': True})
+        response.content = json.dumps({'category': {
+            'name': 'Denver Broncos', 'id': 60, 'slug': 'denver-broncos', 'parent_category_id': 55}})
         self._expectUrlfetch(url='http://rants.example.com/categories', method='POST', payload='', response=response)
 
         discourse_client.categories.create(
@@ -65,28 +84,29 @@ class DiscourseUserUnitTestCase(base.TestCase):
             parent_category_name='Football Players'
         ).get_result()
 
-    def testCreateSubcategoryFailsWhenParentNotFound(self):
-        response = self.mock()
-        response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': []}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        category = discourse_client.categories.getBySlug('denver-broncos', 'football-players').get_result()
+        self.assertEqual(60, category['id'])
 
+    def testGetSubcategoryBySlug(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': []}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        response.content = json.dumps({'categories': [
+            {'name': 'Football Players', 'id': 55, 'slug': 'football-players'},
+            {'name': 'Denver Broncos', 'id': 60, 'slug': 'denver-broncos', 'parent_category_id': 55}
+        ]})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
 
-        with self.assertRaises(categories.Error):
-            discourse_client.categories.create(
-                category_name='Denver Broncos',
-                parent_category_name='Football Players'
-            ).get_result()
+        category = discourse_client.categories.getBySlug('denver-broncos', 'football-players').get_result()
+        self.assertEqual('Denver Broncos', category['name'])
+
+        category = discourse_client.categories.getByName('Denver Broncos', 'Football Players').get_result()
+        self.assertEqual(60, category['id'])
 
     def testDeleteCategory(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': [{'name': 'Football Players', 'id': 55, 'slug': 'football-players'}]}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        response.content = json.dumps({'categories': [{'name': 'Football Players', 'id': 55, 'slug': 'football-players'}]})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response)
 
         response = self.mock()
         response.status_code = 200
@@ -100,8 +120,8 @@ class DiscourseUserUnitTestCase(base.TestCase):
     def testCreateCategoryFails(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps({'category_list': {'categories': []}})
-        self._expectUrlfetch(url='http://rants.example.com/categories.json', method='GET', payload='', response=response)
+        response.content = json.dumps({'categories': []})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response)
 
         response = self.mock()
         response.status_code = 403
@@ -127,3 +147,50 @@ class DiscourseUserUnitTestCase(base.TestCase):
         result = discourse_client.categories.getAllCategories().get_result()
         self.assertEqual({'football-players', 'baseball-players'}, {category['slug'] for category in result})
         self.assertTrue(len(result) == 2)
+
+    def testMissingCategoriesReloadTreeOnceBeforeItExpires(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps(
+            {'categories': [{'name': 'Football Players', 'id': 55, 'slug': 'football-players'}]})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).times(2)
+
+        for _ in xrange(5):
+            self.assertIsNone(discourse_client.categories.getByName('Nope').get_result())
+
+    def testLookupScansListingWhenTreeDisabled(self):
+        category_client = categories.CategoryClient(discourse_client.categories._api_client, index_ttl=0)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps(
+            {'categories': [
+                {'name': 'Players', 'id': 55, 'slug': 'players'},
+                {'name': 'Players', 'id': 60, 'slug': 'players', 'parent_category_id': 28},
+                {'name': 'Baseball', 'id': 28, 'slug': 'baseball'}
+            ]}
+        )
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).times(2)
+
+        category = category_client.getByName('Players', 'Baseball').get_result()
+        self.assertEqual(60, category['id'])
+        self.assertIsNone(category_client.getBySlug('baseball', 'players').get_result())
+
+    def testProjectedCategoriesAndTree(self):
+        category_client = categories.CategoryClient(
+            discourse_client.categories._api_client, index_fields=['color'])
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps(
+            {'categories': [
+                {'name': 'Football Players', 'id': 55, 'slug': 'football-players', 'color': 'FFFFFF', 'description': 'Football'}
+            ]}
+        )
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        result = category_client.getAllCategories(fields=['id', 'name']).get_result()
+        self.assertEqual([{'id': 55, 'name': 'Football Players'}], result)
+
+        category = category_client.getBySlug('football-players').get_result()
+        self.assertEqual({'id': 55, 'name': 'Football Players', 'slug': 'football-players', 'color': 'FFFFFF'}, category)
@@ -4,6 +4,7 @@ from google.appengine.api import apiproxy_stub_map
 from google.appengine.api import urlfetch_stub
 from google.appengine.ext import ndb
 
+from gae_discourse_client import content
 from gae_discourse_client import discourse_client
 import base
 
@@ -76,3 +77,72 @@ class DiscourseContentUnitTestCase(base.TestCase):
         self._expectUrlfetch(url='http://rants.example.com/t/13/last.json', method='GET', payload='', response=response)
 
         discourse_client.content.getTopicLast(topic_id=13).get_result()
+
+    def testPollerYieldsOnlyNewTopics(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'topic_list': {
+            'more_topics_url': '/latest?page=1',
+            'topics': [
+                {'id': 9, 'pinned': True, 'bumped_at': '2015-06-01T09:00:00.000Z'},
+                {'id': 3, 'bumped_at': '2015-06-01T10:03:00.000Z'},
+                {'id': 2, 'bumped_at': '2015-06-01T10:02:00.000Z'},
+                {'id': 1, 'bumped_at': '2015-06-01T10:01:00.000Z'}
+            ]
+        }})
+        self._expectUrlfetch(url='http://rants.example.com/latest.json?page=0', method='GET', payload='', response=response).once()
+
+        poller = content.TopicPoller(
+            discourse_client.content, cursor=('2015-06-01T10:02:00.000Z', 2))
+
+        self.assertEqual([3], [topic['id'] for topic in poller.poll().get_result()])
+        self.assertEqual(('2015-06-01T10:03:00.000Z', 3), poller.cursor)
+
+    def testPollerPagesUntilCaughtUp(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'topic_list': {
+            'more_topics_url': '/latest?page=1',
+            'topics': [
+                {'id': 5, 'bumped_at': '2015-06-01T10:05:00.000Z'},
+                {'id': 4, 'bumped_at': '2015-06-01T10:04:00.000Z'}
+            ]
+        }})
+        self._expectUrlfetch(url='http://rants.example.com/latest.json?page=0', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'topic_list': {
+            'more_topics_url': '/latest?page=2',
+            'topics': [
+                {'id': 3, 'bumped_at': '2015-06-01T10:03:00.000Z'},
+                {'id': 2, 'bumped_at': '2015-06-01T10:02:00.000Z'}
+            ]
+        }})
+        self._expectUrlfetch(url='http://rants.example.com/latest.json?page=1', method='GET', payload='', response=response).once()
+
+        poller = content.TopicPoller(
+            discourse_client.content, cursor=('2015-06-01T10:02:00.000Z', 2))
+
+        self.assertEqual([5, 4, 3], [topic['id'] for topic in poller.poll().get_result()])
+        self.assertEqual(('2015-06-01T10:05:00.000Z', 5), poller.cursor)
+        self.assertFalse(poller.truncated)
+
+    def testTruncatedPollKeepsCursor(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'topic_list': {
+            'more_topics_url': '/latest?page=1',
+            'topics': [
+                {'id': 5, 'bumped_at': '2015-06-01T10:05:00.000Z'},
+                {'id': 4, 'bumped_at': '2015-06-01T10:04:00.000Z'}
+            ]
+        }})
+        self._expectUrlfetch(url='http://rants.example.com/latest.json?page=0', method='GET', payload='', response=response).once()
+
+        poller = content.TopicPoller(
+            discourse_client.content, cursor=('2015-06-01T10:02:00.000Z', 2), max_pages=1)
+
+        self.assertEqual([5, 4], [topic['id'] for topic in poller.poll().get_result()])
+        self.assertEqual(('2015-06-01T10:02:00.000Z', 2), poller.cursor)
+        self.assertTrue(poller.truncated)
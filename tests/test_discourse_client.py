@@ -0,0 +1,252 @@
+import gzip
+import json
+import StringIO
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import urlfetch_stub
+from google.appengine.ext import ndb
+
+from gae_discourse_client import cache
+from gae_discourse_client import discourse_client
+from gae_discourse_client import retry
+import base
+
+
+class DiscourseAPIClientUnitTestCase(base.TestCase):
+    def setUp(self):
+        super(DiscourseAPIClientUnitTestCase, self).setUp()
+        self.credentials = {'api_key': 'super-secret-key', 'api_username': 'system'}
+
+        apiproxy_stub_map.apiproxy = apiproxy_stub_map.APIProxyStubMap()
+        apiproxy_stub_map.apiproxy.RegisterStub(
+            'urlfetch', urlfetch_stub.URLFetchServiceStub())
+
+        self.client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/',
+            self.credentials['api_key'],
+            self.credentials['api_username']
+        )
+
+    def testConcurrentGetsAreCoalesced(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).once()
+
+        first = self.client.getRequest('admin/groups.json')
+        second = self.client.getRequest('admin/groups.json')
+
+        self.assertEqual(first.get_result(), second.get_result())
+        self.assertEqual({'sent': 1, 'coalesced': 1}, self.client.getCoalescingStats())
+
+    def testSequentialGetsAreNotCoalesced(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).times(2)
+
+        self.client.getRequest('admin/groups.json').get_result()
+        self.client.getRequest('admin/groups.json').get_result()
+
+        self.assertEqual({'sent': 2, 'coalesced': 0}, self.client.getCoalescingStats())
+
+    def testWritesAreNotCoalesced(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload='usernames=peyton18', response=response).times(2)
+
+        first = self.client.putRequest('admin/groups/32/members.json', payload={'usernames': 'peyton18'})
+        second = self.client.putRequest('admin/groups/32/members.json', payload={'usernames': 'peyton18'})
+        ndb.Future.wait_all([first, second])
+
+        self.assertEqual({'sent': 0, 'coalesced': 0}, self.client.getCoalescingStats())
+
+    def testThrottledRequestIsRetriedAfterRetryAfter(self):
+        response = self.mock()
+        response.status_code = 429
+        response.content = ''
+        response.headers = {'Retry-After': '0'}
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload='usernames=peyton18', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload='usernames=peyton18', response=response).once()
+
+        result = self.client.putRequest('admin/groups/32/members.json', payload={'usernames': 'peyton18'}).get_result()
+        self.assertEqual({'success': True}, result)
+
+    def testThrottledRequestFailsAfterMaxRetries(self):
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'], self.credentials['api_username'],
+            max_throttle_retries=1)
+
+        response = self.mock()
+        response.status_code = 429
+        response.content = ''
+        response.headers = {'Retry-After': '0'}
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).times(2)
+
+        with self.assertRaises(discourse_client.Error):
+            client.getRequest('site.json').get_result()
+
+    def testFailedGetIsRetried(self):
+        retries = []
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'], self.credentials['api_username'],
+            retry_policy=retry.RetryPolicy(base_delay=0, on_retry=retries.append))
+
+        response = self.mock()
+        response.status_code = 502
+        response.content = ''
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'categories': []})
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        self.assertEqual({'categories': []}, client.getRequest('site.json').get_result())
+        self.assertEqual(1, len(retries))
+        self.assertEqual(502, retries[0]['status_code'])
+        self.assertEqual('site.json', retries[0]['endpoint'])
+
+    def testFailedPostIsNotRetried(self):
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'], self.credentials['api_username'],
+            retry_policy=retry.RetryPolicy(base_delay=0))
+
+        response = self.mock()
+        response.status_code = 502
+        response.content = ''
+        self._expectUrlfetch(url='http://rants.example.com/users/', method='POST', payload='', response=response).once()
+
+        with self.assertRaises(discourse_client.Error):
+            client.postRequest('users/', payload={'username': 'peyton18'}).get_result()
+
+    def testConditionalGetReturnsCachedBodyOnNotModified(self):
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'], self.credentials['api_username'],
+            validator_cache=cache.LRUCache())
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'categories': [{'name': 'Football Players', 'id': 55}]})
+        response.headers = {'ETag': 'W/"abc"'}
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 304
+        response.content = ''
+        response.headers = {'ETag': 'W/"abc"'}
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response, headers={'If-None-Match': 'W/"abc"'}).once()
+
+        first = client.getRequest('site.json').get_result()
+        second = client.getRequest('site.json').get_result()
+        self.assertIs(first, second)
+
+    def testInvalidateCachedDropsValidators(self):
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'], self.credentials['api_username'],
+            validator_cache=cache.LRUCache())
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'categories': []})
+        response.headers = {'ETag': 'W/"abc"'}
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).times(2)
+
+        client.getRequest('site.json').get_result()
+        client.invalidateCached('site.json')
+        client.getRequest('site.json').get_result()
+
+    def testGzipResponsesAreDecompressed(self):
+        body = json.dumps({'categories': [{'name': 'Football Players', 'id': 55}] * 50})
+        compressed = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+            f.write(body)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = compressed.getvalue()
+        response.headers = {'Content-Encoding': 'gzip'}
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response)
+
+        result = self.client.getRequest('site.json').get_result()
+        self.assertEqual(50, len(result['categories']))
+
+        stats = self.client.getTransferStats()['site.json']
+        self.assertEqual(1, stats['responses'])
+        self.assertEqual(len(compressed.getvalue()), stats['wire_bytes'])
+        self.assertEqual(len(body), stats['decoded_bytes'])
+
+    def testTransferStatsLeaveOutErrorResponses(self):
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'], self.credentials['api_username'],
+            retry_policy=retry.RetryPolicy(base_delay=0))
+
+        response = self.mock()
+        response.status_code = 502
+        response.content = '<html>Bad Gateway</html>'
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        body = json.dumps({'categories': []})
+        response = self.mock()
+        response.status_code = 200
+        response.content = body
+        self._expectUrlfetch(url='http://rants.example.com/site.json', method='GET', payload='', response=response).once()
+
+        client.getRequest('site.json').get_result()
+
+        stats = client.getTransferStats()['site.json']
+        self.assertEqual(1, stats['responses'])
+        self.assertEqual(len(body), stats['wire_bytes'])
+
+    def testRequestsAreRecordedPerEndpointTemplate(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='DELETE', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 404
+        response.content = json.dumps({})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/33/members.json', method='DELETE', payload='', response=response)
+
+        self.client.deleteRequest('admin/groups/32/members.json', params={'user_id': 18}).get_result()
+        with self.assertRaises(discourse_client.Error):
+            self.client.deleteRequest('admin/groups/33/members.json', params={'user_id': 18}).get_result()
+
+        stats = self.client.getMetrics().snapshot()['DELETE']['admin/groups/{id}/members.json']
+        self.assertEqual(2, stats['requests'])
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual(2, sum(stats['latency_histogram']))
+
+    def testJsonDecoderIsPluggable(self):
+        decoded = []
+
+        def decoder(content):
+            decoded.append(content)
+            return json.loads(content)
+
+        client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', self.credentials['api_key'],
+            self.credentials['api_username'], json_decoder=decoder)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        self.assertEqual(32, client.getRequest('admin/groups.json').get_result()[0]['id'])
+        self.assertEqual([response.content], decoded)
+
+    def testRequestDecoderReplacesJsonDecoding(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        result = self.client.getRequest('admin/groups.json', decoder=len).get_result()
+        self.assertEqual(len(response.content), result)
@@ -0,0 +1,124 @@
+from gae_discourse_client import emailindex
+from gae_discourse_client import users
+import base
+
+
+class EmailIndexTestCase(base.FakeDiscourseTestCase):
+    fake_options = {'num_users': 250, 'num_groups': 0}
+    storage_class = emailindex.DatastoreStorage
+
+    def setUp(self):
+        super(EmailIndexTestCase, self).setUp()
+        self.index = emailindex.EmailIndex(storage=self.storage_class(), num_shards=8)
+        self.user_client = users.UserClient(self.api_client, email_index=self.index)
+
+    def activeListRequests(self):
+        return [path for method, path in self.fake.requests if path == 'admin/users/list/active.json']
+
+    def testFullRefreshIndexesEveryActiveUser(self):
+        self.assertEqual(250, self.user_client.refreshEmailIndex(concurrency=2).get_result())
+
+        user = self.index.lookup('User42@example.com').get_result()
+        self.assertEqual('user42', user['username'])
+        self.assertEqual(self.fake.users['user42']['id'], user['id'])
+        self.assertIsNone(self.index.lookup('nobody@example.com').get_result())
+
+    def testIncrementalRefreshStopsAtKnownUsers(self):
+        self.user_client.refreshEmailIndex().get_result()
+        self.fake._addUser('peyton18', 'peyton18@example.com', 'Peyton Manning')
+        del self.fake.requests[:]
+
+        self.assertEqual(1, self.user_client.refreshEmailIndex(concurrency=1).get_result())
+        self.assertEqual(1, len(self.activeListRequests()))
+        self.assertEqual('peyton18', self.index.lookup('peyton18@example.com').get_result()['username'])
+        self.assertEqual('user7', self.index.lookup('user7@example.com').get_result()['username'])
+
+    def testCreateManySkipsIndexedUsers(self):
+        self.user_client.refreshEmailIndex().get_result()
+        del self.fake.requests[:]
+
+        results = self.user_client.createMany([
+            {'name': 'User 7', 'email': 'User7@example.com', 'password': 'password', 'username': 'user7'},
+            {'name': 'Peyton Manning', 'email': 'peyton18@example.com', 'password': 'omahaomaha', 'username': 'peyton18'}
+        ], skip_existing=True).get_result()
+
+        self.assertEqual({'success': True, 'skipped': True}, results['User7@example.com'])
+        self.assertTrue(results['peyton18@example.com']['success'])
+        self.assertEqual([], self.activeListRequests())
+
+    def testIncrementalRefreshReadsFirstPageAlone(self):
+        self.user_client.refreshEmailIndex().get_result()
+        self.fake._addUser('peyton18', 'peyton18@example.com', 'Peyton Manning')
+        del self.fake.requests[:]
+
+        self.assertEqual(1, self.user_client.refreshEmailIndex(concurrency=4).get_result())
+        self.assertEqual(1, len(self.activeListRequests()))
+
+    def testConcurrentUpdatesOfAShardAreBothKept(self):
+        first = {'id': 1, 'username': 'first', 'email': 'a@example.com'}
+        # A second address in the same shard as the first.
+        number = self.index._shardNumber(first['email'])
+        email = next('b%d@example.com' % i for i in xrange(1000)
+                     if self.index._shardNumber('b%d@example.com' % i) == number)
+        second = {'id': 2, 'username': 'second', 'email': email}
+
+        # Each update starts from the same stored shard, as two instances would.
+        other = emailindex.EmailIndex(storage=self.index._storage, num_shards=8)
+        futures = [self.index.update([first]), other.update([second])]
+        for future in futures:
+            future.get_result()
+
+        index = emailindex.EmailIndex(storage=self.index._storage, num_shards=8)
+        self.assertEqual('first', index.lookup(first['email']).get_result()['username'])
+        self.assertEqual('second', index.lookup(second['email']).get_result()['username'])
+
+    def testGetByEmailAnswersFromIndex(self):
+        self.user_client.refreshEmailIndex().get_result()
+        del self.fake.requests[:]
+
+        user = self.user_client.getByEmail('user42@example.com', identity_only=True).get_result()
+        self.assertEqual('user42', user['username'])
+        self.assertEqual([], self.fake.requests)
+
+    def testGetByEmailFetchesFullRecordOfIndexedUser(self):
+        self.user_client.refreshEmailIndex().get_result()
+        del self.fake.requests[:]
+
+        user = self.user_client.getByEmail('user42@example.com').get_result()
+        self.assertEqual('user42', user['username'])
+        self.assertIn('groups', user)
+        self.assertEqual([], self.activeListRequests())
+
+    def testGetByEmailFallsBackToSearch(self):
+        self.user_client.refreshEmailIndex().get_result()
+        self.fake._addUser('peyton18', 'peyton18@example.com', 'Peyton Manning')
+        del self.fake.requests[:]
+
+        user = self.user_client.getByEmail('peyton18@example.com').get_result()
+        self.assertEqual('peyton18', user['username'])
+        self.assertEqual(1, len(self.activeListRequests()))
+
+    def testDeleteRemovesFromIndex(self):
+        self.user_client.refreshEmailIndex().get_result()
+        self.user_client.delete('user42@example.com').get_result()
+        self.assertIsNone(self.index.lookup('user42@example.com').get_result())
+
+    def testUpdateMovesChangedEmail(self):
+        self.user_client.refreshEmailIndex().get_result()
+        user_id = self.fake.users['user42']['id']
+        self.index.update([{'id': user_id, 'username': 'user42', 'email': 'new42@example.com'}]).get_result()
+
+        self.assertIsNone(self.index.lookup('user42@example.com').get_result())
+        self.assertEqual(user_id, self.index.lookup('new42@example.com').get_result()['id'])
+
+        self.index.removeById(user_id).get_result()
+        self.assertIsNone(self.index.lookup('new42@example.com').get_result())
+
+    def testRefreshWithoutIndexRaisesError(self):
+        user_client = users.UserClient(None)
+        with self.assertRaises(users.Error):
+            user_client.refreshEmailIndex().get_result()
+
+
+class MemcacheEmailIndexTestCase(EmailIndexTestCase):
+    storage_class = emailindex.MemcacheStorage
@@ -6,6 +6,7 @@ from google.appengine.api import urlfetch_stub
 from google.appengine.ext import ndb
 
 from gae_discourse_client import discourse_client
+from gae_discourse_client import models
 import base
 
 
@@ -85,6 +86,139 @@ class DiscourseUserUnitTestCase(base.TestCase):
 
         discourse_client.groups.addUserByUsername('peyton18', 'quarterbacks').get_result()
 
+    def testGroupLookupsShareIndex(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload=urlencode({'usernames': 'peyton18'}), response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload=urlencode({'usernames': 'eli10'}), response=response)
+
+        discourse_client.groups.addUserByUsername('peyton18', 'quarterbacks').get_result()
+        discourse_client.groups.addUserByUsername('eli10', 'quarterbacks').get_result()
+
+    def testLookupScansListingWhenIndexDisabled(self):
+        group_client = discourse_client.groups_module.GroupClient(
+            discourse_client.groups._api_client, discourse_client.users, index_ttl=0)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}, {'name': 'receivers', 'id': 33}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).times(3)
+
+        self.assertEqual(33, group_client.getByName('receivers').get_result()['id'])
+        self.assertEqual('quarterbacks', group_client.getById(32).get_result()['name'])
+        self.assertIsNone(group_client.getByName('linebackers').get_result())
+
+    def testCreateGroupUpdatesIndex(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'basic_group': {'name': 'quarterbacks', 'id': 40}})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups', method='POST', payload='', response=response)
+
+        discourse_client.groups.create(group_name='quarterbacks').get_result()
+
+        group = discourse_client.groups.getByName('quarterbacks').get_result()
+        self.assertEqual(40, group['id'])
+        self.assertEqual('quarterbacks', discourse_client.groups.getById(40).get_result()['name'])
+
+    def testDeleteGroupRemovesFromIndex(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'deleted': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32', method='DELETE', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        discourse_client.groups.delete('quarterbacks').get_result()
+        self.assertIsNone(discourse_client.groups.getByName('quarterbacks').get_result())
+
+    def testInvalidateIndexForcesReload(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).times(2)
+
+        discourse_client.groups.getByName('quarterbacks').get_result()
+        discourse_client.groups.invalidateIndex()
+        discourse_client.groups.getByName('quarterbacks').get_result()
+
+    def testMissingGroupsReloadIndexOnceBeforeItExpires(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).times(2)
+
+        for group_name in ('linebackers', 'linebackers', 'kickers', 'punters'):
+            self.assertIsNone(discourse_client.groups.getByName(group_name).get_result())
+
+    def testAddUsersByUsernameSendsChunks(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        payload = urlencode({'usernames': 'peyton18,eli10'})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload=payload, response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        payload = urlencode({'usernames': 'tom12'})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload=payload, response=response).once()
+
+        results = discourse_client.groups.addUsersByUsername(
+            ['peyton18', 'eli10', 'peyton18', 'tom12'], 'quarterbacks', chunk_size=2
+        ).get_result()
+
+        self.assertEqual({'peyton18', 'eli10', 'tom12'}, set(results))
+        self.assertTrue(all(result['success'] for result in results.values()))
+
+    def testRemoveUsersByIdReportsFailures(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json?user_id=18', method='DELETE', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 404
+        response.content = json.dumps({})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json?user_id=12', method='DELETE', payload='', response=response).once()
+
+        results = discourse_client.groups.removeUsersById([18, 12], 'quarterbacks').get_result()
+
+        self.assertTrue(results[18]['success'])
+        self.assertFalse(results[12]['success'])
+
     def testAddUserFailsWhenUserNotFound(self):
         response = self.mock()
         response.status_code = 404
@@ -171,3 +305,117 @@ class DiscourseUserUnitTestCase(base.TestCase):
         self.assertEqual(2, len(response['members']))
         self.assertEqual(2, response['meta']['total'])
         self.assertTrue(any(member['name'] == 'Andrew Luck' for member in response['members']))
+
+    def testGetAllMembersFetchesEveryPage(self):
+        for offset, members in ((0, [{'id': 18, 'username': 'peyton18'}, {'id': 10, 'username': 'eli10'}]),
+                                (2, [{'id': 12, 'username': 'tom12'}])):
+            response = self.mock()
+            response.status_code = 200
+            response.content = json.dumps({
+                'members': members,
+                'meta': {'total': 3, 'limit': 2, 'offset': offset}
+            })
+            self._expectUrlfetch(
+                url='http://rants.example.com/groups/quarterbacks/members.json?limit=2&offset=%d' % offset,
+                method='GET', payload='', response=response).once()
+
+        members = discourse_client.groups.getAllMembers('quarterbacks', page_size=2).get_result()
+        self.assertEqual(['peyton18', 'eli10', 'tom12'], [member['username'] for member in members])
+
+    def testGetAllMembersAsModels(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({
+            'members': [{'id': 18, 'username': 'peyton18', 'avatar_template': '/peyton18.png'}],
+            'meta': {'total': 1, 'limit': 50, 'offset': 0}
+        })
+        self._expectUrlfetch(
+            url='http://rants.example.com/groups/quarterbacks/members.json?limit=50&offset=0',
+            method='GET', payload='', response=response)
+
+        members = discourse_client.groups.getAllMembers('quarterbacks', as_models=True).get_result()
+        self.assertEqual(18, members[0].id)
+        self.assertEqual('peyton18', members[0]['username'])
+        self.assertIsNone(members[0].get('avatar_template'))
+
+    def testGetAllMembersAsModelsKeepsRequestedFields(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({
+            'members': [{'id': 18, 'username': 'peyton18', 'avatar_template': '/peyton18.png',
+                         'title': 'Sheriff'}],
+            'meta': {'total': 1, 'limit': 50, 'offset': 0}
+        })
+        self._expectUrlfetch(
+            url='http://rants.example.com/groups/quarterbacks/members.json?limit=50&offset=0',
+            method='GET', payload='', response=response)
+
+        members = discourse_client.groups.getAllMembers(
+            'quarterbacks', as_models=True,
+            fields=models.Member.fields + ('avatar_template',)).get_result()
+        self.assertEqual('/peyton18.png', members[0]['avatar_template'])
+        self.assertNotIn('title', members[0].raw)
+
+    def testGetMembersKeepsOnlyRequestedFields(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({
+            'members': [{'id': 18, 'username': 'peyton18', 'avatar_template': '/peyton18.png'}],
+            'meta': {'total': 1, 'limit': 50, 'offset': 0}
+        })
+        self._expectUrlfetch(
+            url='http://rants.example.com/groups/quarterbacks/members.json?limit=50&offset=0',
+            method='GET', payload='', response=response)
+
+        response = discourse_client.groups.getMembers('quarterbacks', fields=['username']).get_result()
+        self.assertEqual([{'username': 'peyton18'}], response['members'])
+        self.assertEqual(1, response['meta']['total'])
+
+    def testGetAllGroupsWithFieldsDecodesOnlyThose(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'id': 32, 'name': 'quarterbacks', 'user_count': 2, 'title': 'QB'}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        def decodeFully(content):
+            self.fail("The listing was decoded in full")
+        discourse_client.groups._api_client._json_decoder = decodeFully
+
+        self.assertEqual([{'name': 'quarterbacks'}], discourse_client.groups.getAllGroups(fields=['name']).get_result())
+        self.assertFalse(discourse_client.groups._index.isFresh())
+
+    def testSyncMembersSendsOnlyDifferences(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({
+            'members': [
+                {'id': 18, 'username': 'peyton18'},
+                {'id': 10, 'username': 'eli10'}
+            ],
+            'meta': {'total': 2, 'limit': 50, 'offset': 0}
+        })
+        self._expectUrlfetch(
+            url='http://rants.example.com/groups/quarterbacks/members.json?limit=50&offset=0', method='GET',
+            payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response).any_order().at_least_once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload=urlencode({'usernames': 'tom12'}), response=response).any_order().once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json?user_id=10', method='DELETE', payload='', response=response).any_order().once()
+
+        report = discourse_client.groups.syncMembers('quarterbacks', ['Peyton18', 'tom12']).get_result()
+
+        self.assertEqual(['tom12'], report['added'])
+        self.assertEqual(['eli10'], report['removed'])
+        self.assertEqual({}, report['failed'])
+        self.assertEqual(1, report['unchanged'])
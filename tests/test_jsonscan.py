@@ -0,0 +1,102 @@
+import json
+import unittest
+
+from gae_discourse_client import jsonscan
+
+
+class IterArrayTestCase(unittest.TestCase):
+    def testYieldsTopLevelElements(self):
+        content = json.dumps([{'name': 'quarterbacks', 'id': 32}, {'name': 'receivers', 'id': 33}])
+        self.assertEqual(json.loads(content), list(jsonscan.iterArray(content)))
+
+    def testYieldsNestedArray(self):
+        content = json.dumps({
+            'post_action_types': [{'id': 1}],
+            'categories': [{'name': 'Sports', 'id': 8}],
+            'groups': []
+        }, indent=2)
+        self.assertEqual([{'name': 'Sports', 'id': 8}],
+                         list(jsonscan.iterArray(content, ('categories',))))
+
+    def testEmptyArray(self):
+        self.assertEqual([], list(jsonscan.iterArray(' [ ] ')))
+
+    def testMissingKeyRaisesError(self):
+        with self.assertRaises(jsonscan.Error):
+            list(jsonscan.iterArray(json.dumps({'groups': []}), ('categories',)))
+
+    def testMalformedContentRaisesError(self):
+        with self.assertRaises(jsonscan.Error):
+            list(jsonscan.iterArray('[{"id": 1} {"id": 2}]'))
+
+    def testMissingCommaBeforeArrayRaisesError(self):
+        with self.assertRaises(ValueError):
+            list(jsonscan.iterArray('{"groups": [] "categories": []}', ('categories',)))
+
+
+class FindFirstTestCase(unittest.TestCase):
+    def testReturnsFirstMatch(self):
+        content = json.dumps([{'name': 'quarterbacks', 'id': 32}, {'name': 'receivers', 'id': 33}])
+        self.assertEqual({'name': 'receivers', 'id': 33},
+                         jsonscan.findFirst(content, lambda group: group['id'] == 33))
+
+    def testStopsAtFirstMatch(self):
+        # The element after the match is malformed, and is never decoded.
+        content = '[{"name": "quarterbacks", "id": 32}, {"name": '
+        self.assertEqual({'name': 'quarterbacks', 'id': 32},
+                         jsonscan.findFirst(content, lambda group: group['id'] == 32))
+
+    def testReturnsNoneWithoutMatch(self):
+        content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self.assertIsNone(jsonscan.findFirst(content, lambda group: group['id'] == 33))
+
+    def testMatchDecodesFirstMatch(self):
+        content = json.dumps([{'name': 'quarterbacks', 'id': 32}, {'name': 'receivers', 'id': 33}])
+        self.assertEqual({'name': 'receivers', 'id': 33}, jsonscan.Match('id', 33)(content))
+
+    def testEqualMatchesCompareEqual(self):
+        self.assertEqual(jsonscan.Match('name', 'quarterbacks'), jsonscan.Match('name', 'quarterbacks'))
+        self.assertEqual(hash(jsonscan.Match('id', 32)), hash(jsonscan.Match('id', 32)))
+        self.assertNotEqual(jsonscan.Match('id', 32), jsonscan.Match('id', 33))
+
+
+class ProjectArrayTestCase(unittest.TestCase):
+    def testKeepsOnlyFieldsOfElements(self):
+        content = json.dumps({
+            'members': [
+                {'id': 18, 'username': 'peyton18', 'avatar_template': '/peyton18.png'},
+                {'id': 10, 'username': 'eli10'}
+            ],
+            'meta': {'total': 2}
+        })
+        self.assertEqual(
+            {'members': [{'id': 18, 'username': 'peyton18'}, {'id': 10, 'username': 'eli10'}],
+             'meta': {'total': 2}},
+            jsonscan.projectArray(content, ['id', 'username'], ('members',)))
+
+    def testProjectsNestedArray(self):
+        content = json.dumps({'users': [], 'topic_list': {'topics': [{'id': 1, 'title': 'Welcome', 'views': 10}]}})
+        self.assertEqual(
+            {'users': [], 'topic_list': {'topics': [{'id': 1}]}},
+            jsonscan.projectArray(content, ['id'], ('topic_list', 'topics')))
+
+    def testMissingKeyRaisesError(self):
+        with self.assertRaises(jsonscan.Error):
+            jsonscan.projectArray(json.dumps({'meta': {}}), ['id'], ('members',))
+
+    def testMalformedObjectsRaiseValueError(self):
+        for content in ('{"meta": {} "members": []}', '{"members": [], "meta": {},}',
+                        '{"members": [] , , "meta": {}}'):
+            with self.assertRaises(ValueError):
+                jsonscan.projectArray(content, ['id'], ('members',))
+
+    def testEqualProjectionsCompareEqual(self):
+        self.assertEqual(jsonscan.Projection(['id', 'name']), jsonscan.Projection(('name', 'id')))
+        self.assertEqual(hash(jsonscan.Projection(['id'], ('members',))),
+                         hash(jsonscan.Projection(['id'], ['members'])))
+        self.assertNotEqual(jsonscan.Projection(['id']), jsonscan.Projection(['id'], ('members',)))
+
+    def testCombineFields(self):
+        self.assertEqual(frozenset(['id', 'name', 'slug']),
+                         jsonscan.combineFields(['id', 'name'], frozenset(['id', 'slug'])))
+        self.assertIsNone(jsonscan.combineFields(None, ['id']))
@@ -0,0 +1,96 @@
+from google.appengine.ext import ndb
+
+from gae_discourse_client import groups
+from gae_discourse_client import users
+import base
+
+
+class MembershipBatchTestCase(base.FakeDiscourseTestCase):
+    fake_options = {'num_users': 20, 'num_groups': 2, 'members_per_group': 0,
+                    'num_categories': 0, 'num_topics': 0}
+
+    def setUp(self):
+        super(MembershipBatchTestCase, self).setUp()
+        self.group_client = groups.GroupClient(self.api_client, users.UserClient(self.api_client))
+        self.group_client.refreshIndex().get_result()
+        del self.fake.requests[:]
+
+    def memberRequests(self, method):
+        return [path for request_method, path in self.fake.requests
+                if request_method == method and path.endswith('/members.json')]
+
+    def testAddsToAGroupAreSentTogether(self):
+        with self.group_client.batch():
+            futures = [self.group_client.addUserByUsername('user%d' % i, 'group0')
+                       for i in xrange(5)]
+            futures.append(self.group_client.addUserByUsername('user2', 'group0'))
+            futures.append(self.group_client.addUserByEmail('user7@example.com', 'group1'))
+            self.assertEqual([], self.memberRequests('PUT'))
+
+        self.assertEqual(2, len(self.memberRequests('PUT')))
+        self.assertTrue(all(future.get_result()['success'] == 'OK' for future in futures))
+        self.assertEqual(set('user%d' % i for i in xrange(5)), self.members('group0'))
+        self.assertEqual(set(['user7']), self.members('group1'))
+
+    def testLastChangeOfAUserWins(self):
+        self.members('group0').add('user3')
+
+        with self.group_client.batch():
+            first = self.group_client.addUserByUsername('user1', 'group0')
+            second = self.group_client.removeUserByUsername('user1', 'group0')
+            self.group_client.removeUserByUsername('user3', 'group0')
+            self.group_client.addUserByUsername('user3', 'group0')
+
+        self.assertEqual(first.get_result(), second.get_result())
+        self.assertEqual(set(['user3']), self.members('group0'))
+        self.assertEqual(1, len(self.memberRequests('PUT')))
+        self.assertEqual(1, len(self.memberRequests('DELETE')))
+
+    def testLastChangeWinsWhenAUserIsGivenByIdAndUsername(self):
+        user_id = self.fake.users['user5']['id']
+        with self.group_client.batch():
+            self.group_client.removeUserById(user_id, 'group0')
+            self.group_client.addUserByUsername('user5', 'group0')
+
+        self.assertEqual(set(['user5']), self.members('group0'))
+        self.assertEqual([], self.memberRequests('DELETE'))
+
+    def testBatchCanBeStoppedFromATasklet(self):
+        @ndb.tasklet
+        def addUsers():
+            batch = self.group_client.batch()
+            batch.start()
+            futures = [self.group_client.addUserByUsername('user%d' % i, 'group0')
+                       for i in xrange(3)]
+            yield batch.stopAsync()
+            results = yield futures
+            raise ndb.Return(results)
+
+        self.assertEqual(3, len(addUsers().get_result()))
+        self.assertEqual(1, len(self.memberRequests('PUT')))
+
+    def testReachingMaxSizeFlushes(self):
+        with self.group_client.batch(max_size=3):
+            futures = [self.group_client.addUserByUsername('user%d' % i, 'group0')
+                       for i in xrange(7)]
+
+        self.assertEqual(3, len(self.memberRequests('PUT')))
+        self.assertEqual(7, len(self.members('group0')))
+        self.assertEqual(7, len([future.get_result() for future in futures]))
+
+    def testFailuresAreRaisedByTheirFutures(self):
+        with self.group_client.batch():
+            unknown_user = self.group_client.addUserByEmail('nobody@example.com', 'group0')
+            unknown_group = self.group_client.addUserByUsername('user1', 'nogroup')
+            added = self.group_client.addUserByUsername('user1', 'group0')
+
+        self.assertRaises(groups.Error, unknown_user.get_result)
+        self.assertRaises(groups.Error, unknown_group.get_result)
+        self.assertEqual('OK', added.get_result()['success'])
+
+    def testChangesAreSentRightAwayOutsideOfABatch(self):
+        with self.group_client.batch():
+            pass
+
+        self.group_client.addUserByUsername('user1', 'group0').get_result()
+        self.assertEqual(1, len(self.memberRequests('PUT')))
@@ -0,0 +1,66 @@
+import unittest
+
+from gae_discourse_client import metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = metrics.Metrics(latency_bounds=(0.1, 1.0))
+
+    def testRecordsPerMethodAndEndpoint(self):
+        self.metrics.record('GET', 'admin/groups.json', 0.05, status_code=200, request_bytes=40,
+                            response_bytes=300)
+        self.metrics.record('GET', 'admin/groups.json', 0.5, status_code=502, error=True,
+                            request_bytes=40, response_bytes=10)
+        self.metrics.record('PUT', 'admin/groups/{id}/members.json', 3.0, status_code=200)
+
+        snapshot = self.metrics.snapshot()
+        stats = snapshot['GET']['admin/groups.json']
+        self.assertEqual(2, stats['requests'])
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual([1, 1, 0], stats['latency_histogram'])
+        self.assertEqual([0.1, 1.0], stats['latency_bounds'])
+        self.assertEqual(80, stats['request_bytes'])
+        self.assertEqual(310, stats['response_bytes'])
+        self.assertEqual([0, 0, 1], snapshot['PUT']['admin/groups/{id}/members.json']['latency_histogram'])
+
+    def testSnapshotIsACopy(self):
+        self.metrics.record('GET', 'site.json', 0.05, status_code=200)
+        snapshot = self.metrics.snapshot()
+        self.metrics.record('GET', 'site.json', 0.05, status_code=200)
+        self.assertEqual(1, snapshot['GET']['site.json']['requests'])
+
+    def testSinksReceiveEachRequest(self):
+        records = []
+        self.metrics.addSink(records.append)
+        self.metrics.record('DELETE', 'admin/groups/{id}', 0.2, status_code=200)
+
+        self.assertEqual(1, len(records))
+        self.assertEqual('admin/groups/{id}', records[0]['endpoint'])
+        self.assertEqual(200, records[0]['status_code'])
+        self.assertFalse(records[0]['error'])
+
+    def testFailingSinkDoesNotFailTheRequest(self):
+        def failingSink(record):
+            raise ValueError('sink is down')
+
+        records = []
+        self.metrics.addSink(failingSink)
+        self.metrics.addSink(records.append)
+        self.metrics.record('GET', 'site.json', 0.05, status_code=200)
+
+        self.assertEqual(1, len(records))
+        self.assertEqual(1, self.metrics.snapshot()['GET']['site.json']['requests'])
+
+    def testRecordDecoded(self):
+        self.metrics.recordDecoded('GET', 'site.json', 1200, wire_bytes=300)
+        stats = self.metrics.snapshot()['GET']['site.json']
+        self.assertEqual(1, stats['decoded_responses'])
+        self.assertEqual(300, stats['decoded_wire_bytes'])
+        self.assertEqual(1200, stats['decoded_bytes'])
+        self.assertEqual(0, stats['requests'])
+
+    def testReset(self):
+        self.metrics.record('GET', 'site.json', 0.05, status_code=200)
+        self.metrics.reset()
+        self.assertEqual({}, self.metrics.snapshot())
@@ -0,0 +1,119 @@
+from google.appengine.api import datastore_errors
+
+from gae_discourse_client import categories
+from gae_discourse_client import groups
+from gae_discourse_client import mirror
+from gae_discourse_client import users
+import base
+
+
+class MirrorTestCase(base.FakeDiscourseTestCase):
+    fake_options = {'num_users': 20, 'num_groups': 3, 'members_per_group': 5,
+                    'num_categories': 2, 'subcategories_per_category': 2, 'num_topics': 0}
+
+    def setUp(self):
+        super(MirrorTestCase, self).setUp()
+        self.mirror = mirror.Mirror()
+
+        user_client = users.UserClient(self.api_client)
+        self.group_client = groups.GroupClient(self.api_client, user_client, mirror=self.mirror)
+        self.category_client = categories.CategoryClient(self.api_client, mirror=self.mirror)
+
+        self.report = self.mirror.sync(
+            self.group_client, self.category_client, member_groups=['group0']).get_result()
+
+        # Drop the clients' in-memory indexes, so that only the mirror can answer.
+        self.group_client = groups.GroupClient(self.api_client, user_client, mirror=self.mirror)
+        self.category_client = categories.CategoryClient(self.api_client, mirror=self.mirror)
+        del self.fake.requests[:]
+
+    def testSyncReport(self):
+        self.assertEqual({'groups': 3, 'categories': 6, 'memberships': 5}, self.report)
+        self.assertIsNotNone(self.mirror.getSyncedAt().get_result())
+
+    def testLookupsReadFromMirror(self):
+        self.assertEqual('group1', self.group_client.getByName('group1').get_result()['name'])
+
+        group_id = self.fake.groups.keys()[0]
+        self.assertEqual(group_id, self.group_client.getById(group_id).get_result()['id'])
+
+        category = self.category_client.getBySlug('category-1-0', 'category-1').get_result()
+        self.assertEqual('Category 1-0', category['name'])
+        self.assertIsNone(self.mirror.getCategoryBySlug('category-1-0').get_result())
+
+        category = self.category_client.getByName('Category 0').get_result()
+        self.assertEqual('category-0', category['slug'])
+
+        self.assertEqual([], self.fake.requests)
+
+    def testIsMemberReadsMirroredMembers(self):
+        member = sorted(self.fake.users)[0]
+        self.assertTrue(self.group_client.isMember(member.upper(), 'group0').get_result())
+        self.assertFalse(self.group_client.isMember('user19', 'group0').get_result())
+        self.assertEqual([], self.fake.requests)
+
+    def testIsMemberFallsBackForUnmirroredMembers(self):
+        member = sorted(self.fake.users)[0]
+        self.assertIsNone(self.mirror.isMember(member, 'group1').get_result())
+        self.assertTrue(self.group_client.isMember(member, 'group1').get_result())
+        self.assertEqual([('GET', 'admin/users/%s.json' % member)], self.fake.requests)
+
+    def testResyncDropsDeletedGroups(self):
+        group_id = self.groupId('group2')
+        del self.fake.groups[group_id]
+        del self.fake.members[group_id]
+
+        self.mirror.sync(self.group_client, self.category_client).get_result()
+        self.assertIsNone(self.mirror.getGroupByName('group2').get_result())
+        self.assertTrue(self.mirror.isMember(sorted(self.fake.users)[0], 'group0').get_result())
+
+    def testCreateAndDeleteWriteThrough(self):
+        self.group_client.create('linebackers').get_result()
+        self.assertEqual('linebackers', self.mirror.getGroupByName('linebackers').get_result()['name'])
+
+        self.category_client.delete('Category 1').get_result()
+        self.assertIsNone(self.mirror.getCategoryByName('Category 1').get_result())
+        self.assertIsNone(self.mirror.getCategoryBySlug('category-1-0', 'category-1').get_result())
+
+    def testMembershipChangesWriteThrough(self):
+        self.group_client.addUserByUsername('user19', 'group0').get_result()
+        self.assertTrue(self.mirror.isMember('user19', 'group0').get_result())
+
+        member = sorted(self.fake.users)[0]
+        self.group_client.removeUserById(self.fake.users[member]['id'], 'group0').get_result()
+        self.assertFalse(self.mirror.isMember(member, 'group0').get_result())
+
+        # Members added through the client aren't mirrored with their id, so removing one marks
+        # the members of the group as not mirrored.
+        self.group_client.removeUserById(self.fake.users['user19']['id'], 'group0').get_result()
+        self.assertIsNone(self.mirror.isMember('user19', 'group0').get_result())
+        self.assertFalse(self.group_client.isMember('user19', 'group0').get_result())
+
+    def testResyncDropsMembersOfDeletedGroups(self):
+        group_id = self.groupId('group0')
+        del self.fake.groups[group_id]
+        del self.fake.members[group_id]
+
+        self.mirror.sync(self.group_client, self.category_client).get_result()
+        self.assertEqual([], mirror.MirroredMembership.query(
+            mirror.MirroredMembership.group_id == group_id).fetch())
+
+    def testMembershipsOfEachGroupHaveTheirOwnEntityGroup(self):
+        self.mirror.syncMembers(self.group_client, 'group1').get_result()
+
+        roots = set(membership.key.root() for membership in mirror.MirroredMembership.query())
+        self.assertEqual(2, len(roots))
+        self.assertNotIn(mirror.ndb.Key(mirror.MirrorState, 'default'), roots)
+
+    def testMirrorWriteFailureDoesNotFailMembershipChange(self):
+        self.expect(mirror.ndb, 'put_multi_async').raises(datastore_errors.Timeout())
+
+        self.group_client.addUserByUsername('user19', 'group0').get_result()
+        self.assertIn('user19', self.members('group0'))
+        self.assertIsNone(self.mirror.isMember('user19', 'group0').get_result())
+
+    def testFreshIndexIsReadBeforeMirror(self):
+        self.group_client.refreshIndex().get_result()
+        self.expect(self.mirror, 'getGroupByName').times(0)
+
+        self.assertEqual('group1', self.group_client.getByName('group1').get_result()['name'])
@@ -0,0 +1,49 @@
+import unittest
+
+from gae_discourse_client import models
+
+
+class ModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'id': 18,
+            'username': 'peyton18',
+            'name': 'Peyton Manning',
+            'avatar_template': '/user_avatar/peyton18/{size}/1.png',
+            'last_seen_at': '2015-06-01T12:00:00.000Z'
+        }
+
+    def testFieldsAreSlots(self):
+        member = models.Member.fromDict(self.data)
+        self.assertEqual(18, member.id)
+        self.assertEqual('peyton18', member.username)
+        self.assertFalse(hasattr(member, '__dict__'))
+        with self.assertRaises(AttributeError):
+            member.avatar_template = None
+
+    def testRawPayloadIsKept(self):
+        member = models.Member.fromDict(self.data)
+        self.assertEqual(self.data, member.raw)
+        self.assertEqual(self.data['avatar_template'], member['avatar_template'])
+        self.assertEqual(self.data['avatar_template'], member.get('avatar_template'))
+        self.assertIsNone(member.get('title'))
+        with self.assertRaises(KeyError):
+            member['title']
+
+    def testMissingFieldsAreNone(self):
+        category = models.Category.fromDict({'id': 8, 'name': 'Sports', 'slug': 'sports'})
+        self.assertIsNone(category.parent_category_id)
+        self.assertEqual(
+            {'id': 8, 'name': 'Sports', 'slug': 'sports', 'parent_category_id': None,
+             'topic_count': None},
+            category.toDict())
+
+    def testModelsBuiltDirectly(self):
+        group = models.Group(id=32, name='quarterbacks')
+        self.assertEqual(group, models.Group.fromDict({'id': 32, 'name': 'quarterbacks'}))
+        self.assertEqual({'id': 32, 'name': 'quarterbacks', 'user_count': None, 'automatic': None},
+                         group.raw)
+
+    def testFromList(self):
+        topics = models.Topic.fromList([{'id': 1, 'title': 'Welcome'}, {'id': 2, 'title': 'Rules'}])
+        self.assertEqual(['Welcome', 'Rules'], [topic.title for topic in topics])
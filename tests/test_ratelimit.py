@@ -0,0 +1,90 @@
+import unittest
+
+from gae_discourse_client import endpoints
+from gae_discourse_client import ratelimit
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def testBurstIsServedImmediately(self):
+        bucket = ratelimit.TokenBucket(rate=2, burst=3, clock=self.clock)
+        self.assertEqual([0, 0, 0], [bucket.reserve() for _ in range(3)])
+
+    def testReservationsQueueBehindEachOther(self):
+        bucket = ratelimit.TokenBucket(rate=2, burst=1, clock=self.clock)
+        self.assertEqual([0, 0.5, 1.0], [bucket.reserve() for _ in range(3)])
+
+    def testBucketRefills(self):
+        bucket = ratelimit.TokenBucket(rate=2, burst=1, clock=self.clock)
+        bucket.reserve()
+        self.clock.now += 0.5
+        self.assertEqual(0, bucket.reserve())
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def testUnconfiguredLimiterNeverWaits(self):
+        limiter = ratelimit.RateLimiter(clock=self.clock)
+        self.assertEqual(0, limiter.reserve('GET', 'admin/groups.json'))
+
+    def testSlowestApplicableBucketWins(self):
+        limiter = ratelimit.RateLimiter(
+            rate=100,
+            method_rates={'put': (1, 1)},
+            endpoint_rates={'admin/groups/{id}/members.json': (0.5, 1)},
+            clock=self.clock)
+
+        limiter.reserve('PUT', 'admin/groups/{id}/members.json')
+        self.assertEqual(2.0, limiter.reserve('PUT', 'admin/groups/{id}/members.json'))
+        self.assertEqual(0, limiter.reserve('GET', 'admin/groups.json'))
+
+    def testPauseDelaysEveryRequest(self):
+        limiter = ratelimit.RateLimiter(clock=self.clock)
+        limiter.pause(30)
+        self.assertEqual(30, limiter.reserve('GET', 'site.json'))
+
+        self.clock.now += 30
+        self.assertEqual(0, limiter.reserve('GET', 'site.json'))
+
+
+class ParseRetryAfterTestCase(unittest.TestCase):
+    def testSeconds(self):
+        self.assertEqual(12, ratelimit.parseRetryAfter('12', default=1))
+
+    def testHttpDate(self):
+        self.assertEqual(
+            60, ratelimit.parseRetryAfter('Wed, 21 Oct 2015 07:29:00 GMT', default=1,
+                                          clock=lambda: 1445412480))
+
+    def testMissingOrInvalid(self):
+        self.assertEqual(1, ratelimit.parseRetryAfter(None, default=1))
+        self.assertEqual(1, ratelimit.parseRetryAfter('soon', default=1))
+
+
+class EndpointTemplateTestCase(unittest.TestCase):
+    def testKnownEndpoints(self):
+        self.assertEqual('admin/groups/{id}/members.json',
+                         endpoints.endpointTemplate('admin/groups/32/members.json'))
+        self.assertEqual('admin/users/{user}.json', endpoints.endpointTemplate('admin/users/peyton18.json'))
+        self.assertEqual('admin/users/list/active.json',
+                         endpoints.endpointTemplate('admin/users/list/active.json'))
+        self.assertEqual('groups/{name}/members.json',
+                         endpoints.endpointTemplate('groups/quarterbacks/members.json'))
+        self.assertEqual('c/{parent_id}/{id}.json', endpoints.endpointTemplate('c/23/17.json'))
+        self.assertEqual('t/{id}/last.json', endpoints.endpointTemplate('t/13/last.json'))
+
+    def testUnknownEndpointsHaveIdsReplaced(self):
+        self.assertEqual('posts/{id}.json', endpoints.endpointTemplate('posts/881.json'))
+        self.assertEqual('site.json', endpoints.endpointTemplate('site.json'))
@@ -0,0 +1,32 @@
+import unittest
+
+from gae_discourse_client import retry
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.policy = retry.RetryPolicy(
+            max_attempts=3, base_delay=1, max_delay=3, budget=10, random=lambda: 1.0)
+
+    def testRetriesIdempotentMethodsOnServerErrors(self):
+        self.assertEqual(1, self.policy.retryDelay('GET', 1, 0, status_code=502))
+        self.assertEqual(2, self.policy.retryDelay('DELETE', 2, 0, status_code=503))
+
+    def testDoesNotRetryOtherFailures(self):
+        self.assertIsNone(self.policy.retryDelay('POST', 1, 0, status_code=502))
+        self.assertIsNone(self.policy.retryDelay('GET', 1, 0, status_code=404))
+        self.assertIsNone(self.policy.retryDelay('GET', 1, 0, exception=ValueError()))
+
+    def testRetriesConfiguredExceptions(self):
+        policy = retry.RetryPolicy(retry_exceptions=(IOError,), random=lambda: 1.0)
+        self.assertEqual(0.1, policy.retryDelay('GET', 1, 0, exception=IOError()))
+
+    def testStopsAfterMaxAttempts(self):
+        self.assertIsNone(self.policy.retryDelay('GET', 3, 0, status_code=502))
+
+    def testDelayIsCappedAndJittered(self):
+        policy = retry.RetryPolicy(max_attempts=10, base_delay=1, max_delay=3, random=lambda: 0.5)
+        self.assertEqual(1.5, policy.retryDelay('GET', 5, 0, status_code=502))
+
+    def testStopsWhenBudgetIsSpent(self):
+        self.assertIsNone(self.policy.retryDelay('GET', 2, 8.5, status_code=502))
@@ -0,0 +1,116 @@
+from google.appengine.ext import testbed
+
+from gae_discourse_client import groups
+from gae_discourse_client import tasks
+from gae_discourse_client import users
+import base
+
+
+class TasksTestCase(base.FakeDiscourseTestCase):
+    fake_options = {'num_users': 20, 'num_groups': 2, 'members_per_group': 0,
+                    'num_categories': 0, 'num_topics': 0}
+
+    def setUp(self):
+        super(TasksTestCase, self).setUp()
+        self.taskqueue_stub = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        self.user_client = users.UserClient(self.api_client)
+        self.group_client = groups.GroupClient(self.api_client, self.user_client)
+
+        self.writer = tasks.TaskWriter(clock=lambda: 1000)
+        self.handler = tasks.DrainHandler(self.group_client, self.user_client, writer=self.writer)
+
+    def testRetriedRequestIsOnlyRecordedOnce(self):
+        self.assertTrue(self.writer.addUserByEmail('user1@example.com', 'group0', request_id='r1'))
+        self.assertFalse(self.writer.addUserByEmail('user1@example.com', 'group0', request_id='r1'))
+        self.assertTrue(self.writer.addUserByEmail('user1@example.com', 'group0'))
+        self.assertTrue(self.writer.addUserByEmail('user1@example.com', 'group0'))
+
+    def testRecordingSchedulesASingleDrain(self):
+        self.writer.addUserByUsername('user1', 'group0')
+        self.writer.addUserByUsername('user2', 'group0')
+
+        drains = self.taskqueue_stub.get_filtered_tasks(queue_names='default')
+        self.assertEqual(1, len(drains))
+        self.assertEqual(tasks.DRAIN_URL, drains[0].url)
+
+    def testDrainSendsOneMembersRequestPerGroup(self):
+        for i in xrange(5):
+            self.writer.addUserByEmail('user%d@example.com' % i, 'group0')
+        self.writer.addUserByUsername('user9', 'group1')
+        del self.fake.requests[:]
+
+        self.assertEqual(6, self.handler.drain())
+
+        member_requests = [path for method, path in self.fake.requests
+                           if method == 'PUT' and path.endswith('/members.json')]
+        self.assertEqual(2, len(member_requests))
+        self.assertEqual(set('user%d' % i for i in xrange(5)), self.members('group0'))
+        self.assertEqual(set(['user9']), self.members('group1'))
+        self.assertEqual(0, self.handler.drain())
+
+    def testLastMutationOfAUserInAGroupWins(self):
+        self.writer.addUserByUsername('user1', 'group0')
+        self.writer.removeUserByUsername('user1', 'group0')
+        self.writer.removeUserByUsername('user2', 'group0')
+        self.writer.addUserByUsername('user2', 'group0')
+
+        self.assertEqual(4, self.handler.drain())
+        self.assertEqual(set(['user2']), self.members('group0'))
+        self.assertEqual(1, len([path for method, path in self.fake.requests
+                                 if method == 'DELETE']))
+
+    def testRepeatedMutationsAreAllRecorded(self):
+        self.writer.addUserByUsername('user1', 'group0')
+        self.writer.removeUserByUsername('user1', 'group0')
+        self.writer.addUserByUsername('user1', 'group0')
+
+        self.assertEqual(3, self.handler.drain())
+        self.assertEqual(set(['user1']), self.members('group0'))
+
+    def testMutationsAreAppliedInTheOrderTheyWereRecorded(self):
+        mutations = [
+            {'op': 'add', 'params': {'username': 'user1', 'group_name': 'group0'},
+             'sequence': [1001, 0]},
+            {'op': 'remove', 'params': {'username': 'user1', 'group_name': 'group0'},
+             'sequence': [1000, 1]},
+        ]
+
+        self.handler.applyBatch(mutations).get_result()
+        self.assertEqual(set(['user1']), self.members('group0'))
+
+    def testRetriedMutationDoesNotUndoANewerOne(self):
+        remove = {'op': 'remove', 'params': {'username': 'user1', 'group_name': 'group0'},
+                  'sequence': [1001, 0]}
+        add = {'op': 'add', 'params': {'username': 'user1', 'group_name': 'group0'},
+               'sequence': [1000, 0]}
+
+        self.handler.applyBatch([remove]).get_result()
+        outcomes = self.handler.applyBatch([add]).get_result()
+
+        self.assertEqual([{'success': True, 'superseded': True}], outcomes)
+        self.assertEqual(set(), self.members('group0'))
+
+    def testCreatedUserCanBeAddedInTheSameBatch(self):
+        self.writer.createUser('Peyton Manning', 'peyton18@example.com', 'secret', 'peyton18')
+        self.writer.addUserByEmail('peyton18@example.com', 'group0')
+
+        self.assertEqual(2, self.handler.drain())
+        self.assertIn('peyton18', self.fake.users)
+        self.assertEqual(set(['peyton18']), self.members('group0'))
+
+    def testFailedMutationsAreGivenUpAfterMaxAttempts(self):
+        handler = tasks.DrainHandler(self.group_client, self.user_client, lease_seconds=0,
+                                     max_attempts=2, writer=self.writer)
+        self.writer.addUserByEmail('nobody@example.com', 'group0')
+
+        self.assertEqual(0, handler.drain())
+        self.assertEqual([], tasks.taskqueue.Queue(tasks.PULL_QUEUE).lease_tasks(60, 10))
+
+    def testFailedMutationsAreRetriedOnceTheirLeaseExpires(self):
+        self.writer.addUserByEmail('nobody@example.com', 'group0')
+        self.taskqueue_stub.FlushQueue('default')
+
+        self.assertEqual(0, self.handler.drain())
+        drains = self.taskqueue_stub.get_filtered_tasks(queue_names='default')
+        self.assertEqual(1, len(drains))
+        self.assertEqual('%s-drain-%d' % (tasks.PULL_QUEUE, (1000 + 300) // 5), drains[0].name)
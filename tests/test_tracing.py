@@ -0,0 +1,87 @@
+import json
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import urlfetch_stub
+
+from gae_discourse_client import discourse_client
+from gae_discourse_client import tracing
+import base
+
+
+class DiscourseTracingUnitTestCase(base.TestCase):
+    def setUp(self):
+        super(DiscourseTracingUnitTestCase, self).setUp()
+        self.credentials = {'api_key': 'super-secret-key', 'api_username': 'system'}
+
+        apiproxy_stub_map.apiproxy = apiproxy_stub_map.APIProxyStubMap()
+        apiproxy_stub_map.apiproxy.RegisterStub(
+            'urlfetch', urlfetch_stub.URLFetchServiceStub())
+
+        discourse_client.initClient(
+            'http://rants.example.com/',
+            self.credentials['api_key'],
+            self.credentials['api_username']
+        )
+
+    def testTraceRecordsCallTree(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'email': 'peyton18@example.com', 'id': 18, 'username': 'peyton18'}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json?user_id=18', method='DELETE', payload='', response=response)
+
+        with tracing.Tracer() as tracer:
+            discourse_client.groups.removeUserByEmail('peyton18@example.com', 'quarterbacks').get_result()
+
+        roots = json.loads(tracer.toJson())
+        self.assertEqual(1, len(roots))
+        self.assertEqual('GroupClient.removeUserByEmail', roots[0]['name'])
+
+        children = roots[0]['children']
+        self.assertEqual(['UserClient.getByEmail', 'GroupClient.removeUserById'],
+                         [child['name'] for child in children])
+        self.assertTrue(all(child['mode'] == 'serial' for child in children))
+        self.assertEqual('GET admin/users/list/active.json', children[0]['children'][0]['name'])
+        self.assertEqual('http', children[0]['children'][0]['kind'])
+        self.assertEqual('DELETE admin/groups/{id}/members.json', children[1]['children'][-1]['name'])
+
+    def testNothingIsRecordedWithoutTracer(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        tracer = tracing.Tracer()
+        discourse_client.groups.getByName('quarterbacks').get_result()
+        self.assertEqual([], tracer.roots)
+
+    def testRequestsOfLaterBoundedMapRoundsStayUnderTheirCaller(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/groups.json', method='GET', payload='', response=response)
+
+        for username in ('peyton18', 'tom12', 'drew9'):
+            response = self.mock()
+            response.status_code = 200
+            response.content = json.dumps({'success': 'OK'})
+            self._expectUrlfetch(url='http://rants.example.com/admin/groups/32/members.json', method='PUT', payload='usernames=%s' % username, response=response)
+
+        with tracing.Tracer() as tracer:
+            discourse_client.groups.addUsersByUsername(
+                ['peyton18', 'tom12', 'drew9'], 'quarterbacks', chunk_size=1, concurrency=1
+            ).get_result()
+
+        roots = tracer.export()
+        self.assertEqual(['GroupClient.addUsersByUsername'], [root['name'] for root in roots])
+        self.assertEqual(3, len([child for child in roots[0]['children']
+                                 if child['name'] == 'PUT admin/groups/{id}/members.json']))
@@ -0,0 +1,78 @@
+import BaseHTTPServer
+import httplib
+import json
+import threading
+import unittest
+
+from gae_discourse_client import discourse_client
+from gae_discourse_client import transport
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        body = json.dumps([{'name': 'quarterbacks', 'id': 32}])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # Drops the connection without answering, as a server might after acting on the request.
+        self.server.posts += 1
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledHTTPTransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.connections = 0
+        self.server.posts = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.transport = transport.PooledHTTPTransport(pool_size=2)
+        self.client = discourse_client.DiscourseAPIClient(
+            'http://127.0.0.1:%d/' % self.server.server_port, 'super-secret-key', 'system',
+            transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testRequestsReuseConnection(self):
+        for _ in range(3):
+            groups = self.client.getRequest('admin/groups.json').get_result()
+            self.assertEqual(32, groups[0]['id'])
+
+        self.assertEqual(1, self.server.connections)
+
+    def testFailedPostIsNotResentOnReusedConnection(self):
+        self.client.getRequest('admin/groups.json').get_result()
+
+        with self.assertRaises(httplib.HTTPException):
+            self.client.postRequest('admin/groups', payload={'group[name]': 'kickers'}).get_result()
+        self.assertEqual(1, self.server.posts)
+
+    def testSubClientsRunOnPooledTransport(self):
+        group_client = discourse_client.groups_module.GroupClient(self.client, None)
+        group = group_client.getByName('quarterbacks').get_result()
+        self.assertEqual(32, group['id'])
+
+    def testResponseHeadersAreCaseInsensitive(self):
+        response = self.transport.fetch(
+            'http://127.0.0.1:%d/site.json' % self.server.server_port, '', 'GET', {}).get_result()
+        self.assertEqual('application/json', response.headers.get('content-type'))
+        self.assertEqual('application/json', response.headers['CONTENT-TYPE'])
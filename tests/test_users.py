@@ -1,10 +1,12 @@
 import json
+from urllib import urlencode
 
 from google.appengine.api import apiproxy_stub_map
 from google.appengine.api import urlfetch_stub
 from google.appengine.ext import ndb
 
 from gae_discourse_client import discourse_client
+from gae_discourse_client import users
 import base
 
 
@@ -53,7 +55,7 @@ class DiscourseUserUnitTestCase(base.TestCase):
     def testDeleteUser(self):
         response = self.mock()
         response.status_code = 200
-        response.content = json.dumps([{'email': 'peyton18@example.com', 'id': 18}])
+        response.content = json.dumps([{'email': 'peyton18@example.com', 'id': 18, 'username': 'peyton18'}])
         self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response)
 
         response = self.mock()
@@ -62,3 +64,95 @@ class DiscourseUserUnitTestCase(base.TestCase):
         self._expectUrlfetch(url='http://rants.example.com/admin/users/18.json', method='DELETE', payload='', response=response)
 
         discourse_client.users.delete('peyton18@example.com').get_result()
+
+    def testGetByEmailIsCached(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'email': 'Peyton18@example.com', 'id': 18, 'username': 'peyton18'}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response).once()
+
+        user = discourse_client.users.getByEmail('peyton18@example.com', identity_only=True).get_result()
+        self.assertEqual(18, user['id'])
+
+        user = discourse_client.users.getByEmail('PEYTON18@example.com', identity_only=True).get_result()
+        self.assertEqual('peyton18', user['username'])
+
+    def testGetByEmailFetchesFullRecordOfCachedUser(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'email': 'peyton18@example.com', 'id': 18, 'username': 'peyton18'}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'email': 'peyton18@example.com', 'id': 18, 'username': 'peyton18', 'name': 'Peyton Manning'})
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/18.json', method='GET', payload='', response=response).once()
+
+        discourse_client.users.getByEmail('peyton18@example.com').get_result()
+        user = discourse_client.users.getByEmail('peyton18@example.com').get_result()
+        self.assertEqual('Peyton Manning', user['name'])
+
+    def testGetByEmailCachesMisses(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([])
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response).once()
+
+        self.assertIsNone(discourse_client.users.getByEmail('peyton18@example.com').get_result())
+        self.assertIsNone(discourse_client.users.getByEmail('peyton18@example.com').get_result())
+
+    def testCreateUserInvalidatesCachedMiss(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([])
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True})
+        self._expectUrlfetch(url='http://rants.example.com/users/', method='POST', payload='', response=response)
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps([{'email': 'peyton18@example.com', 'id': 18, 'username': 'peyton18'}])
+        self._expectUrlfetch(url='http://rants.example.com/admin/users/list/active.json?filter=peyton18%40example.com&show_emails=true', method='GET', payload='', response=response)
+
+        self.assertIsNone(discourse_client.users.getByEmail('peyton18@example.com').get_result())
+        discourse_client.users.create(
+            name='Peyton Manning',
+            email='peyton18@example.com',
+            password='omahaomaha',
+            username='peyton18'
+        ).get_result()
+        self.assertEqual(18, discourse_client.users.getByEmail('peyton18@example.com').get_result()['id'])
+
+    def testCreateManySkipsExistingUsers(self):
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': True, 'user_id': 10})
+        self._expectUrlfetch(url='http://rants.example.com/users/', method='POST', payload=urlencode({'username': 'eli10'}), response=response).once()
+
+        response = self.mock()
+        response.status_code = 200
+        response.content = json.dumps({'success': False, 'message': 'Username is invalid'})
+        self._expectUrlfetch(url='http://rants.example.com/users/', method='POST', payload=urlencode({'username': 'tom 12'}), response=response).once()
+
+        results = discourse_client.users.createMany([
+            {'name': 'Peyton Manning', 'email': 'peyton18@example.com', 'password': 'omahaomaha', 'username': 'peyton18'},
+            {'name': 'Eli Manning', 'email': 'eli10@example.com', 'password': 'bigblue', 'username': 'eli10'},
+            {'name': 'Eli Manning', 'email': 'ELI10@example.com', 'password': 'bigblue', 'username': 'eli10'},
+            {'name': 'Eli Manning', 'email': 'eli.manning@example.com', 'password': 'bigblue', 'username': 'Eli10'},
+            {'name': 'Tom Brady', 'email': 'tom12@example.com', 'password': 'deflated', 'username': 'tom 12'}
+        ], concurrency=1, existing={'peyton18@example.com', 'peyton18'}).get_result()
+
+        self.assertEqual({'success': True, 'skipped': True}, results['peyton18@example.com'])
+        self.assertEqual({'success': True, 'result': {'success': True, 'user_id': 10}}, results['eli10@example.com'])
+        self.assertEqual({'success': False, 'error': 'Username is invalid'}, results['tom12@example.com'])
+        self.assertFalse(results['eli.manning@example.com']['success'])
+        self.assertEqual(4, len(results))
+
+    def testCreateManySkippingExistingWithoutIndexRaisesError(self):
+        with self.assertRaises(users.Error):
+            discourse_client.users.createMany([
+                {'name': 'Eli Manning', 'email': 'eli10@example.com', 'password': 'bigblue', 'username': 'eli10'}
+            ], skip_existing=True).get_result()
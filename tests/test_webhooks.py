@@ -0,0 +1,149 @@
+import os
+import StringIO
+import unittest
+from wsgiref import util
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from gae_discourse_client import cache
+from gae_discourse_client import categories
+from gae_discourse_client import discourse_client
+from gae_discourse_client import emailindex
+from gae_discourse_client import groups
+from gae_discourse_client import users
+from gae_discourse_client import webhooks
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), 'webhook_payloads')
+
+
+class WebhookHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.validator_cache = cache.LRUCache()
+        self.api_client = discourse_client.DiscourseAPIClient(
+            'http://rants.example.com/', 'super-secret-key', 'system',
+            validator_cache=self.validator_cache)
+        self.email_index = emailindex.EmailIndex(num_shards=4)
+        self.users = users.UserClient(self.api_client, email_index=self.email_index)
+        self.groups = groups.GroupClient(self.api_client, self.users)
+        self.categories = categories.CategoryClient(self.api_client)
+        self.handler = webhooks.WebhookHandler(
+            'webhook-secret', api_client=self.api_client, users=self.users, groups=self.groups,
+            categories=self.categories)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def post(self, payload_name, event_type, event, secret='webhook-secret', method='POST'):
+        with open(os.path.join(PAYLOADS, payload_name + '.json')) as f:
+            body = f.read()
+
+        environ = {
+            'REQUEST_METHOD': method,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': StringIO.StringIO(body),
+            'HTTP_X_DISCOURSE_EVENT_TYPE': event_type,
+            'HTTP_X_DISCOURSE_EVENT': event,
+            'HTTP_X_DISCOURSE_EVENT_SIGNATURE': webhooks.computeSignature(secret, body)
+        }
+        util.setup_testing_defaults(environ)
+
+        statuses = []
+        self.handler(environ, lambda status, headers: statuses.append(status))
+        return statuses[0]
+
+    def cacheResponse(self, req_string):
+        self.validator_cache.set('http://rants.example.com/' + req_string, ('"etag"', None, {}))
+
+    def cachedPaths(self):
+        return sorted(url.split('http://rants.example.com/')[1] for url in self.validator_cache.keys())
+
+    def testRejectsInvalidSignature(self):
+        self.cacheResponse('admin/groups.json')
+        self.assertEqual('403 Forbidden', self.post('group_updated', 'group', 'group_updated', secret='wrong'))
+        self.assertEqual(['admin/groups.json'], self.cachedPaths())
+
+    def testRejectsOtherMethods(self):
+        self.assertEqual('405 Method Not Allowed', self.post('group_updated', 'group', 'group_updated', method='GET'))
+
+    def testSignatureMatchesDiscourse(self):
+        self.assertEqual(
+            'sha256=38d7951cd02eab1b54d0e0e4257c279d640620961e1c438188bc252f3c6732db',
+            webhooks.computeSignature('webhook-secret', '{}'))
+        self.assertTrue(webhooks.verifySignature(
+            'webhook-secret', '{}', webhooks.computeSignature('webhook-secret', '{}')))
+        self.assertFalse(webhooks.verifySignature('webhook-secret', '{}', None))
+
+    def testUserDestroyedDropsEmailMappings(self):
+        self.email_index.update(
+            [{'id': 18, 'username': 'peyton18', 'email': 'peyton18@example.com'}], 18).get_result()
+        self.users._email_cache.set(
+            'peyton.manning@example.com', {'id': 18, 'username': 'peyton18', 'email': 'peyton.manning@example.com'})
+        self.cacheResponse('admin/users/list/active.json?filter=peyton18%40example.com')
+        self.cacheResponse('admin/users/peyton18.json')
+
+        self.assertEqual('200 OK', self.post('user_destroyed', 'user', 'user_destroyed'))
+        self.assertIsNone(self.email_index.lookup('peyton18@example.com').get_result())
+        self.assertEqual([], self.users._email_cache.keys())
+        self.assertEqual([], self.cachedPaths())
+
+    def testUserUpdatedMovesChangedEmail(self):
+        self.email_index.update(
+            [{'id': 18, 'username': 'peyton18', 'email': 'peyton18@example.com'}], 18).get_result()
+
+        self.assertEqual('200 OK', self.post('user_updated', 'user', 'user_updated'))
+        self.assertIsNone(self.email_index.lookup('peyton18@example.com').get_result())
+        self.assertEqual(18, self.email_index.lookup('peyton.manning@example.com').get_result()['id'])
+
+    def testUserCreatedAddsToIndex(self):
+        self.email_index.update(
+            [{'id': 18, 'username': 'peyton18', 'email': 'peyton18@example.com'}], 18).get_result()
+
+        self.assertEqual('200 OK', self.post('user_created', 'user', 'user_created'))
+        self.assertEqual('eli10', self.email_index.lookup('eli10@example.com').get_result()['username'])
+        self.assertEqual(18, self.email_index.getMaxUserId().get_result())
+
+    def testGroupUpdatedPatchesIndex(self):
+        self.groups._index.load([{'id': 32, 'name': 'qbs'}])
+        self.cacheResponse('admin/groups.json')
+        self.cacheResponse('groups/quarterbacks/members.json?limit=50&offset=0')
+        self.cacheResponse('site.json')
+
+        self.assertEqual('200 OK', self.post('group_updated', 'group', 'group_updated'))
+        self.assertEqual('QB', self.groups.getByName('quarterbacks').get_result()['title'])
+        self.assertIsNone(self.groups._index.getByName('qbs'))
+        self.assertEqual(['site.json'], self.cachedPaths())
+
+    def testGroupDestroyedRemovesFromIndex(self):
+        self.groups._index.load([{'id': 32, 'name': 'quarterbacks'}, {'id': 33, 'name': 'receivers'}])
+        self.assertEqual('200 OK', self.post('group_destroyed', 'group', 'group_destroyed'))
+        self.assertIsNone(self.groups._index.getById(32))
+        self.assertEqual(33, self.groups.getByName('receivers').get_result()['id'])
+
+    def testCategoryCreatedPatchesTree(self):
+        self.categories._tree.load([{'id': 55, 'name': 'Football Players', 'slug': 'football-players'}])
+        self.cacheResponse('site.json')
+        self.cacheResponse('c/55.json?page=0')
+
+        self.assertEqual('200 OK', self.post('category_created', 'category', 'category_created'))
+        category = self.categories.getBySlug('linebackers', 'football-players').get_result()
+        self.assertEqual(61, category['id'])
+        self.assertEqual(['c/55.json?page=0'], self.cachedPaths())
+
+    def testTopicEditedInvalidatesTopicAndListings(self):
+        for req_string in ('t/1024.json', 't/1024/last.json', 't/1025.json', 'latest.json?page=0',
+                           'c/60.json?page=0', 'c/55/60.json?page=0'):
+            self.cacheResponse(req_string)
+
+        self.assertEqual('200 OK', self.post('topic_edited', 'topic', 'topic_edited'))
+        self.assertEqual(['t/1025.json'], self.cachedPaths())
+
+    def testUnknownEventsAreIgnored(self):
+        self.assertFalse(self.handler.handleEvent('post', 'post_created', {'post': {'id': 1}}).get_result())
+        self.assertTrue(self.handler.handleEvent('topic', 'topic_created', {'topic': {'id': 1}}).get_result())